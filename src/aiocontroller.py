@@ -0,0 +1,293 @@
+"""
+asyncio front end of StreamController, for driving many sessions from one event loop
+
+- AsyncStreamController wraps a StreamController (which keeps all session state and builds every
+  script / file set) and runs its remote phases as coroutines: Compute futures are awaited on the
+  loop (util.arun_remote / acall_remote), so a hundred sessions do not need a hundred threads
+- Phases have the same names and result dicts as the blocking ones; independent remote calls of
+  one phase run concurrently via asyncio.gather
+- Timeouts and cancellation come from asyncio: wrap any phase in asyncio.wait_for / asyncio.timeout;
+  a cancelled phase cancels its pending Compute tasks and raises CancelledError
+- Only construction (endpoint name resolution and probes) still blocks; create() runs it in a thread
+
+    async def session(args):
+        actl = await AsyncStreamController.create(args)
+        try:
+            return await asyncio.wait_for(actl.bring_up(), timeout=300)
+        except asyncio.TimeoutError:
+            await actl.cleanup()
+            raise
+        finally:
+            actl.close()
+
+    results = await asyncio.gather(*(session(a) for a in per_beamline_args))
+"""
+from __future__ import annotations
+import argparse, asyncio, logging
+from typing import Awaitable, Dict
+
+import launcher as setup_mod
+import remote_fns
+from controller import StreamController
+from util import arun_remote, acall_remote, astage_remote_files, key_gen_script, parse_key_gen
+from scheduler import step_ok
+from tracing import traced
+
+
+async def gather_results(tasks: Dict[str, Awaitable]) -> Dict[str, dict]:
+    """
+    Await independent coroutines concurrently and return {name: result} (asyncio twin of run_parallel)
+    Exceptions become {'ok': False, 'error': ...}; cancellation propagates
+    """
+    names = list(tasks)
+    done = await asyncio.gather(*tasks.values(), return_exceptions=True)
+    out = {}
+    for name, r in zip(names, done):
+        if isinstance(r, BaseException) and not isinstance(r, Exception):
+            raise r
+        if isinstance(r, Exception):
+            logging.error("%s failed: %s", name, r)
+            r = {"ok": False, "error": f"{type(r).__name__}: {r}"}
+        out[name] = r
+    return out
+
+
+class AsyncStreamController:
+    """Coroutine versions of the StreamController phases; see the module docstring"""
+
+    def __init__(self, ctl: StreamController):
+        self.ctl = ctl
+
+    @classmethod
+    async def create(cls, args: argparse.Namespace, *, default_stream: bool = True) -> "AsyncStreamController":
+        """Build the underlying StreamController (endpoint resolution blocks) in a worker thread"""
+        return cls(await asyncio.to_thread(StreamController, args, default_stream=default_stream))
+
+    # Session state lives on the wrapped controller
+    @property
+    def args(self) -> argparse.Namespace:
+        return self.ctl.args
+
+    @property
+    def session_id(self) -> str:
+        return self.ctl.session_id
+
+    @property
+    def sess_dir(self) -> str:
+        return self.ctl.sess_dir
+
+    @property
+    def streams(self) -> Dict[str, dict]:
+        return self.ctl.streams
+
+    def add_stream(self, name: str, **kw) -> dict:
+        return self.ctl.add_stream(name, **kw)
+
+    def list_streams(self) -> list[dict]:
+        return self.ctl.list_streams()
+
+    def close(self) -> None:
+        self.ctl.close()
+
+    # ------------------------------- Bring-up -------------------------------
+
+    @traced()
+    async def prepare_gateways(self, *, preclean: bool = False, deep_clean: bool = True) -> Dict[str, Dict[str, dict]]:
+        """One fused submission per gateway (cleanups → marker → keygen), both gateways at once"""
+        batches = self.ctl._prepare_batches(preclean=preclean, deep_clean=deep_clean)
+
+        async def prepare(b, idx: Dict[str, int]) -> Dict[str, dict]:
+            res = await b.arun()
+            return {phase: res[i] for phase, i in idx.items()}
+
+        per_gw = await gather_results({role: prepare(b, idx) for role, (b, idx) in batches.items()})
+        return self.ctl._prepare_results(per_gw)
+
+    @traced()
+    async def allocate_ports(self, stream: str | None = None) -> Dict[str, dict]:
+        """Reserve consumer-side ports for the streams that have none yet (see StreamController.allocate_ports)"""
+        streams = self.ctl._ports_to_allocate(stream)
+        if not streams:
+            return {}
+        args, kwargs = self.ctl._reserve_call(streams)
+        return self.ctl._apply_allocation(streams, await acall_remote(*args, **kwargs))
+
+    @traced()
+    async def setup_crypto(self) -> Dict[str, dict]:
+        """Generate (or reuse) both gateway certs concurrently, then cross-distribute them"""
+        gen = await gather_results({
+            role: self._key_gen(role, ep) for role, ep in (("p2cs", self.args.p2cs_ep), ("c2cs", self.args.c2cs_ep))
+        })
+        if not self.ctl._keygen_done(gen):
+            return gen
+        return await self.distribute_certs()
+
+    async def _key_gen(self, role: str, ep: str) -> dict:
+        script = key_gen_script(self.args, role, sess_dir=self.sess_dir)
+        return parse_key_gen(await arun_remote(self.ctl._eid(ep), f"KEYGEN:{role}", script))
+
+    @traced()
+    async def distribute_certs(self, *, include_psk: bool = False) -> Dict[str, dict]:
+        """Copy each gateway's cert to the other's trust path (and the PSK with include_psk)"""
+        plan = self.ctl._dist_plan(include_psk)
+        if "error" in plan:
+            return {"p2cs": plan, "c2cs": plan}
+        dist = await gather_results({
+            role: self._stage_files(eid, f"CRT-DIST:{role}", fs) for role, (eid, fs) in plan.items() if fs
+        })
+        return self.ctl._dist_done(plan, dist)
+
+    async def _stage_files(self, eid: str, label: str, files: list[dict]) -> dict:
+        return self.ctl._staged_on(eid, await astage_remote_files(eid, label, files, **self.ctl._stage_opts(eid)))
+
+    @traced()
+    async def launch_p2cs(self) -> dict:
+        return self.ctl._launched("p2cs", await setup_mod.ap2cs(self.args, self.ctl._eid(self.args.p2cs_ep),
+                                                                 sess_dir=self.sess_dir))
+
+    @traced()
+    async def launch_c2cs(self) -> dict:
+        return self.ctl._launched("c2cs", await setup_mod.ac2cs(self.args, self.ctl._eid(self.args.c2cs_ep),
+                                                                 sess_dir=self.sess_dir))
+
+    @traced()
+    async def bring_up(self, *, preclean: bool = False, deep_clean: bool = True) -> Dict[str, dict]:
+        """
+        The whole session in the same dependency order as main.session_steps:
+          prepare → ports + crypto → launch p2cs + c2cs → connect every stream
+        Stops at the first failing phase; returns {phase: result} for the phases that ran
+        """
+        out: Dict[str, dict] = {}
+        out["prepare"] = await self.prepare_gateways(preclean=preclean, deep_clean=deep_clean)
+        if not step_ok(out["prepare"]):
+            return out
+        pc = await gather_results({"ports": self.allocate_ports(), "crypto": self.distribute_certs(include_psk=True)})
+        out.update(pc)
+        if not (step_ok(pc["ports"]) and step_ok(pc["crypto"])):
+            return out
+        launch = await gather_results({"launch:p2cs": self.launch_p2cs(), "launch:c2cs": self.launch_c2cs()})
+        out.update(launch)
+        if not all(r.get("ok") for r in launch.values()):
+            return out
+        out["connect"] = await self.connect_all()
+        return out
+
+    # ------------------------------- Connect --------------------------------
+
+    @traced()
+    async def wait_gateway(self, side: str) -> dict:
+        """Wait until the s2cs sync port of one gateway ('p2cs' or 'c2cs') accepts connections"""
+        ep, ip = self.ctl._gateway_addr(side)
+        wp = await acall_remote(self.ctl._eid(ep), "PORT:wait", remote_fns.wait_port, ip, int(self.args.sync_port), 60,
+                                wait=70)
+        return self.ctl._gateway_waited(side, wp)
+
+    @traced()
+    async def stage_runner_certs(self) -> Dict[str, dict]:
+        """Stage the gateway certs on the runners (one submission per runner endpoint)"""
+        results, per_host = self.ctl._runner_cert_plan()
+        done = await gather_results({
+            eid: self._stage_files(eid, "CERT:stage", [f for _, f in items]) for eid, items in per_host.items()
+        })
+        return self.ctl._runner_certs_staged_done(results, per_host, done)
+
+    @traced()
+    async def run_inbound(self, stream: str | None = None) -> dict:
+        st = self.ctl._stream(stream)
+        r = await setup_mod.ainbound(st["args"], "producer", self.ctl._runner_eid("inbound"), sess_dir=self.sess_dir,
+                                     tag=st["tag"])
+        return self.ctl._inbound_done(st, r)
+
+    @traced()
+    async def run_outbound(self, stream: str | None = None) -> dict:
+        st = self.ctl._stream(stream)
+        r = await setup_mod.aoutbound(st["args"], "consumer", self.ctl._runner_eid("outbound"), stream_uid=st["uid"],
+                                      ports=st["listen_ports"], sess_dir=self.sess_dir, tag=st["tag"])
+        return self.ctl._outbound_done(st, r)
+
+    @traced()
+    async def connect(self, stream: str | None = None) -> Dict[str, dict]:
+        """
+        Connect one stream (the first one by default) with the same overlap as the blocking path:
+          wait:p2cs + stage ─> inbound ─┐
+          wait:c2cs ────────────────────┴─> outbound
+        Returns {'inbound': ..., 'outbound': ...}
+        """
+        name = self.ctl._stream(stream)["name"]
+        return (await self._connect([name]))[name]
+
+    @traced()
+    async def connect_all(self) -> Dict[str, Dict[str, dict]]:
+        """Connect every stream that is not connected yet, concurrently; returns {stream: connect result}"""
+        return await self._connect([n for n, st in self.streams.items() if not st["connected"]])
+
+    async def _connect(self, names: list[str]) -> Dict[str, Dict[str, dict]]:
+        ctl = self.ctl
+        # Shared steps run once for all streams; each one is skipped once it has succeeded for the session
+        shared = {}
+        if not ctl._gateway_ready["p2cs"]:
+            shared["wait:p2cs"] = asyncio.ensure_future(self.wait_gateway("p2cs"))
+        if not ctl._runner_certs_staged:
+            shared["stage"] = asyncio.ensure_future(self.stage_runner_certs())
+        if not ctl._gateway_ready["c2cs"]:
+            shared["wait:c2cs"] = asyncio.ensure_future(self.wait_gateway("c2cs"))
+
+        async def step(name: str, which: str):
+            """The shared result blocking `which` (failed wait, or this side's staging), else None"""
+            if name in shared:
+                r = await shared[name]
+                r = r.get(which, r) if name == "stage" else r
+                if not r.get("ok"):
+                    return r
+            return None
+
+        async def one(name: str) -> Dict[str, dict]:
+            r_in = await step("wait:p2cs", "inbound") or await step("stage", "inbound") or await self.run_inbound(name)
+            if not r_in.get("ok"):
+                return {"inbound": r_in, "outbound": {"ok": False, "skipped": True, "error": "inbound failed"}}
+            r_out = await step("wait:c2cs", "outbound") or await step("stage", "outbound") or await self.run_outbound(name)
+            return {"inbound": r_in, "outbound": r_out}
+
+        try:
+            res = await gather_results({n: one(n) for n in names})
+        finally:
+            for f in shared.values():
+                f.cancel()
+        return {n: r if "inbound" in r else {"inbound": r, "outbound": r} for n, r in res.items()}
+
+    # ------------------------------- Teardown -------------------------------
+
+    async def _teardown(self, roles: tuple, streams: list[dict], release: str | None, what: str = "") -> Dict[str, dict]:
+        """StreamController._teardown on the event loop"""
+        ctl = self.ctl
+        plan = ctl._teardown_plan(roles, streams)
+        calls = {eid: arun_remote(eid, ctl._teardown_label(e, what), ctl._teardown_script(e), wall=30, wait=30)
+                 for eid, e in plan.items()}
+        if release:
+            calls["ports"] = acall_remote(*ctl._release_call(release))
+        return ctl._torn_down(plan, await gather_results(calls))
+
+    @traced()
+    async def disconnect_stream(self, name: str) -> Dict[str, dict]:
+        """Stop one stream's s2uc process groups and release its port reservation"""
+        st = self.ctl._stream(name)
+        res = await self._teardown(("inbound", "outbound"), [st],
+                                   self.ctl._port_owner(st["name"]) if st["reserved"] else None, st["name"])
+        return self.ctl._disconnected(st, res)
+
+    @traced()
+    async def stop_gateways(self) -> Dict[str, dict]:
+        """Stop both s2cs process groups (ports confirmed free) and release the session's port reservations"""
+        res = await self._teardown(("p2cs", "c2cs"), list(self.streams.values()), self.session_id)
+        return self.ctl._gateways_stopped(res)
+
+    @traced()
+    async def cleanup(self) -> Dict[str, dict]:
+        """
+        Tear the whole session down in one concurrent round (see StreamController.cleanup)
+        Safe to await from a timeout / cancellation handler (shielded: teardown always finishes)
+        Returns {'p2cs', 'c2cs', 'inbound', 'outbound', 'ports'}
+        """
+        roles = ("p2cs", "c2cs", "inbound", "outbound")
+        res = await asyncio.shield(self._teardown(roles, list(self.streams.values()), self.session_id))
+        return self.ctl._cleaned_up(res)
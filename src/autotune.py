@@ -0,0 +1,198 @@
+"""
+Automatic parallel-connection and port-count tuning for a gateway pair
+
+Measures the path between the gateways and picks the smallest num_conn that saturates it:
+  path    (default) one iperf3 server on the c2cs gateway (--c2cs-listener), one client on the p2cs
+          gateway (bound to --p2cs-listener) with -P n parallel streams, for each n in the sweep;
+          no session is brought up, so a sweep takes roughly len(conns) x duration
+  tunnel  the real thing: a full session per n with iperf3 through the tunnel (throughput.run_one);
+          slower, but includes the per-connection proxy cost (--type)
+
+RTT comes from the senders' TCP stats (iperf3 mean_rtt). The sweep stops early once two
+consecutive points gain less than --min-gain over the best so far. The chosen num_conn is the
+smallest one reaching --saturation x the best aggregate rate; matching --inbound-src-ports /
+--outbound-dst-ports are derived from the current lists (extended with consecutive ports).
+With --save the result is stored per gateway pair in the endpoint cache; main.py --tuned uses it.
+
+Examples
+  python3 autotune.py --save
+  python3 autotune.py --mode tunnel --conns 1,2,4,8 -d 10 -- --type HAProxy
+Controller flags go after '--'
+"""
+from __future__ import annotations
+import argparse, json, logging, statistics, sys
+from typing import List, Optional
+
+import launcher
+from config import get_args
+from controller import StreamController
+from throughput import parse_iperf, connection_stats, run_one, _int_list
+from util import run_remote, configure_executor_pool, shutdown_executors, ports_for
+from tracing import span
+
+DEFAULT_CONNS = [1, 2, 4, 8, 16]
+
+
+def sweep_path(ctl: StreamController, conns: List[int], *, port: int, duration: float,
+               min_gain: float) -> List[dict]:
+    """iperf3 -P n from the p2cs gateway to the c2cs gateway for each n; returns one point per n run"""
+    args = ctl.args
+    p2cs, c2cs = ctl._eid(args.p2cs_ep), ctl._eid(args.c2cs_ep)
+    run_dir = f"{ctl.sess_dir}/tune"
+    points: List[dict] = []
+    srv = launcher.iperf_servers(args, c2cs, ports=[port], run_dir=run_dir, bind_ip=args.c2cs_listener, one_off=False)
+    if not srv.get("ok"):
+        return [{"num_conn": conns[0], "ok": False, "error": "iperf3 server failed to start on c2cs", "server": srv}]
+    try:
+        flat = 0
+        for n in conns:
+            with span("tune:path", num_conn=n):
+                r = launcher.iperf_clients(args, p2cs, ports=[port], run_dir=run_dir, duration=duration, lead=0,
+                                           opts=f"-B {args.p2cs_listener}", host=args.c2cs_listener,
+                                           reverse=False, parallel=n, label=f"TUNE:x{n}")
+            if not r.get("ok"):
+                points.append({"num_conn": n, "ok": False, "error": r.get("error")})
+                break
+            st = connection_stats(port, parse_iperf(r.get("stdout") or "")["reports"].get(port) or {"error": "no report"})
+            points.append({"num_conn": n, "ok": st["ok"], "gbps": st.get("gbps"), "retransmits": st.get("retransmits"),
+                           "rtt_ms": st.get("rtt_ms"), "error": st.get("error")})
+            logging.info("path x%d: %s", n, f"{st['gbps']:.2f} Gbps" if st["ok"] else st.get("error"))
+            if not st["ok"]:
+                break
+            best = max(p["gbps"] for p in points[:-1] if p["ok"]) if len(points) > 1 else 0.0
+            flat = flat + 1 if best and st["gbps"] < best * (1 + min_gain) else 0
+            if flat >= 2:
+                break
+    finally:
+        run_remote(c2cs, "TUNE:stop", StreamController._kill_pidfiles_script([f"{run_dir}/server-{port}.pid"]))
+    return points
+
+
+def sweep_tunnel(args: argparse.Namespace, conns: List[int], *, duration: float, min_gain: float) -> List[dict]:
+    """throughput.run_one for each n (full session per point); returns one point per n run"""
+    points: List[dict] = []
+    flat = 0
+    for n in conns:
+        r = run_one(args, args.type, n, duration=duration, lead=1.0, iperf_opts="")
+        rtts = [c.get("rtt_ms") for c in r.get("per_conn") or [] if c.get("rtt_ms")]
+        points.append({"num_conn": n, "ok": bool(r.get("ok")), "gbps": r.get("gbps"), "retransmits": r.get("retransmits"),
+                       "rtt_ms": statistics.fmean(rtts) if rtts else None, "error": r.get("error")})
+        logging.info("tunnel x%d: %s", n, f"{r['gbps']:.2f} Gbps" if r.get("ok") else r.get("error"))
+        if not r.get("ok"):
+            break
+        best = max(p["gbps"] for p in points[:-1] if p["ok"]) if len(points) > 1 else 0.0
+        flat = flat + 1 if best and r["gbps"] < best * (1 + min_gain) else 0
+        if flat >= 2:
+            break
+    return points
+
+
+def choose(points: List[dict], saturation: float) -> Optional[dict]:
+    """Smallest num_conn whose rate reaches saturation x the best measured rate (None if nothing succeeded)"""
+    good = [p for p in points if p["ok"] and p.get("gbps")]
+    if not good:
+        return None
+    best = max(good, key=lambda p: p["gbps"])
+    pick = min((p for p in good if p["gbps"] >= saturation * best["gbps"]), key=lambda p: p["num_conn"])
+    rtts = [p["rtt_ms"] for p in good if p.get("rtt_ms")]
+    rtt = min(rtts) if rtts else None
+    return {
+        "num_conn": pick["num_conn"],
+        "gbps": pick["gbps"],
+        "best_gbps": best["gbps"],
+        "rtt_ms": rtt,
+        # Bytes in flight needed to fill the path at the best rate
+        "bdp_mb": best["gbps"] * 1e9 * rtt / 1000 / 8 / 1e6 if rtt else None,
+    }
+
+
+def format_report(points: List[dict], result: Optional[dict]) -> str:
+    lines = [f"  {'conn':>4} {'Gbps':>8} {'retr':>7} {'rtt ms':>7}"]
+    for p in points:
+        if not p["ok"]:
+            lines.append(f"  {p['num_conn']:>4} FAILED: {p.get('error')}")
+            continue
+        retr = f"{p['retransmits']:>7d}" if p.get("retransmits") is not None else f"{'-':>7}"
+        rtt = f"{p['rtt_ms']:>7.2f}" if p.get("rtt_ms") else f"{'-':>7}"
+        lines.append(f"  {p['num_conn']:>4} {p['gbps']:>8.2f} {retr} {rtt}")
+    if result:
+        bdp = f", BDP {result['bdp_mb']:.1f} MB" if result.get("bdp_mb") else ""
+        lines.append(f"Chosen num_conn={result['num_conn']}: {result['gbps']:.2f} of {result['best_gbps']:.2f} Gbps best"
+                     + (f", RTT {result['rtt_ms']:.2f} ms" if result.get("rtt_ms") else "") + bdp)
+        lines.append("  --num-conn {} --inbound-src-ports {} --outbound-dst-ports {}".format(
+            result["num_conn"], ",".join(map(str, result["inbound_src_ports"])),
+            ",".join(map(str, result["outbound_dst_ports"]))))
+    else:
+        lines.append("No successful measurement; nothing chosen")
+    return "\n".join(lines)
+
+
+def main(argv: List[str] | None = None) -> int:
+    argv = list(sys.argv[1:] if argv is None else argv)
+    extra: List[str] = []
+    if "--" in argv:
+        i = argv.index("--")
+        argv, extra = argv[:i], argv[i + 1:]
+    p = argparse.ArgumentParser(description="Tune num_conn and port lists for a gateway pair")
+    p.add_argument("--mode", choices=("path", "tunnel"), default="path", help="Measure the raw gateway path or through the tunnel")
+    p.add_argument("--conns", type=_int_list, default=DEFAULT_CONNS, help="Connection counts to sweep, ascending")
+    p.add_argument("-d", "--duration", type=float, default=5.0, help="Seconds of traffic per point")
+    p.add_argument("--port", type=int, default=5201, help="iperf3 port on the c2cs gateway (path mode)")
+    p.add_argument("--saturation", type=float, default=0.9, help="Fraction of the best rate that counts as saturated")
+    p.add_argument("--min-gain", type=float, default=0.05, help="Stop after two points improving less than this")
+    p.add_argument("--save", action="store_true", help="Store the result for this gateway pair (used by main.py --tuned)")
+    p.add_argument("--json", default=None, help="Write points and result to this file")
+    p.add_argument("-v", "--verbose", action="store_true")
+    opts = p.parse_args(argv)
+    logging.basicConfig(level=logging.INFO if opts.verbose else logging.WARNING, format="%(asctime)s %(levelname)s %(message)s")
+    if not 0 < opts.saturation <= 1:
+        p.error("--saturation must be in (0, 1]")
+
+    args = get_args(extra)
+    conns = sorted(set(opts.conns))
+    try:
+        src = ports_for(args.inbound_src_ports, max(conns))
+        dst = ports_for(args.outbound_dst_ports, max(conns))
+    except ValueError as e:
+        p.error(str(e))
+    args.inbound_src_ports, args.outbound_dst_ports = src, dst
+
+    configure_executor_pool(max_size=args.executor_pool_size, idle_s=args.executor_idle)
+    if args.sim or args.sim_profile or args.sim_replay:
+        import simcompute
+        simcompute.install(root=args.sim_root, profile=args.sim_profile, replay=args.sim_replay)
+    ctl = None
+    try:
+        # Resolution + probes only (cached after the first run); nothing is launched here
+        ctl = StreamController(args, default_stream=False)
+        with span("tune", mode=opts.mode):
+            if opts.mode == "path":
+                points = sweep_path(ctl, conns, port=opts.port, duration=opts.duration, min_gain=opts.min_gain)
+            else:
+                points = sweep_tunnel(args, conns, duration=opts.duration, min_gain=opts.min_gain)
+        result = choose(points, opts.saturation)
+        if result:
+            n = result["num_conn"]
+            result.update(mode=opts.mode, type=args.type if opts.mode == "tunnel" else None,
+                          inbound_src_ports=src[:n], outbound_dst_ports=dst[:n])
+        print(format_report(points, result))
+
+        if opts.save and result:
+            if ctl.ep_cache is None:
+                logging.error("--save needs the endpoint cache (drop --no-endpoint-cache)")
+                return 1
+            ctl.ep_cache.put_tuning(ctl._eid(args.p2cs_ep), ctl._eid(args.c2cs_ep), result)
+            ctl.ep_cache.save()
+            print(f"Saved for {args.p2cs_ep} -> {args.c2cs_ep}; use main.py --tuned")
+        if opts.json:
+            with open(opts.json, "w") as fh:
+                json.dump({"points": points, "result": result}, fh, indent=1)
+        return 0 if result else 1
+    finally:
+        if ctl is not None:
+            ctl.close()
+        shutdown_executors()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
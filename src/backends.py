@@ -0,0 +1,231 @@
+"""
+Execution backends besides Globus Compute (--backend ROLE=SPEC)
+
+run_remote / call_remote address every host by an endpoint ID and submit through the executor pooled
+for that ID (util.ExecutorPool). Besides Compute endpoint UUIDs, two kinds of IDs are served here:
+  local                    this machine: shell scripts run as bash subprocesses, native functions
+                           run in-process; no network at all
+  ssh:[user@]host[:port]   one multiplexed OpenSSH connection per host (ControlMaster): each submission
+                           is a new channel on it, so only the first one pays for the handshake, and the
+                           master outlives the run by --ssh-persist seconds (the next run reuses it);
+                           native functions run in the remote python3 from their source
+                           (remote_fns functions are self-contained)
+Host keys, identities, jump hosts etc. come from ~/.ssh/config; nothing ever prompts (BatchMode).
+
+Both executors mirror the SDK surface the tree uses: submit(ShellFunction) resolves to a result with
+stdout/stderr/returncode, formatting the command with its kwargs and returning (not raising on) a
+non-zero exit, like Compute's ShellFunction; submit_function
+runs a native function directly (no registration with the Compute service).
+Roles without a --backend entry keep resolving to Compute endpoints (or simcompute's under --sim).
+"""
+from __future__ import annotations
+import base64, inspect, logging, os, pickle, re, shlex, subprocess, tempfile, textwrap, threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+# Roles --backend can place (producer/consumer only matter for data-plane tests)
+ROLES = ("p2cs", "c2cs", "inbound", "outbound", "producer", "consumer")
+
+DEFAULT_CONTROL_DIR = "~/.cache/streamhub/ssh"
+_SETTINGS = {"persist_s": 600, "control_dir": DEFAULT_CONTROL_DIR}
+
+_SSH_TARGET_RE = re.compile(r"^(?:[\w.+-]+@)?[\w.-]+(?::\d{1,5})?$")
+_RESULT_TAG = "@@STREAMHUB-RESULT"
+
+
+class BackendTaskError(RuntimeError):
+    """A local/SSH task that failed (connection failure, remote function error)"""
+
+
+class ShellResult:
+    """Mirror of the SDK's ShellResult"""
+
+    def __init__(self, cmd: str, stdout: str, stderr: str, returncode: int):
+        self.cmd, self.stdout, self.stderr, self.returncode = cmd, stdout, stderr, returncode
+
+
+def parse_spec(spec: str) -> Optional[str]:
+    """
+    Endpoint ID for a --backend value: 'compute' → None (resolve as usual), 'local', 'ssh:[user@]host[:port]'
+    Raises ValueError on anything else
+    """
+    spec = (spec or "").strip()
+    if spec == "compute":
+        return None
+    if spec == "local":
+        return spec
+    if spec.startswith("ssh:") and _SSH_TARGET_RE.match(spec[4:]):
+        return spec
+    raise ValueError(f"backend must be compute, local or ssh:[user@]host[:port], got {spec!r}")
+
+
+def role_endpoints(args) -> Dict[str, str]:
+    """{role: endpoint ID} for the roles args.backend moves off Compute"""
+    out = {}
+    for role, spec in (getattr(args, "backend", None) or {}).items():
+        eid = parse_spec(spec)
+        if eid:
+            out[role] = eid
+    return out
+
+
+def handles(endpoint_id: str) -> bool:
+    """True for endpoint IDs served by this module instead of the Compute backend"""
+    return endpoint_id == "local" or endpoint_id.startswith("ssh:")
+
+
+def configure(*, persist_s: Optional[float] = None, control_dir: Optional[str] = None) -> None:
+    """Set how long idle SSH masters stay up and where their control sockets live; takes effect for new executors"""
+    if persist_s is not None:
+        _SETTINGS["persist_s"] = int(persist_s)
+    if control_dir is not None:
+        _SETTINGS["control_dir"] = control_dir
+
+
+def executor(endpoint_id: str):
+    """A LocalExecutor / SshExecutor for endpoint_id (see handles)"""
+    if endpoint_id == "local":
+        return LocalExecutor()
+    return SshExecutor(endpoint_id[4:], persist_s=_SETTINGS["persist_s"], control_dir=_SETTINGS["control_dir"])
+
+
+def _text(v) -> str:
+    return v.decode(errors="replace") if isinstance(v, bytes) else (v or "")
+
+
+class _ThreadedExecutor:
+    """Executor surface over a thread pool; subclasses provide _shell and _call"""
+
+    workers = 16
+
+    def __init__(self, name: str):
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=name)
+
+    def _shell(self, cmd: str, walltime: Optional[float]) -> ShellResult:
+        raise NotImplementedError
+
+    def _call(self, fn: Callable, args: tuple, kwargs: dict):
+        raise NotImplementedError
+
+    def submit(self, fn, *args, walltime: Optional[float] = None, **kwargs) -> Future:
+        cmd = getattr(fn, "cmd", None)
+        if cmd is None:
+            return self.submit_function(fn, *args, **kwargs)
+        line = cmd.format(walltime=walltime, **kwargs)
+        return self._pool.submit(self._shell, line, walltime)
+
+    def submit_function(self, fn: Callable, *args, **kwargs) -> Future:
+        return self._pool.submit(self._call, fn, args, kwargs)
+
+    def shutdown(self, wait: bool = True, cancel_futures: bool = False) -> None:
+        self._pool.shutdown(wait=wait, cancel_futures=cancel_futures)
+
+
+class LocalExecutor(_ThreadedExecutor):
+    """Runs everything on the controller's host: bash subprocesses started in $HOME, functions in-process"""
+
+    def __init__(self):
+        super().__init__("local")
+
+    def _shell(self, cmd: str, walltime: Optional[float]) -> ShellResult:
+        try:
+            p = subprocess.run(cmd, shell=True, executable="/bin/bash", cwd=os.path.expanduser("~"),
+                               stdin=subprocess.DEVNULL, capture_output=True, text=True, timeout=walltime)
+        except subprocess.TimeoutExpired as e:
+            return ShellResult(cmd, _text(e.stdout), _text(e.stderr) + f"walltime of {walltime}s exceeded", 124)
+        return ShellResult(cmd, p.stdout, p.stderr, p.returncode)
+
+    def _call(self, fn: Callable, args: tuple, kwargs: dict):
+        return fn(*args, **kwargs)
+
+
+class SshExecutor(_ThreadedExecutor):
+    """
+    Runs everything on target over one multiplexed SSH connection
+    - The master is started (or an earlier run's is reused) on the first submission
+    - Stays below sshd's default MaxSessions (10) channels per connection
+    - shutdown leaves the master to ControlPersist, so the next executor/run skips the handshake
+    """
+
+    workers = 8
+
+    def __init__(self, target: str, *, persist_s: int = 600, control_dir: str = DEFAULT_CONTROL_DIR):
+        super().__init__(f"ssh-{target}")
+        self.target = target
+        host, _, port = target.rpartition(":") if re.search(r":\d+$", target) else (target, "", "")
+        control_dir = os.path.expanduser(control_dir)
+        os.makedirs(control_dir, mode=0o700, exist_ok=True)
+        self._opts = ["-o", "BatchMode=yes", "-o", "ConnectTimeout=15",
+                      "-o", f"ControlPath={control_dir}/%C"] + (["-p", port] if port else [])
+        self._host = host
+        self._persist_s = int(persist_s)
+        self._master_lock = threading.Lock()
+        self._master_up = False
+
+    def _ssh(self, remote_cmd: str, *, stdin: Optional[str] = None, timeout: Optional[float] = None):
+        self._ensure_master()
+        # A client never becomes a master (a forked master would hold the captured pipes open); without
+        # one it falls back to a direct connection
+        return subprocess.run(["ssh", *self._opts, "-o", "ControlMaster=no", *([] if stdin is not None else ["-n"]),
+                               self._host, remote_cmd],
+                              input=stdin, capture_output=True, text=True, timeout=timeout)
+
+    def _ensure_master(self) -> None:
+        """Bring the master connection up once, so concurrent first submissions do not each open their own"""
+        if self._master_up:
+            return
+        with self._master_lock:
+            if self._master_up:
+                return
+            check = subprocess.run(["ssh", "-O", "check", *self._opts, self._host], capture_output=True, text=True)
+            if check.returncode != 0:
+                # The backgrounded master keeps its stderr: a file, not a pipe anybody waits on
+                with tempfile.TemporaryFile(mode="w+") as err:
+                    p = subprocess.run(["ssh", *self._opts, "-o", "ControlMaster=yes",
+                                        "-o", f"ControlPersist={self._persist_s}", "-f", "-N", self._host],
+                                       stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=err, timeout=60)
+                    err.seek(0)
+                    if p.returncode != 0:
+                        raise BackendTaskError(f"ssh connection to {self.target} failed: {err.read().strip()}")
+                logging.info("SSH master connection to %s established", self.target)
+            else:
+                logging.debug("Reusing SSH master connection to %s", self.target)
+            self._master_up = True
+
+    def _shell(self, cmd: str, walltime: Optional[float]) -> ShellResult:
+        try:
+            p = self._ssh("bash -c " + shlex.quote(cmd), timeout=walltime)
+        except subprocess.TimeoutExpired as e:
+            return ShellResult(cmd, _text(e.stdout), _text(e.stderr) + f"walltime of {walltime}s exceeded", 124)
+        if p.returncode == 255:
+            # ssh's own failure (connection lost, master gone): not the script's exit status
+            self._master_up = False
+        return ShellResult(cmd, p.stdout, p.stderr, p.returncode)
+
+    def _call(self, fn: Callable, args: tuple, kwargs: dict):
+        payload = base64.b64encode(pickle.dumps((args, kwargs))).decode()
+        program = "\n".join([
+            "from __future__ import annotations",
+            "import base64, pickle, sys",
+            textwrap.dedent(inspect.getsource(fn)),
+            f"args, kwargs = pickle.loads(base64.b64decode({payload!r}))",
+            "try:",
+            f"    out = (True, {fn.__name__}(*args, **kwargs))",
+            "except Exception as e:",
+            "    out = (False, e)",
+            "try:",
+            "    blob = pickle.dumps(out)",
+            "except Exception:",
+            "    blob = pickle.dumps((False, RuntimeError(repr(out[1]))))",
+            f"print({_RESULT_TAG!r}, base64.b64encode(blob).decode())",
+        ])
+        p = self._ssh("python3 -", stdin=program)
+        for line in p.stdout.splitlines():
+            if line.startswith(_RESULT_TAG):
+                ok, value = pickle.loads(base64.b64decode(line.split(None, 1)[1]))
+                if ok:
+                    return value
+                raise value
+        if p.returncode == 255:
+            self._master_up = False
+        raise BackendTaskError(f"{fn.__name__} on {self.target} exited with status {p.returncode}: {p.stderr[-2000:]}")
@@ -0,0 +1,143 @@
+from __future__ import annotations
+import logging, time, uuid
+from typing import Dict, List, Optional
+
+from util import run_remote, arun_remote
+from tracing import TRACER
+
+
+class RemoteBatch:
+    """
+    Fuse several shell operations for ONE endpoint into a single run_remote submission
+
+    - add() queues an operation (label + script body); operations run in queue order
+    - Each operation runs in its own subshell with 'set -euo pipefail', so one failing
+      operation does not stop the next (unless it was queued with stop_on_error=True)
+    - run() returns one result dict per operation, in the same shape run_remote gives:
+      {ok, label, stdout, stderr} or {ok: False, label, error, ...}
+    Over a WAN every fused operation saves a full Compute round-trip
+    """
+
+    def __init__(self, endpoint_id: str, label: str):
+        self.endpoint_id = endpoint_id
+        self.label = label
+        self._ops: List[tuple] = []
+
+    def __len__(self) -> int:
+        return len(self._ops)
+
+    def add(self, label: str, script: str, *, stop_on_error: bool = False) -> int:
+        """Queue one operation; returns its index into run()'s result list"""
+        self._ops.append((label, script, stop_on_error))
+        return len(self._ops) - 1
+
+    def script(self, token: str) -> str:
+        """
+        Build the fused script (no single quotes: run_remote wraps it in bash -c '...')
+        Per-op stdout/stderr go to temp files and are echoed back between
+        '@@<token> OP <i> <rc> <elapsed ns>' / '@@<token> ERR <i>' / '@@<token> END <i>' frame lines
+        """
+        parts = [
+            '__B=$(mktemp -d)',
+            'trap "rm -rf $__B" EXIT',
+            'set +e',
+            '__stop=0',
+        ]
+        for i, (label, body, stop) in enumerate(self._ops):
+            parts.append(f"""
+# --- op {i}: {label}
+__t=$(date +%s%N)
+if [ "$__stop" -eq 0 ]; then
+(
+set -euo pipefail
+{body}
+) > "$__B/{i}.out" 2> "$__B/{i}.err" < /dev/null
+__rc=$?
+else
+__rc=-1; : > "$__B/{i}.out"; echo "not run: an earlier operation failed" > "$__B/{i}.err"
+fi
+{'[ "$__rc" -ne 0 ] && __stop=1' if stop else ':'}
+printf "\\n@@{token} OP {i} %s %s\\n" "$__rc" "$(( $(date +%s%N) - __t ))"
+cat "$__B/{i}.out"
+printf "\\n@@{token} ERR {i}\\n"
+cat "$__B/{i}.err"
+printf "\\n@@{token} END {i}\\n\"""")
+        parts.append("exit 0")
+        return "\n".join(parts)
+
+    @staticmethod
+    def _strip_frame(s: str) -> str:
+        """Undo the newline the framing adds before each marker line"""
+        return s[:-1] if s.endswith("\n") else s
+
+    def parse(self, token: str, stdout: str) -> List[dict]:
+        """Split the fused stdout back into per-operation result dicts"""
+        results: List[Optional[dict]] = [None] * len(self._ops)
+        cur: Optional[int] = None
+        rc = 0
+        section = None
+        buf: Dict[str, list] = {"out": [], "err": []}
+        for line in stdout.splitlines(keepends=True):
+            if line.startswith(f"@@{token} "):
+                kind, idx, *rest = line.split()[1:]
+                if kind == "OP":
+                    cur, rc, section = int(idx), int(rest[0]), "out"
+                    elapsed = int(rest[1]) / 1e9 if len(rest) > 1 else None
+                    buf = {"out": [], "err": []}
+                elif kind == "ERR":
+                    section = "err"
+                elif kind == "END" and cur is not None:
+                    label = self._ops[cur][0]
+                    out = self._strip_frame("".join(buf["out"]))
+                    err = self._strip_frame("".join(buf["err"]))
+                    r = {"ok": rc == 0, "label": label, "stdout": out, "stderr": err, "elapsed": elapsed}
+                    if rc != 0:
+                        r["error"] = "not run: an earlier operation failed" if rc < 0 else f"exit status {rc}"
+                        r["rc"] = rc
+                    results[cur] = r
+                    cur, section = None, None
+                continue
+            if section is not None:
+                buf[section].append(line)
+        for i, r in enumerate(results):
+            if r is None:
+                results[i] = {"ok": False, "label": self._ops[i][0], "error": "no result returned for operation"}
+        return results  # type: ignore[return-value]
+
+    def run(self, *, wall: int = 180, wait: int = 180) -> List[dict]:
+        """Submit all queued operations in one round-trip and return their results in order"""
+        if not self._ops:
+            return []
+        token = uuid.uuid4().hex[:12]
+        r = run_remote(self.endpoint_id, f"BATCH:{self.label}", self.script(token), wall=wall, wait=wait)
+        return self._results(token, r)
+
+    async def arun(self, *, wall: int = 180, wait: int = 180) -> List[dict]:
+        """Awaitable run() (util.arun_remote)"""
+        if not self._ops:
+            return []
+        token = uuid.uuid4().hex[:12]
+        r = await arun_remote(self.endpoint_id, f"BATCH:{self.label}", self.script(token), wall=wall, wait=wait)
+        return self._results(token, r)
+
+    def _results(self, token: str, r: dict) -> List[dict]:
+        if not r.get("ok"):
+            logging.error("Batch %s failed as a whole: %s", self.label, r.get("error"))
+            return [{"ok": False, "label": label, "error": r.get("error")} for label, _, _ in self._ops]
+        results = self.parse(token, r.get("stdout") or "")
+        self._trace_ops(r.get("timing") or {}, results)
+        for res in results:
+            logging.debug("%s (batched) ok=%s stdout: %s", res["label"], res["ok"], (res.get("stdout") or "").strip())
+        return results
+
+    def _trace_ops(self, timing: dict, results: List[dict]) -> None:
+        """Lay the per-operation remote durations out as spans inside the batch's remote execution window"""
+        if timing.get("exec_s") is None:
+            return
+        t = time.time() - (timing.get("retrieve_s") or 0.0) - timing["exec_s"]
+        for res in results:
+            dur = res.get("elapsed")
+            if dur is None:
+                continue
+            TRACER.add(f"op:{res['label']}", t, t + dur, batch=self.label, ok=res["ok"], clock="remote")
+            t += dur
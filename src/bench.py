@@ -0,0 +1,222 @@
+"""
+Offline setup-latency benchmark
+
+Runs the full main.py flow (and the daemon's add-a-stream path) against the simulated
+Compute backend (simcompute.py) and reports per-phase timings taken from the trace spans:
+  total, step:* (scheduler steps), ctl:* (StreamController phases), remote calls per label
+
+Scenarios
+  cold    fresh sandbox every iteration: endpoint listing + probes, keygen, trust distribution
+  warm    endpoint cache and gateway credentials kept from the previous run
+  stream  one warm bring-up, then time connecting additional streams (what the daemon pays)
+
+Examples
+  python3 bench.py -n 5                                   # all scenarios, default latency profile
+  python3 bench.py -n 10 --profile wan.json --json out.json
+  python3 bench.py --baseline out.json --max-regression 0.15   # exit 1 on regressions
+  python3 bench.py --replay rec.json -s warm              # replay responses recorded with main.py --sim-record
+Extra controller flags go after '--' (e.g. -- --key-type ecdsa)
+"""
+from __future__ import annotations
+import argparse, json, logging, os, shutil, statistics, sys, time
+from typing import Dict, List
+
+import simcompute
+from config import get_args
+from controller import StreamController
+from main import session_steps, _report
+from tracing import TRACER, span
+
+SCENARIOS = ("cold", "warm", "stream")
+
+# Loopback addresses so the stand-in s2cs/s2uc can bind and connect locally
+_BASE_ARGS = [
+    "--p2cs_ip", "127.0.0.1", "--p2cs-listener", "127.0.0.1",
+    "--c2cs_ip", "127.0.0.2", "--c2cs-listener", "127.0.0.2",
+    "--prod_ip", "127.0.0.1", "--cons_ip", "127.0.0.2",
+    "--inbound_ip", "127.0.0.1", "--outbound_ip", "127.0.0.2",
+    "--inbound-src-ports", "6074,6075", "--outbound-dst-ports", "6100,6101", "--num-conn", "2",
+]
+
+
+def _controller_argv(root: str, extra: List[str]) -> List[str]:
+    return _BASE_ARGS + [
+        "--session-base", f"{root}/sessions", "--pid-dir", f"{root}/pids",
+        "--cred-dir", f"{root}/creds", "--endpoint-cache", f"{root}/endpoints.json",
+    ] + extra
+
+
+def _metrics(total: float) -> Dict[str, float]:
+    """Flatten the recorded spans into {metric: seconds} (repeated names are summed)"""
+    m: Dict[str, float] = {"total": total}
+    for s in TRACER.spans():
+        name = s["name"]
+        if name.startswith(("step:", "ctl:", "remote:")):
+            m[name] = m.get(name, 0.0) + (s["end"] - s["start"])
+    return m
+
+
+def _session(backend: simcompute.SimBackend, argv: List[str]) -> tuple[Dict[str, float], int, StreamController | None]:
+    """One full main.py flow; returns (metrics, exit status, controller)"""
+    args = get_args(argv)
+    TRACER.reset()
+    t0 = time.perf_counter()
+    ctl = None
+    try:
+        with span("session"):
+            ctl = StreamController(args)
+            code = _report(ctl, session_steps(ctl, args).run())
+    except Exception:
+        logging.exception("Session failed")
+        code = 1
+    return _metrics(time.perf_counter() - t0), code, ctl
+
+
+def _reset_state(root: str) -> None:
+    """Forget everything a previous run left behind (sessions, credentials, endpoint cache, sandboxes)"""
+    for sub in ("sessions", "pids", "creds", "endpoints"):
+        shutil.rmtree(os.path.join(root, sub), ignore_errors=True)
+    try:
+        os.unlink(os.path.join(root, "endpoints.json"))
+    except FileNotFoundError:
+        pass
+
+
+def _teardown(backend: simcompute.SimBackend, ctl: StreamController | None) -> None:
+    if ctl is not None:
+        ctl.close()
+    if backend.stub_tools:
+        backend.kill_tools()
+
+
+def run_scenario(name: str, opts, extra: List[str]) -> List[Dict[str, float]]:
+    """Run one scenario for opts.iterations iterations; returns the per-iteration metrics"""
+    root = os.path.join(opts.root, name)
+    shutil.rmtree(root, ignore_errors=True)
+    backend = simcompute.install(root=root, profile=opts.profile, replay=opts.replay)
+    argv = _controller_argv(root, extra)
+    runs: List[Dict[str, float]] = []
+    try:
+        if name in ("warm", "stream"):
+            # Prime caches/credentials; not measured
+            _, code, ctl = _session(backend, argv)
+            _teardown(backend, ctl)
+            if code:
+                raise RuntimeError(f"warm-up session failed with status {code}")
+        for i in range(opts.iterations):
+            if name == "cold":
+                _reset_state(root)
+            if name == "stream":
+                runs.append(_stream_iteration(backend, argv, i))
+                continue
+            m, code, ctl = _session(backend, argv)
+            _teardown(backend, ctl)
+            m["failed"] = float(code != 0)
+            runs.append(m)
+    finally:
+        simcompute.uninstall()
+    return runs
+
+
+def _stream_iteration(backend: simcompute.SimBackend, argv: List[str], i: int) -> Dict[str, float]:
+    """Warm bring-up, then time adding + connecting one more stream (excluded: the bring-up itself)"""
+    _, code, ctl = _session(backend, argv)
+    try:
+        if code:
+            return {"failed": 1.0}
+        ctl.add_stream("bench", inbound_src_ports=[6076], outbound_dst_ports=[6102])
+        TRACER.reset()
+        t0 = time.perf_counter()
+        ctl.allocate_ports("bench")
+        conn = ctl.connect("bench")
+        m = _metrics(time.perf_counter() - t0)
+        m["failed"] = float(any(not v.get("ok") for v in conn.values()))
+        return m
+    finally:
+        _teardown(backend, ctl)
+
+
+def aggregate(runs: List[Dict[str, float]]) -> Dict[str, dict]:
+    """{metric: {median, mean, p95, min, max, n}} over the iterations that recorded it"""
+    keys = sorted({k for r in runs for k in r})
+    out = {}
+    for k in keys:
+        vals = sorted(r[k] for r in runs if k in r)
+        p95 = vals[min(len(vals) - 1, int(round(0.95 * (len(vals) - 1))))]
+        out[k] = {"median": statistics.median(vals), "mean": statistics.fmean(vals), "p95": p95,
+                  "min": vals[0], "max": vals[-1], "n": len(vals)}
+    return out
+
+
+def format_table(results: Dict[str, Dict[str, dict]]) -> str:
+    lines = []
+    for scen, stats in results.items():
+        lines.append(f"[{scen}]  (seconds)")
+        lines.append(f"  {'metric':<44} {'median':>8} {'p95':>8} {'min':>8} {'max':>8}")
+        order = sorted(stats, key=lambda k: (k != "total", k == "failed", not k.startswith("step:"), -stats[k]["median"]))
+        for k in order:
+            s = stats[k]
+            if k == "failed":
+                lines.append(f"  {'failed iterations':<44} {round(s['mean'] * s['n']):>8d}")
+                continue
+            lines.append(f"  {k[:44]:<44} {s['median']:>8.3f} {s['p95']:>8.3f} {s['min']:>8.3f} {s['max']:>8.3f}")
+    return "\n".join(lines)
+
+
+def regressions(results: Dict[str, Dict[str, dict]], baseline: Dict[str, Dict[str, dict]],
+                max_ratio: float, min_delta: float) -> List[str]:
+    """Metrics whose median grew by more than max_ratio (and by at least min_delta seconds) vs the baseline"""
+    found = []
+    for scen, stats in results.items():
+        for k, s in stats.items():
+            b = (baseline.get(scen) or {}).get(k)
+            if not b or k == "failed":
+                continue
+            delta = s["median"] - b["median"]
+            if delta > min_delta and s["median"] > b["median"] * (1 + max_ratio):
+                found.append(f"{scen} {k}: {b['median']:.3f}s -> {s['median']:.3f}s (+{delta:.3f}s)")
+        if (stats.get("failed") or {}).get("max", 0) > 0:
+            found.append(f"{scen}: some iterations failed")
+    return found
+
+
+def main(argv: List[str] | None = None) -> int:
+    argv = list(sys.argv[1:] if argv is None else argv)
+    extra: List[str] = []
+    if "--" in argv:
+        i = argv.index("--")
+        argv, extra = argv[:i], argv[i + 1:]
+    p = argparse.ArgumentParser(description="Offline controller setup-latency benchmark (simulated Compute backend)")
+    p.add_argument("-n", "--iterations", type=int, default=5)
+    p.add_argument("-s", "--scenario", action="append", choices=SCENARIOS, help="Scenario(s) to run (default: all)")
+    p.add_argument("--profile", default=None, help="simcompute latency/failure profile JSON")
+    p.add_argument("--replay", default=None, help="Replay a recording (main.py --sim-record) instead of simulating")
+    p.add_argument("--root", default="/tmp/.streamhub-bench", help="Sandbox root")
+    p.add_argument("--json", default=None, help="Write aggregated results to this file")
+    p.add_argument("--baseline", default=None, help="Compare medians against a previous --json output")
+    p.add_argument("--max-regression", type=float, default=0.2, help="Allowed relative slowdown vs baseline")
+    p.add_argument("--min-delta", type=float, default=0.02, help="Ignore slowdowns smaller than this (seconds)")
+    p.add_argument("-v", "--verbose", action="store_true")
+    opts = p.parse_args(argv)
+    logging.basicConfig(level=logging.INFO if opts.verbose else logging.WARNING, format="%(asctime)s %(levelname)s %(message)s")
+
+    results = {}
+    for scen in opts.scenario or SCENARIOS:
+        results[scen] = aggregate(run_scenario(scen, opts, extra))
+    print(format_table(results))
+
+    if opts.json:
+        with open(opts.json, "w") as fh:
+            json.dump(results, fh, indent=1)
+    if opts.baseline:
+        with open(opts.baseline) as fh:
+            found = regressions(results, json.load(fh), opts.max_regression, opts.min_delta)
+        if found:
+            print("Regressions:\n  " + "\n  ".join(found))
+            return 1
+        print("No regressions against", opts.baseline)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
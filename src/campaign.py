@@ -0,0 +1,382 @@
+"""
+Declarative multi-stream campaigns (--campaign FILE)
+
+The spec is JSON: CLI defaults for every pair, then one entry per gateway pair with its own
+endpoint / IP / option overrides (keys are CLI flag names, '-' or '_') and its streams
+
+    {
+      "defaults": {"key_type": "ecdsa", "type": "StunnelSubprocess"},
+      "pairs": [
+        {"name": "bl1", "p2cs_ep": "thats", "c2cs_ep": "neat", "p2cs_ip": "...", "c2cs_ip": "...",
+         "streams": ["det1=5074,5075:5100,5101",
+                     {"name": "det2", "inbound_src_ports": [5076], "outbound_dst_ports": [5102], "prod_ip": "..."}]}
+      ]
+    }
+
+Plan:
+- every distinct endpoint name of every pair is resolved once (endpoint cache, then one listing)
+  and every distinct endpoint is probed once; the controllers get the IDs instead of resolving again
+  (a pair's "backend": {"p2cs": "local", ...} moves roles off Compute, as --backend does)
+- --cleanup and the deep clean run once per gateway host before any pair starts
+- each pair is one session (StreamController driven by AsyncStreamController); pairs that share a
+  gateway wait for the first one to provide its credentials (cred store), then reuse them
+- a pair's bring-up (prepare, ports + crypto, launch, gateway waits, runner certs) holds one slot on
+  its two gateways, each stream's connect one slot on its runners; at most --max-parallel of these
+  run at once and at most --max-per-endpoint touch any single endpoint
+Every stream gets a result row: pair, stream, ok, failed phase, UID, listen ports, error
+"""
+from __future__ import annotations
+import argparse, asyncio, contextlib, json, logging, signal, time
+from typing import Dict, List, Optional
+
+import backends
+from aiocontroller import AsyncStreamController, gather_results
+from batch import RemoteBatch
+from config import _stream_spec
+from controller import StreamController, _normalize
+from epcache import EndpointCache, DEFAULT_PATH as EP_CACHE_PATH
+from scheduler import run_parallel, step_ok
+from util import new_client, cred_key, add_endpoint_failure_hook, remove_endpoint_failure_hook
+
+# Roles every pair resolves (producer/consumer hosts only when named)
+_ROLES = ("p2cs", "c2cs", "inbound", "outbound", "producer", "consumer")
+
+
+def load_spec(path: str, base: argparse.Namespace) -> List[dict]:
+    """
+    Read a campaign spec into [{'name', 'args', 'streams'}] (args: base CLI args + defaults + pair overrides)
+    Raises ValueError on unknown options, duplicate names or malformed streams
+    """
+    with open(path) as fh:
+        spec = json.load(fh)
+    known = vars(base)
+
+    def options(d: dict, where: str) -> dict:
+        out = {}
+        for k, v in d.items():
+            key = k.replace("-", "_")
+            if key not in known or key in ("campaign", "stream", "daemon"):
+                raise ValueError(f"{where}: unknown option {k!r}")
+            out[key] = v
+        return out
+
+    defaults = options(spec.get("defaults") or {}, "defaults")
+    pairs, names = [], set()
+    for i, p in enumerate(spec.get("pairs") or []):
+        p = dict(p)
+        name = str(p.pop("name", f"pair{i + 1}"))
+        if name in names:
+            raise ValueError(f"Duplicate pair name {name!r}")
+        names.add(name)
+        streams = []
+        for s in p.pop("streams", None) or []:
+            try:
+                streams.append(_stream_spec(s) if isinstance(s, str) else dict(s))
+            except argparse.ArgumentTypeError as e:
+                raise ValueError(f"pair {name}: {e}") from None
+        if not streams:
+            raise ValueError(f"pair {name}: no streams")
+        args = argparse.Namespace(**{**known, **defaults, **options(p, f"pair {name}"), "stream": None})
+        if not isinstance(args.backend, dict) or not set(args.backend) <= set(backends.ROLES):
+            raise ValueError(f"pair {name}: backend must map roles ({', '.join(backends.ROLES)}) to specs")
+        backends.role_endpoints(args)
+        for k in ("inbound_src_ports", "outbound_dst_ports", "port_range"):
+            v = getattr(args, k)
+            if isinstance(v, str):
+                setattr(args, k, [int(x) for x in v.replace("-", ",").split(",") if x.strip()])
+        pairs.append({"name": name, "args": args, "streams": streams})
+    if not pairs:
+        raise ValueError("Campaign spec has no pairs")
+    return pairs
+
+
+def _role_names(args: argparse.Namespace) -> Dict[str, str]:
+    """{role: endpoint name} for the roles resolved through Compute (not moved by the pair's backend)"""
+    direct = backends.role_endpoints(args)
+    return {role: getattr(args, f"{role}_ep") for role in _ROLES if getattr(args, f"{role}_ep", None) and role not in direct}
+
+
+class Limits:
+    """Global and per-endpoint concurrency slots"""
+
+    def __init__(self, total: int, per_endpoint: int):
+        self._total = asyncio.Semaphore(total)
+        self._per_endpoint = per_endpoint
+        self._eps: Dict[str, asyncio.Semaphore] = {}
+
+    @contextlib.asynccontextmanager
+    async def hold(self, eids):
+        """One global slot plus one slot on each distinct endpoint (acquired in a fixed order: no deadlock)"""
+        sems = [self._eps.setdefault(e, asyncio.Semaphore(self._per_endpoint)) for e in sorted(set(eids))]
+        async with contextlib.AsyncExitStack() as stack:
+            await stack.enter_async_context(self._total)
+            for s in sems:
+                await stack.enter_async_context(s)
+            yield
+
+
+class Campaign:
+    """Bring up every stream of a campaign spec; see the module docstring"""
+
+    def __init__(self, base: argparse.Namespace, pairs: List[dict]):
+        self.base = base
+        self.pairs = pairs
+        self.limits = Limits(base.max_parallel, base.max_per_endpoint)
+        self.ids: Dict[str, str] = {}
+        self.sessions: Dict[str, AsyncStreamController] = {}
+        self.rows: List[dict] = []
+        # Gateway credential key -> set once the first pair using it has its cert in the cred store
+        self._creds: Dict[tuple, asyncio.Event] = {}
+        self._cache: Optional[EndpointCache] = None
+        self._cached_eids: set = set()
+
+    # ------------------------------ Resolution ------------------------------
+
+    def resolve(self) -> Dict[str, str]:
+        """Resolve every distinct endpoint name once and probe every distinct endpoint once"""
+        b = self.base
+        if not b.no_endpoint_cache:
+            self._cache = EndpointCache(b.endpoint_cache or EP_CACHE_PATH, ttl_s=b.endpoint_cache_ttl,
+                                        probe_ttl_s=b.probe_cache_ttl)
+        names = sorted({n for p in self.pairs for n in _role_names(p["args"]).values()})
+        cache = self._cache
+        ids = {n: cache.resolution(_normalize(n)) for n in names} if cache else {}
+        ids = {n: e for n, e in ids.items() if e}
+        missing = [n for n in names if n not in ids]
+        if missing:
+            visible = list(new_client().get_endpoints())
+            index = StreamController._build_name_index(visible)
+            for n in missing:
+                ids[n] = StreamController._resolve_single("campaign", n, "", index, visible)
+                if cache:
+                    cache.put_resolution(_normalize(n), ids[n])
+        self._cached_eids = {ids[n] for n in names if n not in missing}
+
+        users: Dict[str, list] = {}
+        for n in names:
+            users.setdefault(ids[n], []).append(n)
+        # Roles on local/SSH backends are probed every run (the SSH probe opens the master connection)
+        for p in self.pairs:
+            for role, eid in backends.role_endpoints(p["args"]).items():
+                users.setdefault(eid, []).append(f"{p['name']}:{role}")
+        to_probe = {e: ns for e, ns in users.items() if backends.handles(e) or not (cache and cache.probe_ok(e))}
+        logging.info("Campaign: %d endpoints (%d names) for %d pairs; probing %d",
+                     len(users), len(names), len(self.pairs), len(to_probe))
+        probes = run_parallel({e: (lambda e=e, ns=ns: StreamController._probe_or_raise("campaign", "/".join(ns), e))
+                               for e, ns in to_probe.items()})
+        failed = {e: r for e, r in probes.items() if isinstance(r, dict) and not r.get("ok", True)}
+        if failed:
+            raise RuntimeError("Endpoint probe failed: " + "; ".join(f"{e}: {r.get('error')}" for e, r in failed.items()))
+        if cache:
+            for e in to_probe:
+                if not backends.handles(e):
+                    cache.put_probe(e)
+            cache.save()
+            add_endpoint_failure_hook(self._on_endpoint_failure)
+        self.ids = ids
+        return ids
+
+    def _on_endpoint_failure(self, eid: str, err: Exception) -> None:
+        if eid in self._cached_eids and self._cache.invalidate(eid):
+            self._cached_eids.discard(eid)
+            logging.warning("Endpoint %s failed (%s); dropped it from the endpoint cache", eid, err)
+            self._cache.save()
+
+    # ------------------------------- Bring-up -------------------------------
+
+    async def run(self) -> List[dict]:
+        """Bring up every pair concurrently (within the limits); returns one result row per stream"""
+        t0 = time.time()
+        await gather_results({p["name"]: self._open(p) for p in self.pairs})
+        if not await self._clean_gateways():
+            return self.rows
+        await gather_results({p["name"]: self._pair(p) for p in self.pairs if p["name"] in self.sessions})
+        logging.info("Campaign: %d/%d streams up in %.1fs", sum(r["ok"] for r in self.rows), len(self.rows),
+                     time.time() - t0)
+        return self.rows
+
+    def _row(self, pair: str, stream: str, *, ok: bool, phase: str | None = None, error=None, st: dict | None = None):
+        self.rows.append({"pair": pair, "stream": stream, "ok": ok, "phase": phase,
+                          "uid": (st or {}).get("uid"), "listen_ports": list((st or {}).get("listen_ports") or []),
+                          "outbound_dst_ports": list(st["args"].outbound_dst_ports) if st else None,
+                          "error": error})
+
+    def _fail_all(self, pair: dict, phase: str, error) -> None:
+        for s in pair["streams"]:
+            self._row(pair["name"], s["name"], ok=False, phase=phase, error=error)
+
+    async def _open(self, pair: dict) -> None:
+        """Controller (session) of one pair with its streams registered"""
+        name = pair["name"]
+        endpoints = {**{role: self.ids[n] for role, n in _role_names(pair["args"]).items()},
+                     **backends.role_endpoints(pair["args"])}
+        try:
+            ctl = await asyncio.to_thread(StreamController, pair["args"], default_stream=False, endpoints=endpoints)
+        except Exception as e:
+            self._fail_all(pair, "init", str(e))
+            return
+        actl = AsyncStreamController(ctl)
+        for s in pair["streams"]:
+            try:
+                actl.add_stream(**s)
+            except (TypeError, ValueError) as e:
+                self._row(name, s.get("name", "?"), ok=False, phase="spec", error=str(e))
+        if actl.streams:
+            self.sessions[name] = actl
+
+    async def _clean_gateways(self) -> bool:
+        """
+        --cleanup / deep clean once per gateway host, before any pair prepares: run per pair, the cleans
+        would stop the sessions other pairs of this campaign had just started
+        """
+        b = self.base
+        if not b.cleanup and b.no_deep_clean:
+            return True
+        batches: Dict[str, RemoteBatch] = {}
+        for actl in self.sessions.values():
+            ctl = actl.ctl
+            for role, ep in (("p2cs", ctl.args.p2cs_ep), ("c2cs", ctl.args.c2cs_ep)):
+                eid = ctl._eid(ep)
+                if eid in batches:
+                    continue
+                batch = batches[eid] = RemoteBatch(eid, f"CLEAN:{ep}")
+                if b.cleanup:
+                    batch.add(f"KILL:{ep}", ctl._preclean_script(), stop_on_error=True)
+                if not b.no_deep_clean:
+                    batch.add(f"PRECLEAN:{ep}", ctl._deep_clean_script(), stop_on_error=True)
+        res = await gather_results({eid: batch.arun() for eid, batch in batches.items()})
+        failed = {eid: [r for r in rs if not r.get("ok")] if isinstance(rs, list) else [rs] for eid, rs in res.items()}
+        failed = {eid: rs for eid, rs in failed.items() if rs}
+        if failed:
+            logging.error("Campaign: gateway clean failed: %s", failed)
+            for name, actl in self.sessions.items():
+                for st in actl.streams.values():
+                    self._row(name, st["name"], ok=False, phase="clean", error=str(failed), st=st)
+            return False
+        logging.info("Campaign: cleaned %d gateway hosts", len(batches))
+        return True
+
+    async def _pair(self, pair: dict) -> None:
+        name = pair["name"]
+        actl = self.sessions[name]
+        endpoints = actl.ctl.endpoints
+        streams = list(actl.streams)
+        gateways = (actl.ctl._eid(actl.args.p2cs_ep), actl.ctl._eid(actl.args.c2cs_ep))
+
+        phase, err = await self._bring_up(actl, gateways)
+        if phase:
+            logging.error("Campaign pair %s: %s failed: %s", name, phase, err)
+            for s in streams:
+                self._row(name, s, ok=False, phase=phase, error=err, st=actl.streams[s])
+            logging.info("Cleanup of pair %s: %s", name, await actl.cleanup())
+            return
+
+        runners = (endpoints["inbound"], endpoints["outbound"])
+        res = await gather_results({s: self._connect(actl, s, runners) for s in streams})
+        for s, r in res.items():
+            bad = {k: v for k, v in r.items() if not v.get("ok")}
+            self._row(name, s, ok=not bad, phase=next(iter(bad), None),
+                      error=next(iter(bad.values()), {}).get("error") if bad else None, st=actl.streams[s])
+
+    async def _bring_up(self, actl: AsyncStreamController, gateways: tuple) -> tuple:
+        """Session-level phases of one pair; returns (failed phase, error) or (None, None)"""
+        async with self.limits.hold(gateways):
+            async with self._credentials(actl):
+                prep = await actl.prepare_gateways(preclean=False, deep_clean=False)
+            if not step_ok(prep):
+                return "prepare", prep
+            pc = await gather_results({"ports": actl.allocate_ports(), "crypto": actl.distribute_certs(include_psk=True)})
+            for phase, r in pc.items():
+                if not step_ok(r):
+                    return phase, r.get("error") or r
+            launch = await gather_results({"launch:p2cs": actl.launch_p2cs(), "launch:c2cs": actl.launch_c2cs()})
+            for phase, r in launch.items():
+                if not r.get("ok"):
+                    return phase, r.get("error")
+            ready = await gather_results({"wait:p2cs": actl.wait_gateway("p2cs"), "wait:c2cs": actl.wait_gateway("c2cs"),
+                                          "stage": actl.stage_runner_certs()})
+            for phase, r in ready.items():
+                if not step_ok(r):
+                    return phase, r.get("error") or r
+        return None, None
+
+    @contextlib.asynccontextmanager
+    async def _credentials(self, actl: AsyncStreamController):
+        """
+        The first pair on a gateway (per credential key) prepares it alone, so its cert lands in the
+        cred store once; pairs after it reuse that cert instead of generating their own concurrently
+        """
+        args = actl.args
+        keys = [(actl.ctl._eid(ep), cred_key(args, role)) for role, ep in (("p2cs", args.p2cs_ep), ("c2cs", args.c2cs_ep))]
+        mine = [k for k in keys if k not in self._creds]
+        for k in mine:
+            self._creds[k] = asyncio.Event()
+        for k in keys:
+            if k not in mine:
+                await self._creds[k].wait()
+        try:
+            yield
+        finally:
+            for k in mine:
+                self._creds[k].set()
+
+    async def _connect(self, actl: AsyncStreamController, stream: str, runners: tuple) -> Dict[str, dict]:
+        async with self.limits.hold(runners):
+            return await actl.connect(stream)
+
+    async def cleanup(self) -> Dict[str, dict]:
+        """Tear down every pair session that was started"""
+        return await gather_results({name: actl.cleanup() for name, actl in self.sessions.items()})
+
+    def close(self) -> None:
+        for actl in self.sessions.values():
+            actl.close()
+        remove_endpoint_failure_hook(self._on_endpoint_failure)
+
+
+def format_rows(rows: List[dict]) -> str:
+    """Per-stream result table"""
+    lines = [f"{'pair':<14} {'stream':<14} {'ok':<4} {'phase':<12} {'uid':<36} {'listen':<16} {'dst':<16} error"]
+    for r in sorted(rows, key=lambda r: (r["pair"], r["stream"])):
+        lines.append(f"{r['pair'][:14]:<14} {r['stream'][:14]:<14} {'yes' if r['ok'] else 'NO':<4} {r['phase'] or '-':<12}"
+                     f" {r['uid'] or '-':<36} {','.join(r['listen_ports'])[:16] or '-':<16}"
+                     f" {','.join(map(str, r['outbound_dst_ports'] or []))[:16] or '-':<16} {str(r['error'] or '')[:200]}")
+    return "\n".join(lines)
+
+
+def run(args: argparse.Namespace) -> int:
+    """
+    --campaign entry point: 0 when every stream is up, 2 for a bad spec or failed resolution,
+    4 if any stream failed (its pair's other streams stay up; whole failed pairs are cleaned up)
+    SIGINT/SIGTERM cancel the bring-up and tear down every session started so far (status 1)
+    """
+    try:
+        camp = Campaign(args, load_spec(args.campaign, args))
+        camp.resolve()
+    except (OSError, ValueError, RuntimeError) as e:
+        logging.error("Campaign %s: %s", args.campaign, e)
+        return 2
+    try:
+        rows = asyncio.run(_main(camp))
+    finally:
+        camp.close()
+    if rows is None:
+        return 1
+    logging.info("Campaign results:\n%s", format_rows(rows))
+    if args.campaign_report:
+        with open(args.campaign_report, "w") as fh:
+            json.dump(rows, fh, indent=2)
+    return 0 if all(r["ok"] for r in rows) else 4
+
+
+async def _main(camp: Campaign) -> Optional[List[dict]]:
+    loop = asyncio.get_running_loop()
+    task = asyncio.ensure_future(camp.run())
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, task.cancel)
+    try:
+        return await task
+    except asyncio.CancelledError:
+        logging.warning("Campaign interrupted; cleaning up %d sessions", len(camp.sessions))
+        logging.info("Cleanup: %s", await camp.cleanup())
+        return None
@@ -1,6 +1,9 @@
 from __future__ import annotations
 import argparse
 
+import backends
+import journal
+
 def _csv_ports(s: str) -> list[int]:
     if not s:
         return []
@@ -9,7 +12,41 @@ def _csv_ports(s: str) -> list[int]:
     except ValueError:
         raise argparse.ArgumentTypeError("Ports must be comma-separated integers")
 
-def get_args() -> argparse.Namespace:
+def _stream_spec(s: str) -> dict:
+    """NAME=SRC_PORTS:DST_PORTS, e.g. det1=5074,5075:5100,5101 (num_conn = number of source ports)"""
+    try:
+        name, ports = s.split("=", 1)
+        src, dst = ports.split(":", 1)
+    except ValueError:
+        raise argparse.ArgumentTypeError("Stream must be NAME=SRC_PORTS:DST_PORTS")
+    src_ports, dst_ports = _csv_ports(src), _csv_ports(dst)
+    if not name.strip() or not src_ports or not dst_ports:
+        raise argparse.ArgumentTypeError("Stream must be NAME=SRC_PORTS:DST_PORTS with a name and non-empty port lists")
+    return {"name": name.strip(), "inbound_src_ports": src_ports, "outbound_dst_ports": dst_ports}
+
+def _port_range(s: str) -> tuple[int, int]:
+    """LO-HI, e.g. 5050-5150"""
+    try:
+        lo, hi = (int(v) for v in s.split("-", 1))
+    except ValueError:
+        raise argparse.ArgumentTypeError("Port range must be LO-HI")
+    if not (1 <= lo <= hi <= 65535):
+        raise argparse.ArgumentTypeError("Port range must satisfy 1 <= LO <= HI <= 65535")
+    return lo, hi
+
+def _backend_spec(s: str) -> tuple[str, str]:
+    """ROLE=SPEC, e.g. p2cs=local or inbound=ssh:ops@10.0.0.5 (SPEC: compute, local, ssh:[user@]host[:port])"""
+    role, _, spec = s.partition("=")
+    role = role.strip().lower()
+    if role not in backends.ROLES:
+        raise argparse.ArgumentTypeError(f"Backend role must be one of {', '.join(backends.ROLES)}")
+    try:
+        backends.parse_spec(spec)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return role, spec.strip()
+
+def get_args(argv: list[str] | None = None) -> argparse.Namespace:
     p = argparse.ArgumentParser(description="SciStream Controller")
 
     g_ep = p.add_argument_group("Endpoints")
@@ -17,6 +54,8 @@ def get_args() -> argparse.Namespace:
     g_ep.add_argument("--c2cs-ep", default="neat", help="Consumer-side endpoint name")
     g_ep.add_argument("--inbound-ep", default="swell", help="Endpoint name for running s2uc inbound-request")
     g_ep.add_argument("--outbound-ep", default="swell", help="Endpoint name for running s2uc outbound-request")
+    g_ep.add_argument("--producer-ep", default=None, help="Endpoint on the producer host for data-plane tests (default: --inbound-ep)")
+    g_ep.add_argument("--consumer-ep", default=None, help="Endpoint on the consumer host for data-plane tests (default: --outbound-ep)")
 
     g_net = p.add_argument_group("Network IPs and Ports")
     g_net.add_argument("--p2cs_ip", default="128.135.164.119")
@@ -29,24 +68,124 @@ def get_args() -> argparse.Namespace:
     g_net.add_argument('--outbound_ip', help='outbound IP address', default='128.135.24.118')
     g_net.add_argument("--inbound-src-ports", type=_csv_ports, default="5074,5075,5076,5077,5078,5079,5080,5081,5082,5083,5084")
     g_net.add_argument("--outbound-dst-ports", type=_csv_ports, default="5050,5100,5101,5102,5103,5104,5105,5106,5107,5108,5109,5110")
+    g_net.add_argument("--port-range", type=_port_range, default=(5050, 5150), metavar="LO-HI",
+                       help="Where replacements for busy --outbound-dst-ports are taken from (default matches the firewall rules in setup/)")
+    g_net.add_argument("--contiguous-ports", action="store_true", help="Allocate each stream's consumer-side ports as one consecutive block")
+    g_net.add_argument("--strict-ports", action="store_true", help="Fail if a requested port is busy instead of allocating another one")
+    g_net.add_argument("--port-reservation-ttl", type=float, default=600.0, help="Seconds after which an unreleased port reservation counts as stale")
+    g_net.add_argument("--stream", action="append", type=_stream_spec, metavar="NAME=SRC_PORTS:DST_PORTS",
+                       help="Run several streams over the same gateway pair (repeatable); replaces the single default stream")
 
     g_general = p.add_argument_group("General")
     g_general.add_argument("--type", default="StunnelSubprocess", help="Type of proxy to use")
     g_general.add_argument("--sync-port", type=int, default=5000)
     g_general.add_argument("--rate", type=int, default=10_000)
     g_general.add_argument("--num-conn", type=int, default=11)
+    g_general.add_argument("--tuned", action="store_true", help="Use the num_conn/ports autotune.py saved for this gateway pair (overrides --num-conn and the port lists)")
+    g_general.add_argument("--key-type", choices=("rsa", "ecdsa", "ed25519"), default="rsa", help="Gateway key type; ecdsa (P-256) and ed25519 generate much faster than rsa:2048")
+    g_general.add_argument("--cert-days", type=int, default=365, help="Validity of newly generated gateway certs")
+    g_general.add_argument("--cert-renew-days", type=float, default=7.0, help="Regenerate a stored gateway cert this many days before it expires")
     g_general.add_argument("--psk-secret", default="", help="Optional PSK secret; if empty, skip PSK dist")
+    g_general.add_argument("--log-max-bytes", type=int, default=64 * 1024, help="Most bytes of an s2cs/s2uc log any launch or log-tail call returns")
+    g_general.add_argument("--ready-timeout", type=int, default=45, help="Seconds to wait for s2cs/s2uc readiness markers before failing")
+    g_general.add_argument("--endpoint-cache-ttl", type=float, default=3600.0, help="Seconds a cached endpoint name→ID resolution stays valid (0 = always list)")
+    g_general.add_argument("--probe-cache-ttl", type=float, default=600.0, help="Seconds a successful endpoint probe is trusted (0 = always probe)")
+    g_general.add_argument("--executor-pool-size", type=int, default=8, help="Max pooled Globus Compute executors (one per endpoint)")
+    g_general.add_argument("--executor-idle", type=float, default=300.0, help="Seconds before an idle pooled executor is shut down (0 = never)")
+
+    g_be = p.add_argument_group("Execution backends (see backends.py)")
+    g_be.add_argument("--backend", action="append", type=_backend_spec, metavar="ROLE=SPEC",
+                      help="Run a role's commands locally (local) or over multiplexed SSH (ssh:[user@]host[:port]) "
+                           "instead of through Globus Compute (compute, the default); repeatable, one per role")
+    g_be.add_argument("--ssh-persist", type=int, default=600, help="Seconds an idle SSH master connection stays up for later runs to reuse (0 = until killed)")
+    g_be.add_argument("--ssh-control-dir", default=backends.DEFAULT_CONTROL_DIR, help="Where SSH master control sockets live")
 
     g_paths = p.add_argument_group("Paths")
     g_paths.add_argument("--session-base", default="/tmp/.scistream")
     g_paths.add_argument("--pid-dir", default="/tmp/.scistream", help="Where .pid files are stored")
+    g_paths.add_argument("--cred-dir", default="~/.scistream/creds", help="Gateway-side credential store (reused cert/key pairs + trusted peer certs)")
+    g_paths.add_argument("--endpoint-cache", default="~/.cache/streamhub/endpoints.json", help="Endpoint resolution/probe cache file")
+    g_paths.add_argument("--artifact-dir", default="~/.scistream/artifacts", help="Endpoint-side content-addressed store of staged certs/PSK files (each payload is sent to a host once)")
+
+    g_resume = p.add_argument_group("Resuming sessions (see journal.py)")
+    g_resume.add_argument("--resume", default=None, metavar="SESSION_ID", help="Continue an interrupted session from its journal: steps that still hold on the endpoints are not run again")
+    g_resume.add_argument("--journal-dir", default=journal.DEFAULT_DIR, help="Where session journals are kept")
+    g_resume.add_argument("--no-journal", action="store_true", help="Do not journal the session (it cannot be resumed)")
+    g_resume.add_argument("--keep-on-failure", action="store_true", help="Keep a session whose launch or connect fails (its processes, reservations and journal) for --resume instead of cleaning it up")
+
+    g_daemon = p.add_argument_group("Daemon")
+    g_daemon.add_argument("--daemon", action="store_true", help="Stay up after bring-up and serve a local control API for creating/tearing down streams")
+    g_daemon.add_argument("--control-socket", default=None, help="Unix socket for the control API (default: <session-base>/streamhub.sock)")
+    g_daemon.add_argument("--control-http", default=None, metavar="HOST:PORT", help="Serve the control API over TCP HTTP instead of the Unix socket")
+
+    g_camp = p.add_argument_group("Campaign (see campaign.py)")
+    g_camp.add_argument("--campaign", default=None, metavar="FILE", help="Bring up every gateway pair and stream described in a JSON spec")
+    g_camp.add_argument("--max-parallel", type=int, default=8, help="Most pair bring-ups / stream connects in flight at once")
+    g_camp.add_argument("--max-per-endpoint", type=int, default=4, help="Most pair bring-ups / stream connects touching one endpoint at once")
+    g_camp.add_argument("--campaign-report", default=None, metavar="FILE", help="Write the per-stream results as JSON")
+
+    g_tel = p.add_argument_group("Telemetry (see telemetry.py)")
+    g_tel.add_argument("--telemetry", action="store_true", help="Sample per-connection gateway socket stats after bring-up (one-shot runs stay up and report until Ctrl-C)")
+    g_tel.add_argument("--telemetry-interval", type=float, default=1.0, help="Seconds between socket samples")
+    g_tel.add_argument("--telemetry-batch", type=float, default=5.0, help="Seconds of samples per remote call (how far behind live the buffers may be)")
+    g_tel.add_argument("--telemetry-history", type=int, default=600, help="Samples kept per connection (ring buffer)")
+    g_tel.add_argument("--telemetry-report", type=float, default=30.0, help="Seconds between logged summaries (one-shot runs)")
+    g_tel.add_argument("--stall-after", type=float, default=5.0, help="Seconds with queued data and no progress before a connection counts as stalled")
+    g_tel.add_argument("--slow-ratio", type=float, default=0.5, help="A connection below this fraction of its stream's best connection rate counts as slow")
+
+    g_watch = p.add_argument_group("Watchdog (see watchdog.py)")
+    g_watch.add_argument("--watch", action="store_true", help="Supervise s2cs/s2uc after bring-up: relaunch what died and reconnect its streams (one-shot runs stay up until Ctrl-C)")
+    g_watch.add_argument("--watch-interval", type=float, default=2.0, help="Seconds between health checks")
+    g_watch.add_argument("--watch-max-attempts", type=int, default=3, help="Failed recoveries in a row after which a component is left alone")
+
+    g_sim = p.add_argument_group("Simulation (offline runs, see simcompute.py)")
+    g_sim.add_argument("--sim", action="store_true", help="Run against the simulated Compute backend (local sandboxes, stand-in s2cs/s2uc)")
+    g_sim.add_argument("--sim-profile", default=None, metavar="FILE", help="JSON latency/failure profile for --sim (implies --sim)")
+    g_sim.add_argument("--sim-root", default="/tmp/.streamhub-sim", help="Sandbox root for the simulated backend")
+    g_sim.add_argument("--sim-record", default=None, metavar="FILE", help="Use the real endpoints and record every response to FILE")
+    g_sim.add_argument("--sim-replay", default=None, metavar="FILE", help="Serve responses recorded with --sim-record instead of contacting endpoints")
 
     g_flags = p.add_argument_group("Flags")
     g_flags.add_argument("--cleanup", action="store_true", help="Cleanup the connections from the previous session (if any) before starting a new one")
-    g_flags.add_argument("--no-deep-clean", action='store_true', default=False, help="Cleanup all the connections from the previous session (if any) before starting a new one")
+    g_flags.add_argument("--no-deep-clean", action='store_true', default=False, help="Skip stopping the previous session's processes (the newest marker's; other sessions are never touched) before starting")
+    g_flags.add_argument("--trace", default=None, metavar="FILE", help="Write a Chrome trace-event JSON of every step/remote call and log a timing summary")
+    g_flags.add_argument("--no-endpoint-cache", action="store_true", help="Neither read nor write the endpoint cache")
     g_flags.add_argument("-v", "--verbose", action="store_true")
 
-    args = p.parse_args()
+    args = p.parse_args(argv)
     if not (1 <= args.sync_port <= 65535):
         p.error("--sync-port must be 1..65535")
+    if args.executor_pool_size < 1:
+        p.error("--executor-pool-size must be >= 1")
+    if args.sim_record and (args.sim_replay or args.sim or args.sim_profile):
+        p.error("--sim-record talks to the real endpoints; it cannot be combined with --sim/--sim-profile/--sim-replay")
+    if args.control_http:
+        host, _, port = args.control_http.rpartition(":")
+        if not host or not port.isdigit():
+            p.error("--control-http must be HOST:PORT")
+    if args.max_parallel < 1 or args.max_per_endpoint < 1:
+        p.error("--max-parallel and --max-per-endpoint must be >= 1")
+    if args.campaign and (args.daemon or args.stream):
+        p.error("--campaign cannot be combined with --daemon or --stream (put streams in the spec)")
+    if args.watch and args.campaign:
+        p.error("--watch cannot be combined with --campaign")
+    if args.resume and (args.campaign or args.stream or args.no_journal):
+        p.error("--resume cannot be combined with --campaign, --stream (the streams come from the journal) or --no-journal")
+    if args.keep_on_failure and args.no_journal:
+        p.error("--keep-on-failure needs the journal to resume from; it cannot be combined with --no-journal")
+    if args.watch_interval <= 0 or args.watch_max_attempts < 1:
+        p.error("--watch-interval must be > 0 and --watch-max-attempts >= 1")
+    if args.log_max_bytes < 1024:
+        p.error("--log-max-bytes must be >= 1024")
+    if args.telemetry_interval <= 0 or args.telemetry_history < 2:
+        p.error("--telemetry-interval must be > 0 and --telemetry-history >= 2")
+    roles = [role for role, _ in args.backend or []]
+    if len(roles) != len(set(roles)):
+        p.error("--backend takes each role at most once")
+    args.backend = dict(args.backend or [])
+    if args.ssh_persist < 0:
+        p.error("--ssh-persist must be >= 0")
+    names = [st["name"] for st in args.stream or []]
+    if len(names) != len(set(names)):
+        p.error("--stream names must be unique")
     return args
\ No newline at end of file
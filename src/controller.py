@@ -1,15 +1,88 @@
 from __future__ import annotations
-import argparse, logging, os, re, base64
+import argparse, logging, os, re, uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Dict
 
 from globus_compute_sdk import Client
 
 # Local utilities: process/session helpers and crypto distribution
 from util import make_session_id, session_dir, run_remote
-from util import key_gen, crt_dist, key_dist
+from util import key_gen, key_dist, key_gen_script, parse_key_gen, cred_key, trust_file
+from util import call_remote, stage_remote_files, peer_cert_file, psk_file, add_endpoint_failure_hook
+from util import new_client, remove_endpoint_failure_hook, ports_for
+from epcache import EndpointCache, DEFAULT_PATH as EP_CACHE_PATH
+from journal import SessionJournal, DEFAULT_DIR as JOURNAL_DIR
+import backends, remote_fns
+from batch import RemoteBatch
+from logtail import LogTail, LOG_MAX_BYTES
+from scheduler import StepScheduler, run_parallel
+from tracing import traced
 import launcher as setup_mod
 
 
+DEFAULT_STREAM = "default"
+_STREAM_NAME = re.compile(r"^[A-Za-z0-9_.-]+$")
+_LOG_NAME = re.compile(r"^(p2cs|c2cs|(inbound|outbound)(-[A-Za-z0-9_.-]+)?)$")
+
+
+# Process stoppers prepended to teardown / clean scripts (no single quotes: run_remote wraps in bash -c '...')
+# - stop_pidfiles MS FILE...: TERM every live PID in FILEs; a PID that leads its process group (setsid-launched
+#   s2cs/s2uc) is signalled as a group, so the proxies it spawned go with it. Exit is polled with a 10ms→100ms
+#   backoff (no fixed sleeps); what is still alive after MS milliseconds gets KILL ('KILLED <pid>'); FILEs are removed
+# - await_unbound MS IP:PORT...: wait until none of the addresses is in LISTEN state (a wildcard listener on the
+#   port counts; IP '*' matches any address); prints 'BUSY <ip:port>' for each one still bound after MS milliseconds
+_STOPPERS = r"""
+__live() {
+    ps -e -o pid=,pgid=,stat= 2>/dev/null | awk -v t="$*" "BEGIN { n = split(t, a, \" \"); for (i = 1; i <= n; i++) w[a[i]] = 1 }
+        \$3 !~ /^Z/ { if ((\"-\" \$2) in w) print \"-\" \$2; if (\$1 in w) print \$1 }" | sort -u
+}
+__backoff() {
+    sleep "$__d"; __d=$(awk -v d="$__d" "BEGIN { d *= 2; print (d > 0.1 ? 0.1 : d) }")
+}
+stop_pidfiles() {
+    local ms="$1"; shift
+    local targets="" f pid pg end t
+    for f in "$@"; do
+        [ -f "$f" ] || continue
+        pid="$(cat "$f" 2>/dev/null || true)"
+        [[ "$pid" =~ ^[0-9]+$ ]] && kill -0 "$pid" 2>/dev/null || continue
+        pg="$(ps -o pgid= -p "$pid" 2>/dev/null | tr -d " " || true)"
+        if [ "$pg" = "$pid" ]; then t="-$pid"; else t="$pid"; fi
+        kill -TERM -- "$t" 2>/dev/null || true
+        targets="$targets $t"
+    done
+    end=$(( $(date +%s%N) + ms * 1000000 )); __d=0.01
+    while [ -n "$targets" ]; do
+        targets="$(__live $targets)"
+        [ -n "$targets" ] || break
+        if [ "$(date +%s%N)" -ge "$end" ]; then
+            for t in $targets; do kill -KILL -- "$t" 2>/dev/null || true; echo "KILLED $t"; done
+            break
+        fi
+        __backoff
+    done
+    [ $# -eq 0 ] || rm -f "$@"
+}
+await_unbound() {
+    local ms="$1"; shift
+    [ $# -gt 0 ] || return 0
+    local end=$(( $(date +%s%N) + ms * 1000000 )) busy a; __d=0.01
+    while :; do
+        busy="$(ss -Hltn 2>/dev/null | awk -v t="$*" "BEGIN { n = split(t, a, \" \"); for (i = 1; i <= n; i++) w[a[i]] = 1 }
+            { ip = \$4; p = \$4; sub(/:[^:]*\$/, \"\", ip); sub(/.*:/, \"\", p); gsub(/[][]/, \"\", ip); sub(/%.*/, \"\", ip)
+              for (k in w) { q = k; sub(/.*:/, \"\", q); h = k; sub(/:[^:]*\$/, \"\", h)
+                if (q == p && (h == ip || h == \"*\" || ip == \"*\" || ip == \"0.0.0.0\" || ip == \"::\")) print k } }" | sort -u)"
+        [ -n "$busy" ] || return 0
+        if [ "$(date +%s%N)" -ge "$end" ]; then
+            for a in $busy; do echo "BUSY $a"; done
+            return 0
+        fi
+        __backoff
+    done
+}
+"""
+
+
 def _normalize(s: str) -> str:
     """Normalize endpoints's name to a lookup key: lowercase, strip, remove non-alphanum"""
     return re.sub(r"[^a-z0-9]+", "", (s or "").strip().lower())
@@ -24,36 +97,226 @@ class StreamController:
     - Generate TLS certs on gateways and cross-distribute peer cert trust; optional PSK
     - Launch s2cs on both gateways; wait for sync ports to be reachable
     - Run s2uc inbound (parse UID + listen ports), then run s2uc outbound
+    - Manage N streams over the one gateway pair: each stream has its own ports,
+      UID and s2uc processes, while crypto and the s2cs launch are shared
     - Provide utilities for pre-cleaning and post-session cleanup
     """
 
-    def __init__(self, args: argparse.Namespace):
+    def __init__(self, args: argparse.Namespace, *, default_stream: bool = True,
+                 endpoints: Dict[str, str] | None = None, resume: SessionJournal | None = None):
+        """
+        endpoints: {role: endpoint ID} the caller already resolved and probed (campaign.py shares one
+        resolution across many controllers); those roles are neither resolved nor probed again
+        resume: the journal of an earlier session to continue (--resume): its session ID, paths, certs,
+        endpoints and streams are taken over; resume_check then tells which of its steps still hold
+        Raises ValueError if args changed a setting the journaled session depends on (journal.SETTINGS)
+        """
+        if resume is not None:
+            changed = resume.mismatched(args)
+            if changed:
+                raise ValueError(f"Cannot resume session {resume.session_id} with different "
+                                 f"{', '.join('--' + k for k in changed)}")
+            endpoints = {**resume.known_endpoints(args), **(endpoints or {})}
         self.args = args
-        self.client = Client()
+        self._client: Client | None = None
+
+        # Name→ID resolutions and recent probes persist across runs (None when disabled)
+        self.ep_cache: EndpointCache | None = None
+        if not getattr(args, "no_endpoint_cache", False):
+            self.ep_cache = EndpointCache(getattr(args, "endpoint_cache", None) or EP_CACHE_PATH,
+                                          ttl_s=getattr(args, "endpoint_cache_ttl", 3600.0),
+                                          probe_ttl_s=getattr(args, "probe_cache_ttl", 600.0))
+        # Endpoints whose ID or probe came from the cache; a failure on one of them invalidates it
+        self._cached_eids: set[str] = set()
 
         # Discover and sanity-check all endpoints
-        self.endpoints = self._resolve_and_probe_endpoints()
+        self.endpoints = self._resolve_and_probe_endpoints(endpoints or {})
+        if self.ep_cache is not None:
+            add_endpoint_failure_hook(self._on_endpoint_failure)
+        if getattr(args, "tuned", False):
+            self.args = self._apply_tuning(args)
 
-        # Create unique session paths/ids and marker naming
-        self.session_id = make_session_id()
-        self.sess_dir = session_dir(getattr(args, "session_base", None), self.session_id)
+        # Create unique session paths/ids and marker naming (a resumed session keeps its own)
+        self.session_id = resume.session_id if resume else make_session_id()
+        self.sess_dir = resume.data["sess_dir"] if resume else session_dir(getattr(args, "session_base", None),
+                                                                            self.session_id)
         self.pid_dir = os.path.expanduser(getattr(args, "pid_dir", "/tmp/.scistream"))
         self.marker_name = f".session-{self.session_id}.mark"
 
         # Certs produced during setup_crypto(); kept in memory for staging on runners
         self.p2cs_cert_pem: str | None = None
         self.c2cs_cert_pem: str | None = None
+        # Peer cert fingerprint each gateway confirmed it already trusts (set by prepare_gateways)
+        self._peer_trusted: Dict[str, str | None] = {"p2cs": None, "c2cs": None}
+
+        # Streams over this gateway pair; each tracks its own ports, UID and listen ports
+        # (parsed from inbound-request, consumed by outbound-request)
+        self.streams: Dict[str, dict] = {}
+        specs = getattr(args, "stream", None) or []
+        if resume is not None:
+            self._restore_streams(resume)
+        elif specs:
+            for spec in specs:
+                self.add_stream(**spec)
+        elif default_stream:
+            self.add_stream(DEFAULT_STREAM)
+
+        # Shared connect prerequisites; once done, adding a stream costs only the s2uc round-trips
+        self._gateway_ready: Dict[str, bool] = {"p2cs": False, "c2cs": False}
+        # s2cs launched in this session and not stopped since (what watchdog.py supervises)
+        self._gateway_up: Dict[str, bool] = {"p2cs": False, "c2cs": False}
+        self._runner_certs_staged = False
+        # PID each launched s2cs reported (journaled; --resume checks the pidfile still names it)
+        self._gateway_pid: Dict[str, int | None] = {"p2cs": None, "c2cs": None}
+
+        # Durable record of the session's progress (journal.py); None with --no-journal
+        self.journal: SessionJournal | None = resume
+        if resume is not None:
+            certs = resume.data.get("certs") or {}
+            self.p2cs_cert_pem, self.c2cs_cert_pem = certs.get("p2cs"), certs.get("c2cs")
+        elif not getattr(args, "no_journal", False):
+            self.journal = SessionJournal(SessionJournal.path_for(getattr(args, "journal_dir", None) or JOURNAL_DIR,
+                                                                  self.session_id))
 
         logging.info("Session directory: %s", self.sess_dir)
         logging.info("PID directory: %s", self.pid_dir)
 
+    def _apply_tuning(self, args: argparse.Namespace) -> argparse.Namespace:
+        """
+        --tuned: replace --num-conn and the port lists by the values autotune.py saved for this
+        gateway pair (a copy of args is returned; unchanged when nothing was saved)
+        """
+        saved = None
+        if self.ep_cache is not None:
+            saved = self.ep_cache.tuning(self._eid(args.p2cs_ep), self._eid(args.c2cs_ep))
+        if not saved:
+            logging.warning("--tuned: no saved tuning for %s -> %s; using --num-conn %s",
+                            args.p2cs_ep, args.c2cs_ep, args.num_conn)
+            return args
+        logging.info("Using tuned settings for %s -> %s: num_conn=%s (%.2f Gbps measured, %s)",
+                     args.p2cs_ep, args.c2cs_ep, saved["num_conn"], saved.get("gbps") or 0, saved.get("mode"))
+        return argparse.Namespace(**{**vars(args), "num_conn": int(saved["num_conn"]),
+                                     "inbound_src_ports": list(saved["inbound_src_ports"]),
+                                     "outbound_dst_ports": list(saved["outbound_dst_ports"])})
+
+    # ---------------------------------- Streams ---------------------------------
+
+    def add_stream(self, name: str, *, inbound_src_ports: list[int] | None = None,
+                   outbound_dst_ports: list[int] | None = None, num_conn: int | None = None,
+                   **overrides) -> dict:
+        """
+        Register a stream over this gateway pair (not connected yet)
+        - Ports default to the CLI ports; num_conn defaults to the number of inbound ports
+          (or --num-conn for the default stream)
+        - Other per-stream overrides (e.g. prod_ip, cons_ip) are applied on top of the CLI args
+        - Requested outbound ports must not overlap with another stream's
+        """
+        if not _STREAM_NAME.match(name or ""):
+            raise ValueError(f"Invalid stream name {name!r} (use letters, digits, '_', '.', '-')")
+        if name in self.streams:
+            raise ValueError(f"Stream '{name}' already exists")
+        src = list(inbound_src_ports if inbound_src_ports is not None else self.args.inbound_src_ports)
+        dst = list(outbound_dst_ports if outbound_dst_ports is not None else self.args.outbound_dst_ports)
+        if num_conn is None:
+            num_conn = self.args.num_conn if inbound_src_ports is None else len(src)
+        self._check_overlap(name, dst)
+        sargs = argparse.Namespace(**{**vars(self.args), **overrides,
+                                      "inbound_src_ports": src, "outbound_dst_ports": dst, "num_conn": int(num_conn)})
+        st = {
+            "name": name,
+            # File tag for logs/pids: the default stream keeps the historic inbound.log/outbound.log names
+            "tag": "" if name == DEFAULT_STREAM else name,
+            "args": sargs,
+            "uid": None,
+            "listen_ports": [],
+            # Consumer-side ports reserved on c2cs by allocate_ports()
+            "reserved": [],
+            "connected": False,
+            # PIDs the s2uc requests reported ({'inbound', 'outbound'}; journaled)
+            "pids": {},
+        }
+        self.streams[name] = st
+        return st
+
+    def _restore_streams(self, journal: SessionJournal) -> None:
+        """Re-register the journaled streams with their ports, reservation, UID and listen ports (--resume)"""
+        for name, saved in (journal.data.get("streams") or {}).items():
+            st = self.add_stream(name, inbound_src_ports=saved["inbound_src_ports"],
+                                 outbound_dst_ports=saved["outbound_dst_ports"], num_conn=saved["num_conn"],
+                                 **saved.get("overrides", {}))
+            st.update(reserved=list(saved.get("reserved") or []), uid=saved.get("uid"),
+                      listen_ports=list(saved.get("listen_ports") or []), connected=bool(saved.get("connected")),
+                      pids=dict(saved.get("pids") or {}))
+
+    def _check_overlap(self, name: str, dst: list[int]) -> None:
+        """Raise ValueError if outbound ports dst clash with another stream's"""
+        for other in self.streams.values():
+            clash = set(dst) & set(other["args"].outbound_dst_ports)
+            if other["name"] != name and clash:
+                raise ValueError(f"Stream '{name}' outbound ports overlap with stream '{other['name']}': "
+                                 f"{','.join(map(str, sorted(clash)))}")
+
+    def _stream(self, name: str | None) -> dict:
+        if name is None:
+            return next(iter(self.streams.values()))
+        try:
+            return self.streams[name]
+        except KeyError:
+            raise KeyError(f"Unknown stream '{name}'") from None
+
+    @property
+    def stream_uid(self) -> str | None:
+        """UID of the first stream (single-stream sessions)"""
+        return self._stream(None)["uid"] if self.streams else None
+
+    @property
+    def listen_ports(self) -> list[str]:
+        """Inbound listen ports of the first stream (single-stream sessions)"""
+        return self._stream(None)["listen_ports"] if self.streams else []
+
+    def list_streams(self) -> list[dict]:
+        """Summary of every stream: name, ports, UID, listen ports, connected flag"""
+        return [
+            {
+                "name": st["name"],
+                "inbound_src_ports": st["args"].inbound_src_ports,
+                "outbound_dst_ports": st["args"].outbound_dst_ports,
+                "num_conn": st["args"].num_conn,
+                "uid": st["uid"],
+                "listen_ports": st["listen_ports"],
+                "reserved": st["reserved"],
+                "connected": st["connected"],
+            }
+            for st in self.streams.values()
+        ]
+
     # ----------------------- Endpoint Resolution & Probing -----------------------
 
-    def _resolve_and_probe_endpoints(self) -> Dict[str, str]:
+    @property
+    def client(self) -> Client:
+        """Globus Compute client, created on first use (not needed when every role resolves from the cache)"""
+        if self._client is None:
+            self._client = new_client()
+        return self._client
+
+    def _on_endpoint_failure(self, eid: str, err: Exception) -> None:
+        """Drop a cached endpoint after a failed submission so the next run lists and probes again"""
+        if eid in self._cached_eids and self.ep_cache.invalidate(eid):
+            self._cached_eids.discard(eid)
+            logging.warning("Endpoint %s failed (%s); dropped it from the endpoint cache", eid, err)
+            self.ep_cache.save()
+
+    @traced()
+    def _resolve_and_probe_endpoints(self, known: Dict[str, str]) -> Dict[str, str]:
         """
         Resolve 4 roles to concrete endpoint IDs, then actively probe each
         Gateways ('p2cs','c2cs') are stored under their *names* (lowercased),
-        runners are stored under fixed keys ('inbound','outbound')
+        runners are stored under fixed keys ('inbound','outbound'), as are the
+        optional producer/consumer hosts ('producer','consumer')
+        With the endpoint cache, fresh resolutions skip the endpoint listing and
+        endpoints probed within the probe TTL are not probed again; roles in known are taken as they are
+        Roles moved to a local/SSH backend (--backend) use the backend's endpoint ID: never resolved
+        or cached, always probed (an SSH probe also opens the master connection)
         """
         roles = {
             "p2cs": (self.args.p2cs_ep, getattr(self.args, "p2cs_id", "")),
@@ -61,24 +324,90 @@ class StreamController:
             "inbound": (self.args.inbound_ep, getattr(self.args, "inbound_id", "")),
             "outbound": (self.args.outbound_ep, getattr(self.args, "outbound_id", "")),
         }
+        direct = backends.role_endpoints(self.args)
+        # Producer/consumer hosts only take part in data-plane tests, and only when named explicitly
+        for role in ("producer", "consumer"):
+            if getattr(self.args, f"{role}_ep", None) or role in direct:
+                roles[role] = (getattr(self.args, f"{role}_ep", None) or role, getattr(self.args, f"{role}_id", ""))
+        direct = {role: eid for role, eid in direct.items() if role in roles and role not in known}
+
+        cache = self.ep_cache
+        cached: Dict[str, str] = {}
+        if cache is not None:
+            for role, (name, eid_arg) in roles.items():
+                if role in known or role in direct:
+                    continue
+                eid = eid_arg or cache.resolution(_normalize(name))
+                if eid:
+                    cached[role] = eid
+                    if not eid_arg:
+                        logging.info("[%s] Resolved from endpoint cache: %s -> %s", role, name, eid)
 
-        # Visible endpoints for the current identity
-        visible = list(self.client.get_endpoints())
-        name_to_id = self._build_name_index(visible)
+        # Visible endpoints for the current identity (only listed if some role is not cached)
+        visible: list[dict] = []
+        name_to_id: dict[str, str] = {}
+        if len(cached) + len(direct) + len(known.keys() & roles.keys()) < len(roles):
+            visible = list(self.client.get_endpoints())
+            name_to_id = self._build_name_index(visible)
+
+        # Resolve name/ID with tolerant matching
+        role_eids = {role: known.get(role) or direct.get(role) or cached.get(role)
+                     or self._resolve_single(role, name, eid_arg, name_to_id, visible)
+                     for role, (name, eid_arg) in roles.items()}
+
+        # Verify each UNIQUE endpoint runs a command (roles sharing a host share one probe)
+        to_probe: Dict[str, list] = {}
+        for role, eid in role_eids.items():
+            name = roles[role][0]
+            if role in known:
+                continue
+            if role not in direct and cache is not None and cache.probe_ok(eid):
+                logging.info("[%s] Probe skipped (cached): %s (%s)", role, name, eid)
+                self._cached_eids.add(eid)
+            else:
+                to_probe.setdefault(eid, []).append((role, name))
+        self._probe_all(to_probe)
 
         resolved: Dict[str, str] = {}
         for role, (name, eid_arg) in roles.items():
-            # Resolve name/ID with tolerant matching, then verify it runs a command
-            eid = self._resolve_single(role, name, eid_arg, name_to_id, visible)
-            self._probe_or_raise(role, name, eid)
+            eid = role_eids[role]
+            if cache is not None and role not in known and role not in direct:
+                # Entries are only (re)stamped when actually looked up/probed, so the TTL bounds their age
+                if role in cached:
+                    self._cached_eids.add(eid)
+                elif not eid_arg:
+                    cache.put_resolution(_normalize(name), eid)
+                if eid in to_probe:
+                    cache.put_probe(eid)
 
             # Store gateways under their names, runners under fixed keys
             if role in ("p2cs", "c2cs"):
                 resolved[name.lower()] = eid
             else:
                 resolved[role] = eid
+        if cache is not None:
+            cache.save()
         return resolved
 
+    def _probe_all(self, targets: Dict[str, list]) -> None:
+        """
+        Probe every endpoint in targets ({eid: [(role, name), ...]}) concurrently
+        Raises on the first failure as soon as it is known, without waiting for the slower probes
+        """
+        if not targets:
+            return
+        pool = ThreadPoolExecutor(max_workers=len(targets))
+        futs = {
+            pool.submit(self._probe_or_raise, "+".join(r for r, _ in users), "/".join(sorted({n for _, n in users})), eid): eid
+            for eid, users in targets.items()
+        }
+        try:
+            for fut in as_completed(futs):
+                fut.result()
+        finally:
+            # On failure, leave outstanding probes behind instead of blocking on their timeouts
+            pool.shutdown(wait=False, cancel_futures=True)
+
     @staticmethod
     def _build_name_index(visible: list[dict]) -> dict[str, str]:
         """Build {normalized_name: endpoint_id} for quick exact/prefix/substring lookup"""
@@ -90,8 +419,8 @@ class StreamController:
                 idx[_normalize(nm)] = eid
         return idx
 
+    @staticmethod
     def _resolve_single(
-        self,
         role: str,
         wanted_name: str,
         wanted_id: str,
@@ -165,6 +494,10 @@ class StreamController:
         """Lookup runner endpoint ID by fixed key: 'inbound' or 'outbound'"""
         return self.endpoints[which]
 
+    def host_eid(self, side: str) -> str:
+        """Endpoint ID on the 'producer' or 'consumer' host (falls back to the inbound/outbound runner)"""
+        return self.endpoints.get(side) or self._runner_eid("inbound" if side == "producer" else "outbound")
+
     def sanity_check(self):
         """Quick smoke test on the two gateways, ensure remote exec path works"""
         for role, ep in [("p2cs", self.args.p2cs_ep), ("c2cs", self.args.c2cs_ep)]:
@@ -173,74 +506,107 @@ class StreamController:
             out = (r.get("stdout") or "").strip()
             print(f"[{role}] endpoint {ep} ({uuid}) responded: {out}")
 
-    # ----------------------- Port Availability Check -----------------------------
-
-    def _check_remote_ports_free(self, endpoint_id: str, ports: list[int], label: str) -> dict:
-        """
-        On an endpoint, attempt to bind each port on 0.0.0.0 (wildcard)
-        Any bind failure marks the port as BUSY
-        Prints 'OK' or 'BUSY:x,y,...'
-        """
-        #TODO: if the ports are busy, ignore the ports, run the s2cs and get the new ports
-        port_list = ",".join(str(int(p)) for p in ports)
-        script = f"""
-python3 - <<'PY'
-import socket, sys
-ip = "0.0.0.0"
-ports = [{port_list}]
-busy = []
-for p in ports:
-    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    try:
-        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        s.bind((ip, p))   # if this fails, the port is taken or not bindable
-    except OSError:
-        busy.append(p)
-    finally:
-        try: s.close()
-        except: pass
-if busy:
-    print("BUSY:" + ",".join(map(str, busy)))
-    sys.exit(1)
-print("OK")
-PY
-"""
-        return run_remote(endpoint_id, f"PORTS:check:{label}", script)
+    # ------------------------------ Port Allocation ------------------------------
 
-    def verify_requested_ports_available(self) -> None:
+    @property
+    def _resv_dir(self) -> str:
+        """Port reservation directory on the gateways (shared by every controller using this pid dir)"""
+        return f"{self.pid_dir}/ports"
+
+    def _port_owner(self, name: str) -> str:
+        return f"{self.session_id}:{name}"
+
+    @traced()
+    def allocate_ports(self, stream: str | None = None) -> Dict[str, dict]:
         """
-        Fail fast if any requested outbound ports appear busy on either gateway
-        (Adjust here if inbound/outbound ports should be checked on different runners)
+        Reserve the consumer-side ports (outbound_dst_ports, bound by c2cs) on the c2cs gateway for every
+        stream without a reservation yet (or for the given one), in one call
+        - Free requested ports are kept; busy or reserved ones are replaced from --port-range
+          (--contiguous-ports: the set is one block of consecutive ports), and the stream's
+          outbound_dst_ports are updated so launcher.outbound requests exactly what was reserved
+        - --strict-ports restores fail-fast: any busy requested port fails the allocation
+        - Reservations stop other controllers on the host from taking the ports before c2cs binds them;
+          they are released by disconnect_stream / stop_gateways (and by the next session's cleanup)
+        inbound_src_ports belong to the producer application and are passed to s2uc unchanged
+        Returns {stream: {'ports', 'replaced'}}; raises RuntimeError if any stream could not be served
         """
-        for role, ep_name in (("p2cs", self.args.p2cs_ep), ("c2cs", self.args.c2cs_ep)):
-            ports = getattr(self.args, "outbound_dst_ports", []) or []
-            if ports:
-                r = self._check_remote_ports_free(self._eid(ep_name), ports, role)
-                out = (r.get("stdout") or "").strip()
-                if (not r.get("ok")) or out.startswith("BUSY:"):
-                    busy = out.split("BUSY:", 1)[1] if "BUSY:" in out else "unknown"
-                    raise RuntimeError(f"Requested ports not free on {ep_name}: {busy}")
+        streams = self._ports_to_allocate(stream)
+        if not streams:
+            return {}
+        args, kwargs = self._reserve_call(streams)
+        return self._apply_allocation(streams, call_remote(*args, **kwargs))
+
+    def _ports_to_allocate(self, stream: str | None) -> list[dict]:
+        streams = [self._stream(stream)] if stream is not None else [st for st in self.streams.values() if not st["reserved"]]
+        return [st for st in streams if st["args"].outbound_dst_ports]
+
+    def _reserve_call(self, streams: list[dict]) -> tuple[tuple, dict]:
+        """(args, kwargs) of the call_remote that reserves ports for streams"""
+        return self._reserve_requests_call(
+            [{"owner": self._port_owner(st["name"]), "preferred": list(st["args"].outbound_dst_ports)} for st in streams])
+
+    def _reserve_requests_call(self, requests: list[dict]) -> tuple[tuple, dict]:
+        """(args, kwargs) of the call_remote that serves remote_fns.reserve_ports requests on c2cs"""
+        return ((self._eid(self.args.c2cs_ep), "PORTS:reserve", remote_fns.reserve_ports, requests,
+                 self.args.c2cs_listener, list(self.args.port_range), self._resv_dir),
+                {"ttl_s": float(self.args.port_reservation_ttl), "contiguous": bool(self.args.contiguous_ports),
+                 "strict": bool(self.args.strict_ports)})
+
+    def _apply_allocation(self, streams: list[dict], r: dict) -> Dict[str, dict]:
+        """Record a reserve_ports result on the streams (see allocate_ports)"""
+        if not r.get("ok"):
+            raise RuntimeError(f"Port allocation failed on {self.args.c2cs_ep}: {r.get('error')}")
+        res = r.get("result") or {}
+        out: Dict[str, dict] = {}
+        for st in streams:
+            alloc = (res.get("allocations") or {}).get(self._port_owner(st["name"]))
+            if not alloc:
+                continue
+            if alloc["replaced"] or alloc["ports"] != list(st["args"].outbound_dst_ports):
+                logging.warning("Stream %s: requested ports %s not available on %s; using %s",
+                                st["name"], ",".join(map(str, st["args"].outbound_dst_ports)), self.args.c2cs_ep,
+                                ",".join(map(str, alloc["ports"])))
+            st["args"].outbound_dst_ports = list(alloc["ports"])
+            st["reserved"] = list(alloc["ports"])
+            out[st["name"]] = alloc
+        errors = res.get("errors") or {}
+        self._journal("ports", not errors)
+        if errors:
+            raise RuntimeError(f"Port allocation failed on {self.args.c2cs_ep}: "
+                               + "; ".join(f"{o.split(':', 1)[1]}: {e}" for o, e in errors.items()))
+        return out
+
+    def _release_ports(self, owner: str, ports: list[int] | None = None) -> dict:
+        return call_remote(*self._release_call(owner, ports))
+
+    def _release_call(self, owner: str, ports: list[int] | None = None) -> tuple:
+        return self._eid(self.args.c2cs_ep), "PORTS:release", remote_fns.release_ports, self._resv_dir, owner, ports
 
     # ------------------------------ Markers -------------------------------------
 
+    @traced()
     def create_remote_markers(self) -> Dict[str, dict]:
         """
         Create per-session marker files on both gateways (in real PID dir)
         These markers bound the set of PIDs we consider "owned by this session"
         """
-        results: Dict[str, dict] = {}
-        for ep_name, role in ((self.args.p2cs_ep, "producer"), (self.args.c2cs_ep, "consumer")):
-            uuid = self._eid(ep_name)
-            script = f"""
+        script = self._marker_script()
+        gateways = ((self.args.p2cs_ep, "producer"), (self.args.c2cs_ep, "consumer"))
+        results: Dict[str, dict] = run_parallel({
+            role: (lambda role=role, ep_name=ep_name: run_remote(self._eid(ep_name), f"MARKER:{role}", script))
+            for ep_name, role in gateways
+        })
+        for ep_name, role in gateways:
+            if not results[role].get("ok"):
+                logging.error("Failed to create marker on %s (%s): %s", role, ep_name, results[role])
+        return results
+
+    def _marker_script(self) -> str:
+        return f"""
             mkdir -p "{self.pid_dir}"
             touch "{self.pid_dir}/{self.marker_name}"
             echo "OK"
             """
-            r = run_remote(uuid, f"MARKER:{role}", script)
-            results[role] = r
-            if not r.get("ok"):
-                logging.error("Failed to create marker on %s (%s): %s", role, ep_name, r)
-        return results
 
     def _find_latest_marker_name(self, endpoint_id: str) -> str | None:
         """Return basename of newest .session-*.mark in pid_dir on the remote host, or None"""
@@ -257,244 +623,989 @@ PY
     @staticmethod
     def stop_since_marker(endpoint_name: str, uuid: str, *, pid_dir: str, marker: str, timeout_s: int = 5) -> dict:
         """
-        Kill processes tracked by *.pid files that are NEWER than a given marker file.
-        - Soft kill, wait up to timeout_s, then hard kill survivors
+        Stop processes tracked by *.pid files that are NEWER than a given marker file
+        - TERM (the whole process group for setsid-launched ones), wait for exit up to timeout_s, then KILL survivors
         - Only affects PIDs whose .pid files are newer than pid_dir/marker
         """
-        script = f"""
-                set -e
+        script = StreamController._stop_since_marker_script(pid_dir, marker, timeout_s)
+        return run_remote(uuid, f"KILL:{endpoint_name}", script)
+
+    @staticmethod
+    def _stop_since_marker_script(pid_dir: str, marker: str, timeout_s: float = 5, *, also: str = "") -> str:
+        """
+        Shell body of stop_since_marker; 'marker' may be a shell expression such as $latest
+        also: further pidfile globs stopped regardless of age (a previous session's procs dir)
+        """
+        return _STOPPERS + f"""
                 m="{pid_dir}/{marker}"
                 [ -f "$m" ] || touch "$m"
-                if compgen -G "{pid_dir}/*.pid" > /dev/null; then
-                for f in {pid_dir}/*.pid; do
-                    [ -f "$f" ] || continue
-                    if [ "$f" -nt "$m" ]; then
-                    pid="$(cat "$f" || true)"
-                    if [ -n "$pid" ] && kill -0 "$pid" 2>/dev/null; then kill "$pid" || true; fi
-                    fi
-                done
-                end=$(( $(date +%s) + {timeout_s} ))
-                while [ $(date +%s) -lt $end ]; do
-                    alive=0
-                    for f in {pid_dir}/*.pid; do
-                    [ -f "$f" ] || continue
-                    if [ "$f" -nt "$m" ]; then
-                        pid="$(cat "$f" || true)"
-                        if [ -n "$pid" ] && kill -0 "$pid" 2>/dev/null; then alive=1; fi
-                    fi
-                    done
-                    [ $alive -eq 0 ] && break
-                    sleep 1
-                done
-                for f in {pid_dir}/*.pid; do
-                    [ -f "$f" ] || continue
-                    if [ "$f" -nt "$m" ]; then
-                    pid="$(cat "$f" || true)"
-                    if [ -n "$pid" ] && kill -0 "$pid" 2>/dev/null; then kill -9 "$pid" || true; fi
-                    fi
-                done
-                fi
+                shopt -s nullglob
+                files=()
+                for f in "{pid_dir}"/*.pid; do [ "$f" -nt "$m" ] && files+=("$f"); done
+                files+=({also})
+                stop_pidfiles {int(timeout_s * 1000)} "${{files[@]}}"
                 echo "OK"
                 """
-        return run_remote(uuid, f"KILL:{endpoint_name}", script)
 
+    def _preclean_script(self) -> str:
+        """
+        _find_latest_marker_name + stop_since_marker fused into one remote script
+        The previous session is the one named by the newest marker: its procs dir (session_base/<id>/procs)
+        and any newer pidfile in pid_dir are stopped, and its port reservations are dropped
+        Prints SKIPPED when there is no prior marker
+        """
+        base = (getattr(self.args, "session_base", None) or "/tmp/.scistream").rstrip("/")
+        return f"""
+                latest="$(ls -1t "{self.pid_dir}"/.session-*.mark 2>/dev/null | head -n1 || true)"
+                if [ -z "$latest" ]; then echo "SKIPPED"; exit 0; fi
+                latest="$(basename "$latest")"
+                sid="${{latest#.session-}}"; sid="${{sid%.mark}}"
+                for f in "{self._resv_dir}"/*; do if [ -f "$f" ] && grep -q "^$sid:" "$f"; then rm -f "$f"; fi; done
+                {self._stop_since_marker_script(self.pid_dir, "$latest", also=f'"{base}/$sid/procs"/*.pid')}
+                """
+
+    @staticmethod
+    def _parse_preclean(r: dict) -> dict:
+        if r.get("ok") and (r.get("stdout") or "").strip() == "SKIPPED":
+            return {"ok": True, "skipped": True, "reason": "no prior marker"}
+        return r
+
+    @traced()
     def preclean_previous_session(self) -> dict:
         """
         For each gateway, if a previous marker exists
-        kill any tracked processes newer than that marker
-        """
-        results = {}
-        for role, ep_name in (("p2cs", self.args.p2cs_ep), ("c2cs", self.args.c2cs_ep)):
-            eid = self._eid(ep_name)
-            latest = self._find_latest_marker_name(eid)
-            if not latest:
-                results[role] = {"ok": True, "skipped": True, "reason": "no prior marker"}
-                continue
-            r = self.stop_since_marker(role, eid, pid_dir=self.pid_dir, marker=latest)
-            results[role] = r
-        return results
+        kill any tracked processes newer than that marker (one submission per gateway)
+        """
+        return run_parallel({
+            role: (lambda role=role, ep_name=ep_name:
+                   self._parse_preclean(run_remote(self._eid(ep_name), f"KILL:{role}", self._preclean_script())))
+            for role, ep_name in (("p2cs", self.args.p2cs_ep), ("c2cs", self.args.c2cs_ep))
+        })
 
+    @traced()
     def deep_clean_previous_session(self) -> dict:
         """
-        Kill any PID referenced by *.pid under the base dir
+        Stop the previous session's processes (see _deep_clean_script)
+        """
+        script = self._deep_clean_script()
+        return run_parallel({
+            role: (lambda role=role, ep_name=ep_name: run_remote(self._eid(ep_name), f"PRECLEAN:{role}", script))
+            for role, ep_name in (("p2cs", self.args.p2cs_ep), ("c2cs", self.args.c2cs_ep))
+        })
+
+    def _deep_clean_script(self) -> str:
         """
-        results = {}
-        for role, ep_name in (("p2cs", self.args.p2cs_ep), ("c2cs", self.args.c2cs_ep)):
-            eid = self._eid(ep_name)
-            script = f"""
-                        PID_BASE=/tmp/.scistream; shopt -s nullglob 
-                        for f in $PID_BASE/*.pid; do pid=$(cat $f || : ) && [[ "$pid"  =~ ^[0-9]+$ ]] && kill -9 "$pid" 2>/dev/null || : ; done
+        Stop every tracked process of the previous session, the one named by the newest marker (its whole
+        procs dir under session_base, process groups included, regardless of age), and any pidfile directly in
+        pid_dir (the layout before per-session procs dirs), and drop that session's port reservations.
+        Other sessions on the host keep their processes and reservations; a reservation whose owner died is
+        reclaimed by reserve_ports once --port-reservation-ttl has passed. Run it before this session's own
+        marker exists
+        """
+        base = (getattr(self.args, "session_base", None) or "/tmp/.scistream").rstrip("/")
+        return _STOPPERS + f"""
+                        shopt -s nullglob
+                        latest="$(ls -1t "{self.pid_dir}"/.session-*.mark 2>/dev/null | head -n1 || true)"
+                        prev=""
+                        if [ -n "$latest" ]; then prev="$(basename "$latest" .mark)"; prev="${{prev#.session-}}"; fi
+                        files=("{self.pid_dir}"/*.pid)
+                        if [ -n "$prev" ]; then files+=("{base}/$prev/procs"/*.pid); fi
+                        stop_pidfiles 2000 "${{files[@]}}"
+                        if [ -n "$prev" ]; then
+                            for f in "{self._resv_dir}"/*; do if [ -f "$f" ] && grep -q "^$prev:" "$f"; then rm -f "$f"; fi; done
+                        fi
                         echo OK
                     """
-            results[role] = run_remote(eid, f"PRECLEAN:{role}", script)
-        return results
+
+    # ------------------------- Fused gateway preparation -------------------------
+
+    @traced()
+    def prepare_gateways(self, *, preclean: bool = False, deep_clean: bool = True) -> Dict[str, Dict[str, dict]]:
+        """
+        Run every shell pre-launch step for a gateway as ONE remote submission (both gateways concurrently):
+          preclean → deep clean → marker → keygen
+        Order inside the batch preserves the real dependencies (cleans before our own
+        marker exists). A failing clean stops the remaining operations on that gateway.
+        Port allocation and file writes are native functions and run after this step
+        (allocate_ports, distribute_certs)
+        Returns the per-operation results split back into the usual per-phase dicts:
+          {'preclean': {p2cs, c2cs}, 'deepclean': {...}, 'markers': {producer, consumer}, 'keygen': {...}}
+        """
+        batches = self._prepare_batches(preclean=preclean, deep_clean=deep_clean)
+
+        def prepare(b: RemoteBatch, idx: Dict[str, int]) -> Dict[str, dict]:
+            res = b.run()
+            return {phase: res[i] for phase, i in idx.items()}
+
+        per_gw = run_parallel({
+            role: (lambda b=b, idx=idx: prepare(b, idx))
+            for role, (b, idx) in batches.items()
+        })
+        return self._prepare_results(per_gw)
+
+    def _prepare_batches(self, *, preclean: bool, deep_clean: bool) -> Dict[str, tuple]:
+        """{role: (RemoteBatch, {phase: op index})} for prepare_gateways"""
+        gateways = (("p2cs", self.args.p2cs_ep), ("c2cs", self.args.c2cs_ep))
+        # Expected peer fingerprints (last seen); a gateway that already trusts one skips distribution
+        expected = {
+            role: self.ep_cache.cert_fingerprint(self._eid(ep), cred_key(self.args, role)) if self.ep_cache else None
+            for role, ep in gateways
+        }
+        batches = {}
+        for role, ep_name in gateways:
+            peer = "c2cs" if role == "p2cs" else "p2cs"
+            b = RemoteBatch(self._eid(ep_name), f"PREPARE:{role}")
+            idx: Dict[str, int] = {}
+            if preclean:
+                idx["preclean"] = b.add(f"KILL:{role}", self._preclean_script(), stop_on_error=True)
+            if deep_clean:
+                idx["deepclean"] = b.add(f"PRECLEAN:{role}", self._deep_clean_script(), stop_on_error=True)
+            marker_role = "producer" if role == "p2cs" else "consumer"
+            idx["markers"] = b.add(f"MARKER:{marker_role}", self._marker_script(), stop_on_error=True)
+            idx["keygen"] = b.add(f"KEYGEN:{role}", key_gen_script(self.args, role, sess_dir=self.sess_dir,
+                                                                   peer_fp=expected[peer]))
+            batches[role] = (b, idx)
+        return batches
+
+    def _prepare_results(self, per_gw: Dict[str, Dict[str, dict]]) -> Dict[str, Dict[str, dict]]:
+        """Split per-gateway batch results into per-phase dicts and record the gateway certs"""
+        out: Dict[str, Dict[str, dict]] = {k: {} for k in ("preclean", "deepclean", "markers", "keygen")}
+        for role, phases in per_gw.items():
+            if "ok" in phases:  # prepare() itself raised; run_parallel returned a failure dict
+                for k in out:
+                    out[k][role] = phases
+                continue
+            marker_role = "producer" if role == "p2cs" else "consumer"
+            for phase, r in phases.items():
+                if phase == "preclean":
+                    r = self._parse_preclean(r)
+                elif phase == "keygen":
+                    r = parse_key_gen(r)
+                out[phase][marker_role if phase == "markers" else role] = r
+
+        for role, r in out["keygen"].items():
+            if not r.get("ok"):
+                logging.error("key_gen failed on %s: %s", role, r)
+        self.p2cs_cert_pem = out["keygen"].get("p2cs", {}).get("cert_pem") or self.p2cs_cert_pem
+        self.c2cs_cert_pem = out["keygen"].get("c2cs", {}).get("cert_pem") or self.c2cs_cert_pem
+        self._record_gateway_certs(out["keygen"])
+        self._journal("prepare", all(r.get("ok") for phase in ("markers", "keygen") for r in out[phase].values())
+                      and len(out["keygen"]) == 2)
+        return out
+
+    def _record_gateway_certs(self, keygen: Dict[str, dict]) -> None:
+        """
+        Note which peer cert each gateway confirmed it trusts, and remember the current
+        fingerprints for the next run's trust check
+        """
+        fps = {role: (keygen.get(role) or {}).get("fingerprint") for role in ("p2cs", "c2cs")}
+        for role, peer in (("p2cs", "c2cs"), ("c2cs", "p2cs")):
+            trusted = (keygen.get(role) or {}).get("trusted")
+            self._peer_trusted[role] = trusted if trusted and trusted == fps[peer] else None
+        if self.ep_cache is not None:
+            for role, ep in (("p2cs", self.args.p2cs_ep), ("c2cs", self.args.c2cs_ep)):
+                if fps[role]:
+                    self.ep_cache.put_cert_fingerprint(self._eid(ep), cred_key(self.args, role), fps[role])
+            self.ep_cache.save()
+
+    # ------------------------------ Staging -------------------------------------
+
+    def _stage_files(self, endpoint_id: str, label: str, files: list[dict]) -> dict:
+        """Write files on an endpoint by content (util.stage_remote_files): unchanged files and payloads it holds are not sent"""
+        return self._staged_on(endpoint_id, stage_remote_files(endpoint_id, label, files, **self._stage_opts(endpoint_id)))
+
+    def _stage_opts(self, endpoint_id: str) -> dict:
+        """Store location and the payload digests the endpoint cache last saw on endpoint_id"""
+        return {"store": getattr(self.args, "artifact_dir", None),
+                "known": self.ep_cache.artifacts(endpoint_id) if self.ep_cache is not None else ()}
+
+    def _staged_on(self, endpoint_id: str, r: dict) -> dict:
+        """Remember what the endpoint's artifact store holds now, for the next run"""
+        if r.get("ok") and self.ep_cache is not None:
+            self.ep_cache.put_artifacts(endpoint_id, r["result"]["stored"])
+            self.ep_cache.save()
+        return r
 
     # ------------------------------ Crypto --------------------------------------
 
+    @traced()
     def setup_crypto(self) -> Dict[str, dict]:
         """
         Generate self-signed certs on both gateways, then cross-distribute peer certs
         so each trusts the other. Store PEMs locally for staging onto runners
+        Both keygens run concurrently, then both distributions run concurrently
         """
         #TODO: check with actual data and make sure selfsigned certs work
         #TODO: should modify the proxy temp config giles when using opposite direction!
         ep1 = self.args.p2cs_ep
         ep2 = self.args.c2cs_ep
 
-        r1 = key_gen(self.args, "p2cs", self._eid(ep1), sess_dir=self.sess_dir)
-        if not r1.get("ok"):
-            logging.error("key_gen failed on %s: %s", ep1, r1)
-            return {"p2cs": r1}
-        self.p2cs_cert_pem = r1.get("cert_pem")
+        gen = run_parallel({
+            "p2cs": lambda: key_gen(self.args, "p2cs", self._eid(ep1), sess_dir=self.sess_dir),
+            "c2cs": lambda: key_gen(self.args, "c2cs", self._eid(ep2), sess_dir=self.sess_dir),
+        })
+        if not self._keygen_done(gen):
+            return gen
+        return self.distribute_certs()
 
-        r2 = key_gen(self.args, "c2cs", self._eid(ep2), sess_dir=self.sess_dir)
+    def _keygen_done(self, gen: Dict[str, dict]) -> bool:
+        """Keep both gateway certs from a {p2cs, c2cs} key_gen result; False if either failed"""
+        r1, r2 = gen["p2cs"], gen["c2cs"]
+        if not r1.get("ok"):
+            logging.error("key_gen failed on %s: %s", self.args.p2cs_ep, r1)
         if not r2.get("ok"):
-            logging.error("key_gen failed on %s: %s", ep2, r2)
-            return {"p2cs": r1, "c2cs": r2}
+            logging.error("key_gen failed on %s: %s", self.args.c2cs_ep, r2)
+        if not (r1.get("ok") and r2.get("ok")):
+            return False
+        self.p2cs_cert_pem = r1.get("cert_pem")
         self.c2cs_cert_pem = r2.get("cert_pem")
+        self._record_gateway_certs(gen)
+        return True
 
-        # Copy each side's cert to the other's trust path
-        t1 = crt_dist(self.args, "p2cs", self._eid(ep1), sess_dir=self.sess_dir, peer_cert_pem=self.c2cs_cert_pem or "")
-        t2 = crt_dist(self.args, "c2cs", self._eid(ep2), sess_dir=self.sess_dir, peer_cert_pem=self.p2cs_cert_pem or "")
-        if not t1.get("ok"):
-            logging.error("crt_dist failed on %s: %s", ep1, t1)
-        if not t2.get("ok"):
-            logging.error("crt_dist failed on %s: %s", ep2, t2)
-        return {"p2cs": t1, "c2cs": t2}
+    @traced()
+    def distribute_certs(self, *, include_psk: bool = False) -> Dict[str, dict]:
+        """
+        Copy each gateway's cert (from setup_crypto/prepare_gateways) to the other's trust path
+        (session peer.crt + the persistent trust store)
+        A gateway that already trusts its peer's current cert (confirmed during prepare_gateways) is skipped
+        With include_psk, the PSK file (if --psk-secret is set) is written in the same submission
+        """
+        plan = self._dist_plan(include_psk)
+        if "error" in plan:
+            return {"p2cs": plan, "c2cs": plan}
+        dist = run_parallel({
+            role: (lambda role=role, eid=eid, fs=fs: self._stage_files(eid, f"CRT-DIST:{role}", fs))
+            for role, (eid, fs) in plan.items() if fs
+        })
+        return self._dist_done(plan, dist)
+
+    def _dist_plan(self, include_psk: bool) -> dict:
+        """{role: (endpoint ID, files to write)} for distribute_certs, or a failure dict"""
+        if not (self.p2cs_cert_pem and self.c2cs_cert_pem):
+            return {"ok": False, "error": "Missing gateway cert PEM; run key generation first"}
+        secret = (self.args.psk_secret or "").strip() if include_psk else ""
+        plan = {}
+        for role, ep, peer_pem in (("p2cs", self.args.p2cs_ep, self.c2cs_cert_pem),
+                                   ("c2cs", self.args.c2cs_ep, self.p2cs_cert_pem)):
+            fs = [] if self._peer_trusted[role] else [peer_cert_file(self.sess_dir, peer_pem), trust_file(self.args, peer_pem)]
+            if secret:
+                fs.append(psk_file(self.sess_dir, secret))
+            plan[role] = (self._eid(ep), fs)
+        return plan
 
+    def _dist_done(self, plan: dict, dist: Dict[str, dict]) -> Dict[str, dict]:
+        out = {}
+        for role, ep in (("p2cs", self.args.p2cs_ep), ("c2cs", self.args.c2cs_ep)):
+            if not plan[role][1]:
+                logging.info("crt_dist skipped on %s: peer cert already trusted", role)
+                out[role] = {"ok": True, "label": f"CRT-DIST:{role}", "skipped": True}
+                continue
+            out[role] = dist[role]
+            if not out[role].get("ok"):
+                logging.error("crt_dist failed on %s: %s", ep, out[role])
+        self._journal("crypto", all(r.get("ok") for r in out.values()))
+        return out
+
+    @traced()
     def distribute_psk(self) -> Dict[str, dict]:
         """distribute a pre-shared key file to both gateways"""
         secret = (self.args.psk_secret or "").strip()
         if not secret:
             return {"p2cs": {"ok": True, "skipped": True}, "c2cs": {"ok": True, "skipped": True}}
-        p2 = key_dist(self.args, "p2cs", self._eid(self.args.p2cs_ep), sess_dir=self.sess_dir, psk_secret=secret)
-        c2 = key_dist(self.args, "c2cs", self._eid(self.args.c2cs_ep), sess_dir=self.sess_dir, psk_secret=secret)
-        return {"p2cs": p2, "c2cs": c2}
+        return run_parallel({
+            "p2cs": lambda: key_dist(self.args, "p2cs", self._eid(self.args.p2cs_ep), sess_dir=self.sess_dir, psk_secret=secret),
+            "c2cs": lambda: key_dist(self.args, "c2cs", self._eid(self.args.c2cs_ep), sess_dir=self.sess_dir, psk_secret=secret),
+        })
 
     # --------------------------- Server Launch (s2cs) ---------------------------
 
+    @traced()
     def launch_p2cs(self) -> dict:
         """Start the producer-side gateway service (s2cs) on its endpoint"""
-        r = setup_mod.p2cs(self.args, self._eid(self.args.p2cs_ep), sess_dir=self.sess_dir)
-        if not r.get("ok"):
-            logging.error("Launch p2cs failed: %s", r)
-        return r
+        return self._launched("p2cs", setup_mod.p2cs(self.args, self._eid(self.args.p2cs_ep), sess_dir=self.sess_dir))
 
+    @traced()
     def launch_c2cs(self) -> dict:
         """Start the consumer-side gateway service (s2cs) on its endpoint"""
-        r = setup_mod.c2cs(self.args, self._eid(self.args.c2cs_ep), sess_dir=self.sess_dir)
+        return self._launched("c2cs", setup_mod.c2cs(self.args, self._eid(self.args.c2cs_ep), sess_dir=self.sess_dir))
+
+    def _launched(self, side: str, r: dict) -> dict:
         if not r.get("ok"):
-            logging.error("Launch c2cs failed: %s", r)
+            logging.error("Launch %s failed: %s", side, r)
+        self._gateway_up[side] = bool(r.get("ok"))
+        self._gateway_pid[side] = r.get("pid") if r.get("ok") else None
+        self._journal(f"launch:{side}", bool(r.get("ok")))
         return r
 
     # ----------------------------- Helpers for connect --------------------------
 
     def _stage_cert_pem_on(self, endpoint_id: str, pem: str, dest_path: str = "/tmp/.scistream/server.crt") -> dict:
         """
-        Write a PEM string to a remote path via base64 heredoc
+        Write a PEM string to a remote path
         Used to place gateway certs where runner-side s2uc expects them
         """
-        b64 = base64.b64encode((pem or "").encode("utf-8")).decode("ascii")
-        script = f"""python3 - <<'PY'
-import base64, os
-data = base64.b64decode("{b64}".encode("ascii"))
-p = "{dest_path}"
-os.makedirs(os.path.dirname(p), exist_ok=True)
-with open(p, "wb") as f:
-    f.write(data)
-print("OK")
-PY
-"""
-        return run_remote(endpoint_id, "CERT:stage", script)
+        return self._stage_files(endpoint_id, "CERT:stage", [{"path": dest_path, "data": pem or "", "mode": 0o644}])
 
     def _wait_port(self, endpoint_id: str, host: str, port: int, timeout_s: int = 60) -> dict:
         """
-        Poll until TCP connect (host:port) succeeds or timeout
+        Wait until TCP connect (host:port) succeeds or timeout
         To make sure s2cs listener is up on the gateway before proceeding to runner side
+        result['result'] is {'ready', 'elapsed', 'attempts', 'error'}
         """
-        #TODO: change the shell format python codes to python function and submit the function
-        # Pass host/port via environment to avoid quoting/repr issues on remote
-        script = f"""H={host} P={int(port)} T={int(timeout_s)} python3 - <<'PY'
-import os, socket, sys, time
-h = os.environ["H"]
-p = int(os.environ["P"])
-deadline = time.time() + int(os.environ.get("T","60"))
-ok = False
-while time.time() < deadline:
-    try:
-        s = socket.create_connection((h, p), 2.0)
-        s.close()
-        ok = True
-        break
-    except Exception:
-        time.sleep(1)
-print("READY" if ok else "NOTREADY")
-sys.exit(0 if ok else 1)
-PY
-"""
-        return run_remote(endpoint_id, "PORT:wait", script, wall=timeout_s + 10, wait=timeout_s + 10)
+        return call_remote(endpoint_id, "PORT:wait", remote_fns.wait_port, host, int(port), int(timeout_s),
+                           wait=timeout_s + 10)
 
     # ------------------------------- Connect (s2uc) -----------------------------
 
-    def connect(self) -> Dict[str, dict]:
+    @traced()
+    def wait_gateway(self, side: str) -> dict:
+        """Wait until the s2cs sync port of one gateway ('p2cs' or 'c2cs') accepts connections"""
+        ep, ip = self._gateway_addr(side)
+        return self._gateway_waited(side, self._wait_port(self._eid(ep), ip, int(self.args.sync_port), timeout_s=60))
+
+    def _gateway_addr(self, side: str) -> tuple[str, str]:
+        return (self.args.p2cs_ep, self.args.p2cs_ip) if side == "p2cs" else (self.args.c2cs_ep, self.args.c2cs_ip)
+
+    def _gateway_waited(self, side: str, wp: dict) -> dict:
+        ip = self._gateway_addr(side)[1]
+        if not wp.get("ok") or not (wp.get("result") or {}).get("ready"):
+            return {"ok": False, "error": f"s2cs not listening at {ip}:{self.args.sync_port}", "wait": wp}
+        self._gateway_ready[side] = True
+        return wp
+
+    @traced()
+    def stage_runner_certs(self) -> Dict[str, dict]:
+        """
+        Stage the gateway certs the runners' s2uc verify against
+        - inbound runner gets the producer cert, outbound runner the consumer cert
+        - placed at sess_dir/certs/{p2cs,c2cs}.crt, exactly where launcher.inbound/outbound read it
+          (distinct names, so staging both on one runner host cannot clobber each other or a gateway's server.crt)
+        - runners that share an endpoint get both certs in a single submission
+        Returns {'inbound': result, 'outbound': result}
+        """
+        results, per_host = self._runner_cert_plan()
+        done = run_parallel({
+            eid: (lambda eid=eid, items=items: self._stage_files(eid, "CERT:stage", [f for _, f in items]))
+            for eid, items in per_host.items()
+        })
+        return self._runner_certs_staged_done(results, per_host, done)
+
+    def _runner_cert_plan(self) -> tuple[Dict[str, dict], Dict[str, list]]:
+        """(failures for missing certs, {runner endpoint ID: [(which, file), ...]}) for stage_runner_certs"""
+        wanted = (("inbound", "producer", self.p2cs_cert_pem, "p2cs.crt"),
+                  ("outbound", "consumer", self.c2cs_cert_pem, "c2cs.crt"))
+        results: Dict[str, dict] = {}
+        per_host: Dict[str, list] = {}
+        for which, side, pem, name in wanted:
+            if not pem:
+                results[which] = {"ok": False, "error": f"Missing {side} cert PEM"}
+                continue
+            per_host.setdefault(self._runner_eid(which), []).append(
+                (which, {"path": f"{self.sess_dir}/certs/{name}", "data": pem, "mode": 0o644}))
+        return results, per_host
+
+    def _runner_certs_staged_done(self, results: Dict[str, dict], per_host: Dict[str, list],
+                                  done: Dict[str, dict]) -> Dict[str, dict]:
+        for eid, items in per_host.items():
+            for which, _ in items:
+                results[which] = done[eid]
+        results = {k: results[k] for k in ("inbound", "outbound")}
+        self._runner_certs_staged = all(r.get("ok") for r in results.values())
+        self._journal("stage", self._runner_certs_staged)
+        return results
+
+    @traced()
+    def run_inbound(self, stream: str | None = None) -> dict:
+        """Run inbound-request for a stream on the inbound runner; remember its UID + listen ports"""
+        st = self._stream(stream)
+        r_in = setup_mod.inbound(st["args"], "producer", self._runner_eid("inbound"), sess_dir=self.sess_dir, tag=st["tag"])
+        return self._inbound_done(st, r_in)
+
+    def _inbound_done(self, st: dict, r_in: dict) -> dict:
+        if not r_in.get("ok"):
+            logging.error("Inbound failed (stream %s): %s", st["name"], r_in)
+            self._journal(self._step_name("inbound", st["name"]), False)
+            return r_in
+        st["uid"] = r_in.get("uid")
+        st["listen_ports"] = r_in.get("listen_ports") or []
+        st["pids"]["inbound"] = r_in.get("pid")
+        self._journal(self._step_name("inbound", st["name"]))
+        return r_in
+
+    @traced()
+    def run_outbound(self, stream: str | None = None) -> dict:
+        """Run outbound-request for a stream on the outbound runner using the UID/ports parsed by run_inbound()"""
+        st = self._stream(stream)
+        r_out = setup_mod.outbound(st["args"], "consumer", self._runner_eid("outbound"),
+                                   stream_uid=st["uid"], ports=st["listen_ports"], sess_dir=self.sess_dir, tag=st["tag"])
+        return self._outbound_done(st, r_out)
+
+    def _outbound_done(self, st: dict, r_out: dict) -> dict:
+        if not r_out.get("ok"):
+            logging.error("Outbound failed (stream %s): %s", st["name"], r_out)
+        else:
+            st["connected"] = True
+            st["pids"]["outbound"] = r_out.get("pid")
+        self._journal(self._step_name("outbound", st["name"]), bool(r_out.get("ok")))
+        return r_out
+
+    @staticmethod
+    def _step_name(kind: str, stream: str) -> str:
+        """Scheduler step name for a per-stream step ('inbound', 'inbound:det2', ...)"""
+        return kind if stream == DEFAULT_STREAM else f"{kind}:{stream}"
+
+    def add_connect_steps(self, sched: StepScheduler, *, stream: str | None = None, after_p2cs: tuple = (),
+                          after_c2cs: tuple = (), after_crypto: tuple = (), keep_uid: bool = False) -> None:
+        """
+        Register the connect path of one stream on a scheduler with its real dependencies:
+          wait:p2cs ──┐
+          stage ──────┴─> inbound ─┐
+          wait:c2cs ───────────────┴─> outbound
+        Both runner certs are staged up front (fused per runner endpoint), and the
+        consumer-side wait overlaps with the inbound request
+        The shared steps (gateway waits, staging) are added once per scheduler and
+        skipped entirely once they have succeeded for this session
+        keep_uid: only outbound is added, with the UID and listen ports inbound already got (a resumed
+        stream whose inbound s2uc still runs)
+        """
+        st = self._stream(stream)
+        name = st["name"]
+        keep_uid = keep_uid and bool(st["uid"])
+        shared = []
+        if not self._gateway_ready["p2cs"] and not keep_uid:
+            if "wait:p2cs" not in sched:
+                sched.add("wait:p2cs", lambda: self.wait_gateway("p2cs"), needs=after_p2cs)
+            shared.append("wait:p2cs")
+        if not self._runner_certs_staged:
+            if "stage" not in sched:
+                sched.add("stage", self.stage_runner_certs, needs=after_crypto)
+            shared.append("stage")
+        wait_c2cs = []
+        if not self._gateway_ready["c2cs"]:
+            if "wait:c2cs" not in sched:
+                sched.add("wait:c2cs", lambda: self.wait_gateway("c2cs"), needs=after_c2cs)
+            wait_c2cs = ["wait:c2cs"]
+        inbound = [] if keep_uid else [self._step_name("inbound", name)]
+        if inbound:
+            sched.add(inbound[0], lambda: self.run_inbound(name),
+                      needs=[d for d in shared if d in ("wait:p2cs", "stage")])
+        sched.add(self._step_name("outbound", name), lambda: self.run_outbound(name),
+                  needs=[*inbound, *wait_c2cs, *[d for d in shared if d == "stage"]])
+
+    def connect_results(self, steps: Dict[str, dict], stream: str | None = None) -> Dict[str, dict]:
         """
-        Full connection path:
+        Fold one stream's connect step outcomes back into the {'inbound': ..., 'outbound': ...} shape
+        The first failing step on each side is reported in place of that side's result
+        """
+        name = self._stream(stream)["name"]
+
+        def side(which: str, names: tuple) -> dict:
+            for n in names:
+                st = steps.get(n) or {}
+                if not st or st.get("ok") or st.get("skipped"):
+                    continue
+                res = st.get("result")
+                if n == "stage" and isinstance(res, dict):
+                    res = res.get(which)
+                    if (res or {}).get("ok"):
+                        continue
+                return res or {"ok": False, "error": st.get("error"), "step": n}
+            last = steps.get(names[-1]) or {}
+            return last.get("result") or {"ok": False, "skipped": True, "error": last.get("error", "not run")}
+
+        return {
+            "inbound": side("inbound", ("wait:p2cs", "stage", self._step_name("inbound", name))),
+            "outbound": side("outbound", ("wait:c2cs", "stage", self._step_name("outbound", name))),
+        }
+
+    @traced()
+    def connect(self, stream: str | None = None) -> Dict[str, dict]:
+        """
+        Full connection path (for one stream; the first one by default):
         - Wait until producer gateway sync port is reachable
         - Stage producer cert on inbound runner; run inbound-request, parse UID/ports
         - Wait until consumer gateway sync port is reachable
         - Stage consumer cert on outbound runner; run outbound-request using UID/ports
+        Independent waits/stagings run concurrently (see add_connect_steps)
         Returns a dict with 'inbound' and 'outbound' results
         """
-        # Wait for producer gateway port
-        wp = self._wait_port(self._eid(self.args.p2cs_ep), self.args.p2cs_ip, int(self.args.sync_port), timeout_s=60)
-        if not wp.get("ok") or "READY" not in (wp.get("stdout") or ""):
-            return {"inbound": {"ok": False, "error": f"s2cs not listening at {self.args.p2cs_ip}:{self.args.sync_port}", "wait": wp}}
-
-        # Stage producer cert ON INBOUND RUNNER exactly where setup.inbound reads it
-        if not self.p2cs_cert_pem:
-            return {"inbound": {"ok": False, "error": "Missing producer cert PEM"}}
-        inbound_runner = self._runner_eid("inbound")
-        sr = self._stage_cert_pem_on(inbound_runner, self.p2cs_cert_pem,
-                                     dest_path=f"{self.sess_dir}/certs/server.crt")
-        if not sr.get("ok"):
-            return {"inbound": sr}
-
-        # Run inbound and extract stream UID + listen ports from logs
-        r_in = setup_mod.inbound(self.args, "producer", inbound_runner, sess_dir=self.sess_dir)
-        if not r_in.get("ok"):
-            logging.error("Inbound failed: %s", r_in)
-            return {"inbound": r_in}
-        uid = r_in.get("uid")
-        listen_ports = r_in.get("listen_ports") or []
-
-        # Wait for consumer gateway port
-        wc = self._wait_port(self._eid(self.args.c2cs_ep), self.args.c2cs_ip, int(self.args.sync_port), timeout_s=60)
-        if not wc.get("ok") or "READY" not in (wc.get("stdout") or ""):
-            return {"inbound": r_in, "outbound": {"ok": False, "error": f"s2cs not listening at {self.args.c2cs_ip}:{self.args.sync_port}", "wait": wc}}
-
-        # Stage consumer cert ON OUTBOUND RUNNER where setup.outbound expects it
-        if not self.c2cs_cert_pem:
-            return {"inbound": r_in, "outbound": {"ok": False, "error": "Missing consumer cert PEM"}}
-        outbound_runner = self._runner_eid("outbound")
-        sr2 = self._stage_cert_pem_on(outbound_runner, self.c2cs_cert_pem,
-                                      dest_path=f"{self.sess_dir}/certs/server.crt")
-        if not sr2.get("ok"):
-            return {"inbound": r_in, "outbound": sr2}
-
-        # Run outbound using parsed UID and inbound listen ports
-        r_out = setup_mod.outbound(self.args, "consumer", outbound_runner, stream_uid=uid, ports=listen_ports, sess_dir=self.sess_dir)
-        if not r_out.get("ok"):
-            logging.error("Outbound failed: %s", r_out)
-        return {"inbound": r_in, "outbound": r_out}
+        sched = StepScheduler()
+        self.add_connect_steps(sched, stream=stream)
+        return self.connect_results(sched.run(), stream)
+
+    @traced()
+    def connect_all(self) -> Dict[str, Dict[str, dict]]:
+        """Connect every stream that is not connected yet, concurrently; returns {stream: connect result}"""
+        names = [n for n, st in self.streams.items() if not st["connected"]]
+        sched = StepScheduler(max_workers=max(8, 2 * len(names) + 3))
+        for n in names:
+            self.add_connect_steps(sched, stream=n)
+        steps = sched.run()
+        return {n: self.connect_results(steps, n) for n in names}
+
+    def tail_log(self, log: str, *, offset: int = 0, max_bytes: int | None = None) -> dict:
+        """
+        Lines of one session log written since offset, from the host that writes it
+        log is 'p2cs', 'c2cs', 'inbound[-<stream>]' or 'outbound[-<stream>]'; a negative offset returns
+        only the most recent output. Launch results report each log's size ('@@LOGSIZE'), so a
+        follow-up tail can start where bring-up stopped reading
+        Returns {ok, data, offset, size, more, skipped}
+        """
+        m = _LOG_NAME.match(log or "")
+        if not m:
+            raise ValueError(f"Unknown log {log!r} (p2cs, c2cs, inbound[-<stream>], outbound[-<stream>])")
+        kind = m.group(2) or log
+        eid = (self._runner_eid(kind) if kind in ("inbound", "outbound")
+               else self._eid(self.args.p2cs_ep if kind == "p2cs" else self.args.c2cs_ep))
+        cap = max_bytes or getattr(self.args, "log_max_bytes", LOG_MAX_BYTES)
+        return LogTail(eid, f"{self.sess_dir}/logs/{log}.log", offset=offset, max_bytes=cap, label=f"LOG:{log}").poll()
+
+    @staticmethod
+    def _kill_pidfiles_script(pidfiles: list[str], timeout_s: float = 5, *, addrs: list[str] = ()) -> str:
+        """
+        Shell body that stops the processes named in pidfiles (process groups for setsid-launched ones, see
+        _STOPPERS), KILLs survivors after timeout_s and removes the pidfiles; with addrs ('ip:port'), it then
+        waits (at most 2s) until none of them is listening any more
+        """
+        files = " ".join(f'"{f}"' for f in pidfiles)
+        return _STOPPERS + f"""
+                stop_pidfiles {int(timeout_s * 1000)} {files}
+                await_unbound 2000 {" ".join(addrs)}
+                echo "OK"
+                """
+
+    @staticmethod
+    def _parse_stop(r: dict) -> dict:
+        """Stop result → adds 'killed' (needed KILL) and 'busy' (still listening: ok=False)"""
+        if not r.get("ok"):
+            return r
+        words = [ln.split() for ln in (r.get("stdout") or "").splitlines()]
+        out = {**r, "killed": [w[1] for w in words if len(w) == 2 and w[0] == "KILLED"],
+               "busy": [w[1] for w in words if len(w) == 2 and w[0] == "BUSY"]}
+        if out["busy"]:
+            out.update(ok=False, error=f"still listening after stop: {', '.join(out['busy'])}")
+        return out
+
+    def _pidfile(self, role: str, st: dict | None = None) -> str:
+        """Where the launchers record a process: procs/<role>.pid (gateways), procs/<role>[-<tag>].pid (a stream's s2uc)"""
+        tag = st["tag"] if st else ""
+        return f"{self.sess_dir}/procs/{role}{'-' + tag if tag else ''}.pid"
+
+    def _teardown_plan(self, roles: tuple, streams: list[dict]) -> Dict[str, dict]:
+        """
+        {endpoint ID: {'roles', 'pidfiles', 'addrs'}} for stopping the given roles of this session
+        - p2cs / c2cs: the s2cs pidfile; its sync port and the streams' proxy ports must come free
+          (p2cs: inbound listen ports, c2cs: outbound_dst_ports, on the listener address)
+        - inbound / outbound: the s2uc pidfile of each stream
+        Roles that share an endpoint share one entry (one submission)
+        """
+        plan: Dict[str, dict] = {}
+        for role in roles:
+            if role in ("p2cs", "c2cs"):
+                eid = self._eid(self.args.p2cs_ep if role == "p2cs" else self.args.c2cs_ep)
+                ip = self.args.p2cs_listener if role == "p2cs" else self.args.c2cs_listener
+                ports = [int(self.args.sync_port)]
+                for st in streams:
+                    ports += [int(p) for p in (st["listen_ports"] if role == "p2cs" else st["reserved"])]
+                pidfiles, addrs = [self._pidfile(role)], [f"{ip}:{p}" for p in dict.fromkeys(ports)]
+            else:
+                eid = self._runner_eid(role)
+                pidfiles = [self._pidfile(role, st) for st in streams]
+                addrs = []
+            e = plan.setdefault(eid, {"roles": [], "pidfiles": [], "addrs": []})
+            e["roles"].append(role)
+            e["pidfiles"] += pidfiles
+            e["addrs"] += addrs
+        return plan
+
+    def _teardown_script(self, entry: dict) -> str:
+        return self._kill_pidfiles_script(entry["pidfiles"], addrs=entry["addrs"])
+
+    @staticmethod
+    def _teardown_label(entry: dict, what: str = "") -> str:
+        return f"STOP:{'+'.join(entry['roles'])}" + (f":{what}" if what else "")
+
+    def _teardown(self, roles: tuple, streams: list[dict], release: str | None, what: str = "") -> Dict[str, dict]:
+        """Run a teardown plan: one submission per endpoint plus the port release, all concurrently"""
+        plan = self._teardown_plan(roles, streams)
+        calls = {
+            eid: (lambda eid=eid, e=e: run_remote(eid, self._teardown_label(e, what), self._teardown_script(e),
+                                                  wall=30, wait=30))
+            for eid, e in plan.items()
+        }
+        if release:
+            calls["ports"] = lambda: self._release_ports(release)
+        return self._torn_down(plan, run_parallel(calls))
+
+    def _torn_down(self, plan: Dict[str, dict], done: Dict[str, dict]) -> Dict[str, dict]:
+        """Per-role results of a teardown ({role: result[, 'ports': result]})"""
+        out = {}
+        for eid, e in plan.items():
+            r = self._parse_stop(done[eid])
+            for role in e["roles"]:
+                out[role] = r
+        if "ports" in done:
+            out["ports"] = done["ports"]
+        return out
+
+    @traced()
+    def disconnect_stream(self, name: str) -> Dict[str, dict]:
+        """
+        Stop one stream's s2uc inbound/outbound process groups on the runners (gateways keep running)
+        and release its port reservation on c2cs
+        Runners that share an endpoint are handled in one submission
+        Returns {'inbound': result, 'outbound': result[, 'ports': result]}
+        """
+        st = self._stream(name)
+        res = self._teardown(("inbound", "outbound"), [st], self._port_owner(st["name"]) if st["reserved"] else None,
+                             st["name"])
+        return self._disconnected(st, res)
+
+    def _disconnected(self, st: dict, results: Dict[str, dict]) -> Dict[str, dict]:
+        if results.get("ports", {}).get("ok"):
+            st["reserved"] = []
+        if all(r.get("ok") for r in results.values()):
+            st.update(uid=None, listen_ports=[], connected=False, pids={})
+        self._journal()
+        return results
+
+    def remove_stream(self, name: str) -> Dict[str, dict]:
+        """Disconnect a stream and forget it"""
+        res = self.disconnect_stream(name)
+        if all(r.get("ok") for r in res.values()):
+            self.streams.pop(name, None)
+            self._journal()
+        return res
+
+    @traced()
+    def stop_gateways(self) -> Dict[str, dict]:
+        """
+        Stop this session's s2cs process groups on both gateways (with the proxies they spawned), confirm
+        their ports are free again, and release every port reservation the session still holds
+        Returns {'p2cs', 'c2cs', 'ports'}
+        """
+        return self._gateways_stopped(self._teardown(("p2cs", "c2cs"), list(self.streams.values()), self.session_id))
+
+    def _gateways_stopped(self, res: Dict[str, dict]) -> Dict[str, dict]:
+        for role in ("p2cs", "c2cs"):
+            if res[role].get("ok"):
+                self._gateway_ready[role] = False
+                self._gateway_up[role] = False
+                self._gateway_pid[role] = None
+        if res["ports"].get("ok"):
+            for st in self.streams.values():
+                st["reserved"] = []
+        self._journal()
+        return res
+
+    # ------------------------- Recovery (see watchdog.py) -----------------------
+
+    @traced()
+    def restart_gateway(self, side: str) -> dict:
+        """
+        Relaunch one gateway's s2cs ('p2cs' or 'c2cs') in this session after it died or stopped listening
+        - Whatever is left of it (its process group and proxies) is stopped first and its ports confirmed free
+        - Certs, port reservations and the other gateway are untouched; its streams must be reconnected
+          afterwards (reconnect_stream)
+        Returns {'ok', 'stop', 'launch'}
+        """
+        stop = self._teardown((side,), list(self.streams.values()), None, "restart")[side]
+        self._gateway_ready[side] = False
+        if not stop.get("ok"):
+            logging.error("Restart %s: could not stop the old instance: %s", side, stop)
+            return {"ok": False, "stop": stop, "launch": {"ok": False, "skipped": True, "error": "stop failed"}}
+        self._gateway_up[side] = False
+        launch = self.launch_p2cs() if side == "p2cs" else self.launch_c2cs()
+        return {"ok": bool(launch.get("ok")), "stop": stop, "launch": launch}
+
+    @traced()
+    def reconnect_stream(self, name: str, *, keep_uid: bool = False) -> Dict[str, dict]:
+        """
+        Re-establish one stream after an s2uc process or a gateway died; its port reservation is kept
+        - keep_uid: only outbound-request runs again, with the UID and listen ports saved from inbound-request
+          (p2cs still holds the stream: after a c2cs restart or a dead outbound runner)
+        - otherwise both s2uc processes are stopped and the whole connect path runs again (new UID)
+        Returns {'ok', 'stop', 'inbound'?, 'outbound'}
+        """
+        st = self._stream(name)
+        keep_uid = keep_uid and bool(st["uid"])
+        stop = self._teardown(("outbound",) if keep_uid else ("inbound", "outbound"), [st], None, st["name"])
+        st["connected"] = False
+        if keep_uid:
+            res = {"outbound": self.run_outbound(st["name"])}
+        else:
+            st.update(uid=None, listen_ports=[])
+            res = self.connect(st["name"])
+        return {"ok": all(r.get("ok") for r in res.values()), "stop": stop, **res}
+
+    # --------------------------- Resume (see journal.py) ------------------------
+
+    @traced()
+    def resume_check(self) -> Dict[str, dict]:
+        """
+        Confirm on the endpoints which journaled steps of a resumed session (--resume) still hold, in one
+        remote_fns.check_procs call per endpoint (all concurrently), and restore the controller state they left:
+          prepare         both session markers and gateway cert/key pairs are in place
+          crypto          prepare, and both peer certs (+ the PSK file with --psk-secret)
+          launch:<side>   crypto, and the journaled s2cs is still the pidfile's process, alive and listening
+          stage           prepare, and both runner certs are in place
+          inbound         launch:p2cs, and the stream's inbound s2uc is alive
+          outbound        inbound, launch:c2cs, and the stream's outbound s2uc is alive
+        A step that does not hold runs again, and so does every step after it; leftover s2uc processes of
+        the streams that reconnect are stopped first
+        Returns {step: {'ok': True, 'resumed': True, 'result'}} for the steps that need not run again
+        (main.session_steps skips them)
+        """
+        j = self.journal
+        if j is None:
+            return {}
+        gw = {side: (self._eid(ep), f"{listener}:{int(self.args.sync_port)}")
+              for side, ep, listener in (("p2cs", self.args.p2cs_ep, self.args.p2cs_listener),
+                                         ("c2cs", self.args.c2cs_ep, self.args.c2cs_listener))}
+        certs = f"{self.sess_dir}/certs"
+        marker = f"{self.pid_dir}/{self.marker_name}"
+        plan: Dict[str, dict] = {}
+
+        def want(eid: str, kind: str, *items: str) -> None:
+            e = plan.setdefault(eid, {"pidfiles": [], "addrs": [], "paths": []})
+            e[kind] += [i for i in items if i not in e[kind]]
+
+        peer = [f"{certs}/peer.crt"] + ([f"{certs}/psk.secrets"] if (self.args.psk_secret or "").strip() else [])
+        for side, (eid, addr) in gw.items():
+            want(eid, "pidfiles", self._pidfile(side))
+            want(eid, "addrs", addr)
+            want(eid, "paths", marker, f"{certs}/server.crt", f"{certs}/server.key", *peer)
+        want(self._runner_eid("inbound"), "paths", f"{certs}/p2cs.crt")
+        want(self._runner_eid("outbound"), "paths", f"{certs}/c2cs.crt")
+        for st in self.streams.values():
+            for kind in ("inbound", "outbound"):
+                want(self._runner_eid(kind), "pidfiles", self._pidfile(kind, st))
+        checks = run_parallel({
+            eid: (lambda eid=eid, e=e: call_remote(eid, "RESUME:check", remote_fns.check_procs,
+                                                   e["pidfiles"], e["addrs"], e["paths"], wait=30))
+            for eid, e in plan.items()
+        })
+        for eid, r in checks.items():
+            if not r.get("ok"):
+                logging.warning("Resume: cannot check %s (its steps run again): %s", eid, r.get("error"))
+        seen = {eid: (r.get("result") if r.get("ok") else None) or {} for eid, r in checks.items()}
+
+        def exists(eid: str, *paths: str) -> bool:
+            return all((seen[eid].get("files") or {}).get(p) for p in paths)
+
+        def running(eid: str, pidfile: str, pid: int | None = None) -> bool:
+            proc = (seen[eid].get("procs") or {}).get(pidfile) or {}
+            return bool(proc.get("alive")) and (pid is None or proc.get("pid") == pid)
+
+        valid = {"prepare": j.step_ok("prepare") and bool(self.p2cs_cert_pem and self.c2cs_cert_pem)
+                 and all(exists(eid, marker, f"{certs}/server.crt", f"{certs}/server.key") for eid, _ in gw.values())}
+        valid["crypto"] = valid["prepare"] and j.step_ok("crypto") and all(exists(eid, *peer) for eid, _ in gw.values())
+        saved_gw = j.data.get("gateways") or {}
+        for side, (eid, addr) in gw.items():
+            pid = (saved_gw.get(side) or {}).get("pid")
+            valid[f"launch:{side}"] = (valid["crypto"] and j.step_ok(f"launch:{side}")
+                                       and running(eid, self._pidfile(side), pid)
+                                       and bool((seen[eid].get("listening") or {}).get(addr)))
+        valid["stage"] = (valid["prepare"] and j.step_ok("stage") and exists(self._runner_eid("inbound"), f"{certs}/p2cs.crt")
+                          and exists(self._runner_eid("outbound"), f"{certs}/c2cs.crt"))
+        for name, st in self.streams.items():
+            inbound, outbound = self._step_name("inbound", name), self._step_name("outbound", name)
+            valid[inbound] = (valid["launch:p2cs"] and j.step_ok(inbound) and bool(st["uid"])
+                              and running(self._runner_eid("inbound"), self._pidfile("inbound", st), st["pids"].get("inbound")))
+            valid[outbound] = (valid[inbound] and valid["launch:c2cs"] and j.step_ok(outbound) and st["connected"]
+                               and running(self._runner_eid("outbound"), self._pidfile("outbound", st),
+                                           st["pids"].get("outbound")))
+        return self._resumed(valid)
+
+    def _resumed(self, valid: Dict[str, bool]) -> Dict[str, dict]:
+        """Put the controller in the state the still-valid steps left (see resume_check)"""
+        for side in ("p2cs", "c2cs"):
+            up = valid[f"launch:{side}"]
+            self._gateway_up[side] = self._gateway_ready[side] = up
+            if not up:
+                self._gateway_pid[side] = None
+        self._runner_certs_staged = valid["stage"]
+        # s2uc processes of streams that connect again: outbound always, inbound unless its UID is kept
+        stale: list[tuple] = []
+        for name, st in self.streams.items():
+            inbound, outbound = self._step_name("inbound", name), self._step_name("outbound", name)
+            if valid[outbound]:
+                continue
+            st["connected"] = False
+            st["pids"].pop("outbound", None)
+            # Unconnected streams renew their reservation (kept when still theirs; see remote_fns.reserve_ports)
+            st["reserved"] = []
+            if valid[inbound]:
+                stale.append((("outbound",), st))
+            else:
+                st.update(uid=None, listen_ports=[], pids={})
+                stale.append((("inbound", "outbound"), st))
+        if stale:
+            run_parallel({st["name"]: (lambda roles=roles, st=st: self._teardown(roles, [st], None, "resume"))
+                          for roles, st in stale})
+
+        done: Dict[str, dict] = {}
+        for step, ok in valid.items():
+            if ok:
+                done[step] = {"ok": True, "resumed": True, "result": {"ok": True}}
+        if "prepare" in done:
+            done["prepare"]["result"] = {"preclean": {}, "deepclean": {}, "markers": {}, "keygen": {}}
+        if all(st["reserved"] or not st["args"].outbound_dst_ports for st in self.streams.values()):
+            done["ports"] = {"ok": True, "resumed": True, "result": {}}
+        for name, st in self.streams.items():
+            if valid[self._step_name("inbound", name)]:
+                done[self._step_name("inbound", name)]["result"] = {"ok": True, "uid": st["uid"],
+                                                                   "listen_ports": st["listen_ports"]}
+        logging.info("Resume %s: still valid: %s; running again: %s", self.session_id,
+                     ", ".join(s for s, ok in valid.items() if ok) or "nothing",
+                     ", ".join(s for s, ok in valid.items() if not ok) or "nothing")
+        self._journal()
+        return done
+
+    # --------------------------- Live reconfiguration ---------------------------
+
+    @traced()
+    def update_stream(self, name: str, *, num_conn: int | None = None, inbound_src_ports: list[int] | None = None,
+                      outbound_dst_ports: list[int] | None = None, **overrides) -> dict:
+        """
+        Change a live stream's connections (count or ports) without touching the gateways or the other streams
+        - num_conn alone trims the stream's port lists or extends them with consecutive ports (util.ports_for;
+          the other streams' outbound ports are skipped); port lists alone set num_conn to their length; other overrides (prod_ip, cons_ip) apply as in add_stream
+        - Added consumer-side ports are reserved before anything stops (busy ones are replaced as in
+          allocate_ports); only then is the stream's s2uc pair re-requested with the new set (a new UID:
+          an s2uc request carries a fixed connection set), and the ports it dropped are released
+        - If the new configuration does not connect, the previous one is restored ('rolled_back')
+        Raises ValueError for an invalid change and RuntimeError if the added ports cannot be reserved
+        (nothing was stopped then)
+        Returns {'ok', 'changed', 'reserved'?, 'stop'?, 'connect'?, 'released'?, 'rolled_back'?}
+        """
+        st = self._stream(name)
+        old = st["args"]
+        n = num_conn
+        if n is None:
+            n = len(inbound_src_ports or outbound_dst_ports or []) or old.num_conn
+        if int(n) < 1:
+            raise ValueError("num_conn must be >= 1")
+        taken = {p for o in self.streams.values() if o is not st for p in o["args"].outbound_dst_ports}
+        src = list(inbound_src_ports) if inbound_src_ports is not None else ports_for(old.inbound_src_ports, int(n))
+        dst = (list(outbound_dst_ports) if outbound_dst_ports is not None
+               else ports_for(old.outbound_dst_ports, int(n), exclude=taken))
+        self._check_overlap(st["name"], dst)
+        new = argparse.Namespace(**{**vars(old), **overrides,
+                                    "inbound_src_ports": src, "outbound_dst_ports": dst, "num_conn": int(n)})
+        changed = {k: v for k, v in vars(new).items() if getattr(old, k, None) != v}
+        if not changed:
+            return {"ok": True, "changed": {}}
+
+        out: dict = {"changed": changed}
+        kept = list(st["reserved"])
+        added = [p for p in dst if p not in kept]
+        tmp_owner = None
+        if st["reserved"] and added:
+            # The added ports get their own owner under the stream's, so a failed reservation can only release
+            # those and never the ports the live stream holds; the stream's release covers both
+            tmp_owner = f"{self._port_owner(st['name'])}:{uuid.uuid4().hex[:8]}"
+            out["reserved"] = self._reserve_added(tmp_owner, added)
+            swap = dict(zip(added, out["reserved"]["ports"]))
+            new.outbound_dst_ports = [swap.get(p, p) for p in dst]
+            out["changed"]["outbound_dst_ports"] = new.outbound_dst_ports
+
+        if not st["connected"]:
+            st["args"] = new
+        else:
+            out["stop"] = self._teardown(("inbound", "outbound"), [st], None, st["name"])
+            st.update(args=new, uid=None, listen_ports=[], connected=False)
+            out["connect"] = self.connect(st["name"])
+            if not all(r.get("ok") for r in out["connect"].values()):
+                logging.error("Stream %s: the new configuration did not connect; restoring the previous one", st["name"])
+                self._teardown(("inbound", "outbound"), [st], None, st["name"])
+                st.update(args=old, uid=None, listen_ports=[], connected=False)
+                out["rolled_back"] = self.connect(st["name"])
+                if tmp_owner:
+                    out["released"] = self._release_ports(tmp_owner)
+                return {"ok": False, **out}
+        if st["reserved"]:
+            dropped = [p for p in kept if p not in new.outbound_dst_ports]
+            if dropped:
+                out["released"] = self._release_ports(self._port_owner(st["name"]), dropped)
+            st["reserved"] = list(new.outbound_dst_ports)
+        self._journal()
+        return {"ok": True, **out}
+
+    def _reserve_added(self, owner: str, ports: list[int]) -> dict:
+        """Reserve ports for owner on c2cs (see allocate_ports); returns {'ports', 'replaced'} or raises RuntimeError"""
+        args, kwargs = self._reserve_requests_call([{"owner": owner, "preferred": list(ports)}])
+        r = call_remote(*args, **kwargs)
+        res = r.get("result") or {}
+        alloc = (res.get("allocations") or {}).get(owner)
+        if not r.get("ok") or not alloc:
+            err = r.get("error") or (res.get("errors") or {}).get(owner)
+            raise RuntimeError(f"Port allocation failed on {self.args.c2cs_ep}: {err}")
+        if alloc["replaced"]:
+            logging.warning("Requested ports %s not available on %s; using %s", ",".join(map(str, ports)),
+                            self.args.c2cs_ep, ",".join(map(str, alloc["ports"])))
+        return alloc
+
+    @traced()
+    def set_proxy_type(self, proxy_type: str) -> dict:
+        """
+        Move the session to another proxy --type without redoing keygen, cert exchange or port allocation
+        - The type is an s2cs option, so it applies to the whole gateway pair: each running s2cs is relaunched
+          with it (restart_gateway, both concurrently), then every connected stream is reconnected
+        - If the new type does not come up, the previous one is restored ('rolled_back')
+        Returns {'ok', 'type', 'gateways', 'streams'[, 'rolled_back']}
+        """
+        old = self.args.type
+        if proxy_type == old:
+            return {"ok": True, "type": old, "gateways": {}, "streams": {}}
+        names = [n for n, st in self.streams.items() if st["connected"]]
+        res = self._switch_type(proxy_type, names)
+        if not res["ok"]:
+            logging.error("Proxy type %s did not come up; restoring %s", proxy_type, old)
+            res["rolled_back"] = self._switch_type(old, names)
+        return res
+
+    def _switch_type(self, proxy_type: str, names: list[str]) -> dict:
+        self.args.type = proxy_type
+        for st in self.streams.values():
+            st["args"].type = proxy_type
+        gateways = run_parallel({g: (lambda g=g: self.restart_gateway(g)) for g in ("p2cs", "c2cs") if self._gateway_up[g]})
+        streams: Dict[str, dict] = {}
+        if all(r.get("ok") for r in gateways.values()):
+            streams = run_parallel({n: (lambda n=n: self.reconnect_stream(n)) for n in names})
+        ok = all(r.get("ok") for r in gateways.values()) and all(r.get("ok") for r in streams.values())
+        return {"ok": ok, "type": proxy_type, "gateways": gateways, "streams": streams}
 
     # -------------------------------- Cleanup -----------------------------------
 
+    def close(self) -> None:
+        """Detach this controller from process-wide hooks (endpoint cache invalidation)"""
+        remove_endpoint_failure_hook(self._on_endpoint_failure)
+
+    @traced()
     def cleanup(self) -> Dict[str, dict]:
         """
-        Enabling post-session cleanup, prefer calling stop_since_marker
-        with this session's marker so you only kill processes started by *this* run
+        Tear down this session in one concurrent round: every s2cs / s2uc process group it started
+        (pidfiles in its own procs dir only, so other sessions on the same hosts are untouched), one
+        submission per endpoint, plus the release of its port reservations
+        Each host waits for exit with a short backoff and confirms the gateway ports are free, so the
+        gateways can be reused right away
+        Returns {'p2cs', 'c2cs', 'inbound', 'outbound', 'ports'}
         """
-        pass
-        # p = stop_since_marker("p2cs", self._eid(self.args.p2cs_ep), pid_dir=self.pid_dir, marker=self.marker_name)
-        # c = stop_since_marker("c2cs", self._eid(self.args.c2cs_ep), pid_dir=self.pid_dir, marker=self.marker_name)
-        # return {"p2cs": p, "c2cs": c}
\ No newline at end of file
+        streams = list(self.streams.values())
+        return self._cleaned_up(self._teardown(("p2cs", "c2cs", "inbound", "outbound"), streams, self.session_id))
+
+    def _cleaned_up(self, res: Dict[str, dict]) -> Dict[str, dict]:
+        self._gateways_stopped(res)
+        if res["inbound"].get("ok") and res["outbound"].get("ok"):
+            for st in self.streams.values():
+                st.update(uid=None, listen_ports=[], connected=False, pids={})
+        if self.journal is not None and all(r.get("ok") for r in res.values()):
+            # Nothing of the session is left to resume
+            self.journal.remove()
+        return res
+
+    def _journal(self, step: str | None = None, ok: bool = True) -> None:
+        """Rewrite the session journal (journal.py) after a phase completed (step) or the session state changed"""
+        if self.journal is not None:
+            self.journal.record(self, step, ok)
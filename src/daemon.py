@@ -0,0 +1,391 @@
+from __future__ import annotations
+import contextlib, json, logging, os, signal, socket, socketserver, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+from urllib.parse import parse_qs, urlsplit
+
+from controller import StreamController
+from journal import SessionJournal
+from telemetry import TelemetryCollector, from_args as telemetry_collector, format_summary
+from util import shutdown_executors
+from watchdog import Watchdog, from_args as watchdog_from_args
+from tracing import TRACER, span, summary
+
+
+def _ports(v) -> list[int]:
+    """Ports from a JSON list or a CSV string"""
+    if isinstance(v, str):
+        v = [p for p in v.split(",") if p.strip()]
+    return [int(p) for p in v]
+
+
+class ControlDaemon:
+    """
+    Long-running controller: resolves/probes endpoints, prepares and launches the gateway
+    pair ONCE, then keeps the controller, pooled executors and gateways warm while streams
+    are created and torn down through the control API
+
+    - A new stream only pays its port allocation and the two s2uc round-trips
+    - Stream registration is serialized (name/port validation); connects run concurrently
+    """
+
+    def __init__(self, args, *, build: Callable, report: Callable):
+        self.args = args
+        self._build = build
+        self._report = report
+        self._lock = threading.Lock()
+        self.ctl: Optional[StreamController] = None
+        self.telemetry: Optional[TelemetryCollector] = None
+        self.watchdog: Optional[Watchdog] = None
+        self.started_at: float | None = None
+
+    def start(self) -> int:
+        """
+        Cold start: controller + session bring-up (and any --stream given); returns the one-shot exit status
+        With --resume, the journaled session (and its streams) is continued instead
+        """
+        t0 = time.monotonic()
+        with span("daemon:start"):
+            if self.args.resume:
+                self.ctl = StreamController(self.args, default_stream=False,
+                                            resume=SessionJournal.load(self.args.journal_dir, self.args.resume))
+                done = self.ctl.resume_check()
+                steps = {**done, **self._build(self.ctl, self.args, done=done).run()}
+            else:
+                self.ctl = StreamController(self.args, default_stream=False)
+                steps = self._build(self.ctl, self.args).run()
+            code = self._report(self.ctl, steps)
+        self.started_at = time.time()
+        logging.info("Daemon bring-up finished in %.2fs (status %s)", time.monotonic() - t0, code)
+        if not code and self.args.telemetry:
+            self.telemetry = telemetry_collector(self.ctl)
+            self.telemetry.start()
+        if not code and self.args.watch:
+            self.watchdog = watchdog_from_args(self.ctl)
+            self.watchdog.start()
+        return code
+
+    def _unsupervised(self):
+        """Context in which no watchdog round runs (so a stream being removed is not 'recovered')"""
+        return self.watchdog.lock if self.watchdog is not None else contextlib.nullcontext()
+
+    def status(self) -> dict:
+        ctl = self.ctl
+        return {
+            "session_id": ctl.session_id,
+            "sess_dir": ctl.sess_dir,
+            "endpoints": ctl.endpoints,
+            "uptime_s": round(time.time() - (self.started_at or time.time()), 3),
+            "streams": len(ctl.streams),
+            "telemetry": self.telemetry is not None and self.telemetry.running,
+            "watchdog": self.watchdog is not None and self.watchdog.running,
+        }
+
+    def tail_log(self, log: str, offset: int) -> tuple[int, dict]:
+        try:
+            r = self.ctl.tail_log(log, offset=offset)
+        except ValueError as e:
+            return 404, {"ok": False, "error": str(e)}
+        return (200 if r.get("ok") else 502), r
+
+    def telemetry_summary(self, name: str | None = None) -> tuple[int, dict]:
+        if self.telemetry is None:
+            return 404, {"ok": False, "error": "telemetry is off (start the daemon with --telemetry)"}
+        if name is not None and name not in self.ctl.streams:
+            return 404, {"ok": False, "error": f"Unknown stream '{name}'"}
+        return 200, self.telemetry.summary(name)
+
+    def watchdog_summary(self) -> tuple[int, dict]:
+        if self.watchdog is None:
+            return 404, {"ok": False, "error": "watchdog is off (start the daemon with --watch)"}
+        return 200, self.watchdog.summary()
+
+    def list_streams(self) -> list[dict]:
+        return self.ctl.list_streams()
+
+    def get_stream(self, name: str) -> Optional[dict]:
+        return next((st for st in self.ctl.list_streams() if st["name"] == name), None)
+
+    def create_stream(self, spec: dict) -> tuple[int, dict]:
+        """
+        Register, allocate ports for and connect one stream; a stream that fails is removed again
+        Returns (HTTP status, body)
+        """
+        with span("daemon:create_stream", stream=spec.get("name")):
+            return self._create_stream(spec)
+
+    def _create_stream(self, spec: dict) -> tuple[int, dict]:
+        t0 = time.monotonic()
+        name = spec.get("name")
+        overrides = {k: spec[k] for k in ("prod_ip", "cons_ip") if spec.get(k)}
+        try:
+            with self._lock:
+                self.ctl.add_stream(
+                    name,
+                    inbound_src_ports=_ports(spec["inbound_src_ports"]) if "inbound_src_ports" in spec else None,
+                    outbound_dst_ports=_ports(spec["outbound_dst_ports"]) if "outbound_dst_ports" in spec else None,
+                    num_conn=spec.get("num_conn"),
+                    **overrides,
+                )
+        except (ValueError, TypeError) as e:
+            return 400, {"ok": False, "error": str(e)}
+
+        try:
+            self.ctl.allocate_ports(name)
+        except RuntimeError as e:
+            # A failed allocation holds nothing (partial reservations are released on the gateway)
+            with self._lock:
+                self.ctl.streams.pop(name, None)
+            return 409, {"ok": False, "error": str(e)}
+
+        conn = self.ctl.connect(name)
+        elapsed = round(time.monotonic() - t0, 3)
+        if any(not v.get("ok") for v in conn.values()):
+            logging.error("Stream %s failed to connect: %s", name, conn)
+            teardown = self.ctl.remove_stream(name)
+            return 502, {"ok": False, "error": "connect failed", "connect": conn, "teardown": teardown, "elapsed": elapsed}
+        logging.info("Stream %s connected in %.2fs", name, elapsed)
+        return 201, {"ok": True, "stream": self.get_stream(name), "elapsed": elapsed}
+
+    def update_stream(self, name: str, spec: dict) -> tuple[int, dict]:
+        """Change a live stream's connection count / ports (StreamController.update_stream); other streams keep running"""
+        if name not in self.ctl.streams:
+            return 404, {"ok": False, "error": f"Unknown stream '{name}'"}
+        unknown = set(spec) - {"num_conn", "inbound_src_ports", "outbound_dst_ports", "prod_ip", "cons_ip"}
+        if unknown:
+            return 400, {"ok": False, "error": f"cannot change {', '.join(sorted(unknown))} of a stream"
+                         + (" (the proxy type is per gateway pair: PATCH /gateways)" if "type" in unknown else "")}
+        t0 = time.monotonic()
+        try:
+            with span("daemon:update_stream", stream=name), self._unsupervised():
+                res = self.ctl.update_stream(
+                    name,
+                    num_conn=spec.get("num_conn"),
+                    inbound_src_ports=_ports(spec["inbound_src_ports"]) if "inbound_src_ports" in spec else None,
+                    outbound_dst_ports=_ports(spec["outbound_dst_ports"]) if "outbound_dst_ports" in spec else None,
+                    **{k: spec[k] for k in ("prod_ip", "cons_ip") if spec.get(k)},
+                )
+        except (ValueError, TypeError) as e:
+            return 400, {"ok": False, "error": str(e)}
+        except RuntimeError as e:
+            return 409, {"ok": False, "error": str(e)}
+        res["elapsed"] = round(time.monotonic() - t0, 3)
+        logging.info("Stream %s updated in %.2fs (ok=%s): %s", name, res["elapsed"], res["ok"], res["changed"])
+        return (200 if res["ok"] else 502), {**res, "stream": self.get_stream(name)}
+
+    def update_gateways(self, spec: dict) -> tuple[int, dict]:
+        """Move the gateway pair to another proxy type (StreamController.set_proxy_type)"""
+        if set(spec) != {"type"} or not isinstance(spec["type"], str) or not spec["type"]:
+            return 400, {"ok": False, "error": 'body must be {"type": "<proxy type>"}'}
+        t0 = time.monotonic()
+        with span("daemon:update_gateways", type=spec["type"]), self._unsupervised():
+            res = self.ctl.set_proxy_type(spec["type"])
+        res["elapsed"] = round(time.monotonic() - t0, 3)
+        return (200 if res["ok"] else 502), res
+
+    def delete_stream(self, name: str) -> tuple[int, dict]:
+        if name not in self.ctl.streams:
+            return 404, {"ok": False, "error": f"Unknown stream '{name}'"}
+        with self._unsupervised():
+            res = self.ctl.remove_stream(name)
+        ok = all(r.get("ok") for r in res.values())
+        return (200 if ok else 502), {"ok": ok, "teardown": res}
+
+    def stop(self) -> dict:
+        """Tear down every stream and the session (one concurrent round, see StreamController.cleanup)"""
+        res = {"streams": list(self.ctl.streams) if self.ctl is not None else []}
+        if self.ctl is None:
+            return res
+        if self.watchdog is not None:
+            # A recovery in flight finishes first, so nothing is relaunched behind the teardown
+            self.watchdog.stop()
+        if self.telemetry is not None:
+            # The teardown does not wait for a batch in flight; it is joined once the session is down
+            self.telemetry.stop(timeout=0)
+        res["cleanup"] = self.ctl.cleanup()
+        if self.telemetry is not None:
+            self.telemetry.stop(timeout=self.telemetry.batch_s)
+        return res
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """
+    JSON control API
+      GET    /status            session + endpoints
+      GET    /streams           all streams
+      GET    /streams/<name>    one stream
+      GET    /telemetry         per-connection rates, percentiles, stalls of every stream (?table for text)
+      GET    /streams/<name>/telemetry   the same for one stream
+      GET    /watchdog          health of every gateway / s2uc process and the recoveries so far (--watch)
+      GET    /logs/<log>        new lines of p2cs, c2cs, inbound[-<stream>], outbound[-<stream>] (?offset=N from
+                                the previous response; negative: the most recent output only)
+      GET    /trace             Chrome trace-event JSON of the spans recorded so far (?summary for the text report)
+      POST   /streams           create + connect {"name", "inbound_src_ports", "outbound_dst_ports", "num_conn"?, "prod_ip"?, "cons_ip"?}
+      PATCH  /streams/<name>    change a live stream {"num_conn"?, "inbound_src_ports"?, "outbound_dst_ports"?, ...}
+      PATCH  /gateways          switch the proxy type of the gateway pair {"type"}
+      DELETE /streams/<name>    stop the stream's s2uc processes and forget it
+      POST   /shutdown          tear everything down and exit
+    """
+    daemon: ControlDaemon
+
+    def address_string(self) -> str:
+        # Unix-socket peers have no (host, port) address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def log_message(self, fmt, *a) -> None:
+        logging.debug("control %s: " + fmt, self.address_string(), *a)
+
+    def _send(self, code: int, body) -> None:
+        data = (json.dumps(body, default=str) + "\n").encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _path(self) -> list[str]:
+        return [p for p in self.path.split("?", 1)[0].split("/") if p]
+
+    def do_GET(self) -> None:
+        path = self._path()
+        if path == ["status"]:
+            return self._send(200, self.daemon.status())
+        if path == ["streams"]:
+            return self._send(200, {"streams": self.daemon.list_streams()})
+        if path == ["trace"]:
+            if self.path.endswith("?summary"):
+                return self._send(200, {"summary": summary()})
+            return self._send(200, TRACER.chrome_trace())
+        if path == ["watchdog"]:
+            return self._send(*self.daemon.watchdog_summary())
+        if len(path) == 2 and path[0] == "logs":
+            query = parse_qs(urlsplit(self.path).query)
+            try:
+                offset = int((query.get("offset") or ["0"])[0])
+            except ValueError:
+                return self._send(400, {"ok": False, "error": "offset must be an integer"})
+            return self._send(*self.daemon.tail_log(path[1], offset))
+        if path == ["telemetry"] or (len(path) == 3 and path[0] == "streams" and path[2] == "telemetry"):
+            code, body = self.daemon.telemetry_summary(path[1] if len(path) == 3 else None)
+            if code == 200 and self.path.endswith("?table"):
+                body = {"table": format_summary(body)}
+            return self._send(code, body)
+        if len(path) == 2 and path[0] == "streams":
+            st = self.daemon.get_stream(path[1])
+            return self._send(200, st) if st else self._send(404, {"ok": False, "error": f"Unknown stream '{path[1]}'"})
+        self._send(404, {"ok": False, "error": "not found"})
+
+    def _body(self) -> dict:
+        """The request's JSON object body; raises ValueError"""
+        n = int(self.headers.get("Content-Length") or 0)
+        spec = json.loads(self.rfile.read(n) or b"{}")
+        if not isinstance(spec, dict):
+            raise ValueError("body must be a JSON object")
+        return spec
+
+    def do_POST(self) -> None:
+        path = self._path()
+        if path == ["streams"]:
+            try:
+                spec = self._body()
+            except ValueError as e:
+                return self._send(400, {"ok": False, "error": f"invalid JSON: {e}"})
+            return self._send(*self.daemon.create_stream(spec))
+        if path == ["shutdown"]:
+            self._send(202, {"ok": True})
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+            return
+        self._send(404, {"ok": False, "error": "not found"})
+
+    def do_PATCH(self) -> None:
+        path = self._path()
+        if (len(path) == 2 and path[0] == "streams") or path == ["gateways"]:
+            try:
+                spec = self._body()
+            except ValueError as e:
+                return self._send(400, {"ok": False, "error": f"invalid JSON: {e}"})
+            if path == ["gateways"]:
+                return self._send(*self.daemon.update_gateways(spec))
+            return self._send(*self.daemon.update_stream(path[1], spec))
+        self._send(404, {"ok": False, "error": "not found"})
+
+    def do_DELETE(self) -> None:
+        path = self._path()
+        if len(path) == 2 and path[0] == "streams":
+            return self._send(*self.daemon.delete_stream(path[1]))
+        self._send(404, {"ok": False, "error": "not found"})
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def _bind_unix(path: str, handler) -> _UnixHTTPServer:
+    """Bind the control socket (owner-only); refuse if another daemon is already serving on it"""
+    if os.path.exists(path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+            raise RuntimeError(f"Another controller daemon is already listening on {path}")
+        except (ConnectionRefusedError, FileNotFoundError):
+            os.unlink(path)  # stale socket from a daemon that died
+        finally:
+            probe.close()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    old = os.umask(0o177)
+    try:
+        return _UnixHTTPServer(path, handler)
+    finally:
+        os.umask(old)
+
+
+def serve(args, *, build: Callable, report: Callable) -> int:
+    """
+    Run the daemon: cold start once, then serve the control API until SIGINT/SIGTERM or POST /shutdown
+    Returns the process exit status
+    """
+    d = ControlDaemon(args, build=build, report=report)
+    try:
+        code = d.start()
+    except ValueError as e:
+        logging.error("Daemon bring-up failed: %s", e)
+        shutdown_executors()
+        return 2
+    except Exception:
+        logging.exception("Daemon bring-up failed")
+        shutdown_executors()
+        return 2
+    if code:
+        shutdown_executors()
+        return code
+
+    handler = type("Handler", (_Handler,), {"daemon": d})
+    sock_path = None
+    if args.control_http:
+        host, _, port = args.control_http.rpartition(":")
+        server = ThreadingHTTPServer((host, int(port)), handler)
+        where = f"http://{args.control_http}"
+    else:
+        sock_path = os.path.expanduser(args.control_socket or os.path.join(args.session_base, "streamhub.sock"))
+        server = _bind_unix(sock_path, handler)
+        where = f"unix:{sock_path}"
+
+    def on_signal(sig, frame):
+        logging.warning("Received signal %s; shutting down daemon...", sig)
+        # shutdown() blocks until serve_forever() returns, so it cannot run on the serving thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+    signal.signal(signal.SIGINT, on_signal)
+    signal.signal(signal.SIGTERM, on_signal)
+
+    logging.info("Controller daemon ready (session %s); control API on %s", d.ctl.session_id, where)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if sock_path and os.path.exists(sock_path):
+            os.unlink(sock_path)
+        logging.info("Daemon teardown: %s", d.stop())
+        shutdown_executors()
+        if args.trace:
+            TRACER.write(args.trace)
+    return 0
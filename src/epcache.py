@@ -0,0 +1,138 @@
+from __future__ import annotations
+import json, logging, os, tempfile, threading, time
+from typing import Optional
+
+DEFAULT_PATH = "~/.cache/streamhub/endpoints.json"
+
+
+class EndpointCache:
+    """
+    On-disk cache of endpoint name → ID resolutions and recent successful probes
+
+    - Resolutions are keyed by normalized endpoint name and expire after ttl_s
+    - Probes are keyed by endpoint ID and expire after probe_ttl_s
+    - Gateway cert fingerprints are keyed by endpoint ID + credential key; they do not expire,
+      they are only a guess of the peer's cert that the gateway confirms (see util.key_gen_script)
+    - Staged artifacts (util.stage_remote_files) are kept per endpoint ID as the SHA-256 digests of the payloads its
+      artifact store was last seen holding (most recent ARTIFACTS_MAX); like cert fingerprints they are a guess
+      the endpoint confirms, so they do not expire
+    - Tuned connection settings (autotune.py) are keyed by gateway pair and do not expire either;
+      they describe the path, not the endpoints' liveness, so invalidate() keeps them
+    - invalidate(eid) drops the probe, cert fingerprints, staged artifacts and every resolution pointing at eid, so the next
+      run lists endpoints and probes again (used when a step fails on a cached endpoint)
+    - The file is rewritten atomically (temp file + rename); a missing or corrupt file is an empty cache
+    """
+
+    VERSION = 1
+    ARTIFACTS_MAX = 64
+
+    def __init__(self, path: str = DEFAULT_PATH, *, ttl_s: float = 3600.0, probe_ttl_s: float = 600.0):
+        self.path = os.path.expanduser(path)
+        self.ttl_s = float(ttl_s)
+        self.probe_ttl_s = float(probe_ttl_s)
+        self._lock = threading.Lock()
+        self._data = self._load()
+
+    def _load(self) -> dict:
+        empty = {"version": self.VERSION, "resolutions": {}, "probes": {}, "certs": {}, "artifacts": {}, "tuning": {}}
+        try:
+            with open(self.path) as fh:
+                data = json.load(fh)
+        except FileNotFoundError:
+            return empty
+        except (OSError, ValueError) as e:
+            logging.warning("Ignoring unreadable endpoint cache %s: %s", self.path, e)
+            return empty
+        if not isinstance(data, dict) or data.get("version") != self.VERSION:
+            return empty
+        data.setdefault("resolutions", {})
+        data.setdefault("probes", {})
+        data.setdefault("certs", {})
+        data.setdefault("artifacts", {})
+        data.setdefault("tuning", {})
+        return data
+
+    def save(self) -> None:
+        with self._lock:
+            payload = json.dumps(self._data, indent=1, sort_keys=True)
+        d = os.path.dirname(self.path) or "."
+        try:
+            os.makedirs(d, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=d, prefix=".tmp-")
+            with os.fdopen(fd, "w") as fh:
+                fh.write(payload)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logging.warning("Could not write endpoint cache %s: %s", self.path, e)
+
+    @staticmethod
+    def _fresh(entry: Optional[dict], ttl_s: float) -> bool:
+        return bool(entry) and ttl_s > 0 and (time.time() - float(entry.get("at", 0))) < ttl_s
+
+    def resolution(self, key: str) -> Optional[str]:
+        """Cached endpoint ID for a normalized name, or None if missing/expired"""
+        with self._lock:
+            e = self._data["resolutions"].get(key)
+        return e["id"] if self._fresh(e, self.ttl_s) else None
+
+    def put_resolution(self, key: str, eid: str) -> None:
+        with self._lock:
+            self._data["resolutions"][key] = {"id": eid, "at": time.time()}
+
+    def probe_ok(self, eid: str) -> bool:
+        """True if eid answered a probe within probe_ttl_s"""
+        with self._lock:
+            e = self._data["probes"].get(eid)
+        return self._fresh(e, self.probe_ttl_s)
+
+    def put_probe(self, eid: str) -> None:
+        with self._lock:
+            self._data["probes"][eid] = {"at": time.time()}
+
+    def cert_fingerprint(self, eid: str, key: str) -> Optional[str]:
+        """Last seen fingerprint of the gateway cert stored under key on eid"""
+        with self._lock:
+            return (self._data["certs"].get(f"{eid}:{key}") or {}).get("fp")
+
+    def put_cert_fingerprint(self, eid: str, key: str, fp: str) -> None:
+        with self._lock:
+            self._data["certs"][f"{eid}:{key}"] = {"fp": fp, "at": time.time()}
+
+    def artifacts(self, eid: str) -> list[str]:
+        """Digests of the payloads eid's artifact store held when last staged to"""
+        with self._lock:
+            return list((self._data["artifacts"].get(eid) or {}).get("sha256", []))
+
+    def put_artifacts(self, eid: str, digests: list[str]) -> None:
+        """Record digests eid now holds (newest last; the oldest beyond ARTIFACTS_MAX are forgotten)"""
+        with self._lock:
+            old = (self._data["artifacts"].get(eid) or {}).get("sha256", [])
+            merged = [d for d in old if d not in digests] + list(dict.fromkeys(digests))
+            self._data["artifacts"][eid] = {"sha256": merged[-self.ARTIFACTS_MAX:], "at": time.time()}
+
+    @staticmethod
+    def pair_key(p2cs_eid: str, c2cs_eid: str) -> str:
+        return f"{p2cs_eid}->{c2cs_eid}"
+
+    def tuning(self, p2cs_eid: str, c2cs_eid: str) -> Optional[dict]:
+        """Saved autotune result for a gateway pair (num_conn, port lists, measurements), or None"""
+        with self._lock:
+            e = self._data["tuning"].get(self.pair_key(p2cs_eid, c2cs_eid))
+        return dict(e) if e else None
+
+    def put_tuning(self, p2cs_eid: str, c2cs_eid: str, result: dict) -> None:
+        with self._lock:
+            self._data["tuning"][self.pair_key(p2cs_eid, c2cs_eid)] = {**result, "at": time.time()}
+
+    def invalidate(self, eid: str) -> bool:
+        """Forget everything cached about eid; returns True if anything was dropped"""
+        with self._lock:
+            dropped = self._data["probes"].pop(eid, None) is not None
+            for k in [k for k in self._data["certs"] if k.startswith(f"{eid}:")]:
+                del self._data["certs"][k]
+                dropped = True
+            dropped = self._data["artifacts"].pop(eid, None) is not None or dropped
+            for k in [k for k, v in self._data["resolutions"].items() if v.get("id") == eid]:
+                del self._data["resolutions"][k]
+                dropped = True
+        return dropped
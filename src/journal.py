@@ -0,0 +1,152 @@
+"""
+Durable session journal (--resume SESSION_ID)
+
+Every phase of a StreamController session rewrites one local JSON file (--journal-dir, default
+~/.cache/streamhub/sessions/<session-id>.json; temp file + rename, so a crash leaves the last complete
+snapshot):
+- the session ID and sess_dir, and the settings its gateways, certs and markers were built with
+- the resolved endpoints per role
+- both gateway cert PEMs
+- which steps completed, and the PIDs of the s2cs / s2uc processes they launched
+- every stream's ports, port reservation, UID and listen ports
+A session whose cleanup succeeds removes its journal.
+
+--resume loads it into a new controller (same session, no endpoint resolution for unchanged roles),
+StreamController.resume_check confirms on the endpoints which completed steps still hold, and only
+the others run again (main.session_steps)
+"""
+from __future__ import annotations
+import json, logging, os, tempfile, threading, time
+from typing import Dict, List, Optional
+
+DEFAULT_DIR = "~/.cache/streamhub/sessions"
+
+# Settings a resumed session must keep: the running gateways, their certs and the session markers depend on them
+SETTINGS = ("p2cs_ep", "c2cs_ep", "p2cs_ip", "c2cs_ip", "p2cs_listener", "c2cs_listener", "prod_ip", "cons_ip",
+            "inbound_ip", "outbound_ip", "sync_port", "type", "key_type", "session_base", "pid_dir", "cred_dir")
+
+ROLES = ("p2cs", "c2cs", "inbound", "outbound", "producer", "consumer")
+
+# Stream settings journaled on their own; any other difference from the CLI args is a per-stream override
+_STREAM_ARGS = ("inbound_src_ports", "outbound_dst_ports", "num_conn")
+
+
+def _plain(v):
+    """v as it reads back from JSON (tuples become lists, unknown types strings)"""
+    return json.loads(json.dumps(v, default=str))
+
+
+class SessionJournal:
+    """One session's journal file; record() snapshots a controller, the accessors serve --resume"""
+
+    VERSION = 1
+
+    def __init__(self, path: str, data: Optional[dict] = None):
+        self.path = path
+        self.data = data or {"version": self.VERSION, "created": time.time(), "steps": {}}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def path_for(directory: Optional[str], session_id: str) -> str:
+        return os.path.join(os.path.expanduser(directory or DEFAULT_DIR), f"{session_id}.json")
+
+    @classmethod
+    def load(cls, directory: Optional[str], session_id: str) -> "SessionJournal":
+        """The journal of session_id; raises ValueError when there is none or it cannot be read"""
+        path = cls.path_for(directory, session_id)
+        try:
+            with open(path) as fh:
+                data = json.load(fh)
+        except FileNotFoundError:
+            raise ValueError(f"No journal for session {session_id} in {os.path.dirname(path)} "
+                             f"(cleaned up, or started with --no-journal)") from None
+        except (OSError, ValueError) as e:
+            raise ValueError(f"Unreadable session journal {path}: {e}") from None
+        if not isinstance(data, dict) or data.get("version") != cls.VERSION or data.get("session_id") != session_id:
+            raise ValueError(f"Session journal {path} is not a version {cls.VERSION} journal of session {session_id}")
+        return cls(path, data)
+
+    # ------------------------------- Recording -------------------------------
+
+    def record(self, ctl, step: Optional[str] = None, ok: bool = True) -> None:
+        """Snapshot ctl's session state, plus the outcome of step, and rewrite the file"""
+        with self._lock:
+            if step:
+                self.data["steps"][step] = {"ok": bool(ok), "at": time.time()}
+            self.data.update(snapshot(ctl))
+            payload = json.dumps(self.data, indent=1, sort_keys=True, default=str)
+            d = os.path.dirname(self.path) or "."
+            try:
+                os.makedirs(d, exist_ok=True)
+                fd, tmp = tempfile.mkstemp(dir=d, prefix=".tmp-")
+                with os.fdopen(fd, "w") as fh:
+                    fh.write(payload)
+                os.replace(tmp, self.path)
+            except OSError as e:
+                logging.warning("Could not write session journal %s: %s", self.path, e)
+
+    def remove(self) -> None:
+        """Drop the journal (the session is gone; nothing left to resume)"""
+        with self._lock:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logging.warning("Could not remove session journal %s: %s", self.path, e)
+
+    # -------------------------------- Resume ---------------------------------
+
+    @property
+    def session_id(self) -> str:
+        return self.data["session_id"]
+
+    def step_ok(self, step: str) -> bool:
+        return bool((self.data.get("steps", {}).get(step) or {}).get("ok"))
+
+    def mismatched(self, args) -> List[str]:
+        """Settings (see SETTINGS) in which args differ from the journaled session"""
+        saved = self.data.get("settings") or {}
+        return [k for k in SETTINGS if k in saved and _plain(getattr(args, k, None)) != saved[k]]
+
+    def known_endpoints(self, args) -> Dict[str, str]:
+        """{role: endpoint ID} of the journaled roles still named as they were (a moved runner is resolved again)"""
+        out = {}
+        for role, e in (self.data.get("endpoints") or {}).items():
+            if e.get("name") == getattr(args, f"{role}_ep", None):
+                out[role] = e["eid"]
+        return out
+
+
+def snapshot(ctl) -> dict:
+    """The journaled part of a StreamController's state"""
+    args = vars(ctl.args)
+    endpoints = {}
+    for role in ROLES:
+        name = args.get(f"{role}_ep")
+        key = name.lower() if role in ("p2cs", "c2cs") else role
+        if key in ctl.endpoints:
+            endpoints[role] = {"name": name, "eid": ctl.endpoints[key]}
+    streams = {}
+    for name, st in list(ctl.streams.items()):
+        sargs = vars(st["args"])
+        streams[name] = {
+            **{k: _plain(sargs[k]) for k in _STREAM_ARGS},
+            "overrides": {k: _plain(v) for k, v in sargs.items() if k not in _STREAM_ARGS and args.get(k) != v},
+            "reserved": list(st["reserved"]),
+            "uid": st["uid"],
+            "listen_ports": list(st["listen_ports"]),
+            "connected": st["connected"],
+            "pids": dict(st["pids"]),
+        }
+    return {
+        "session_id": ctl.session_id,
+        "sess_dir": ctl.sess_dir,
+        "settings": {k: _plain(args.get(k)) for k in SETTINGS},
+        "endpoints": endpoints,
+        "certs": {"p2cs": ctl.p2cs_cert_pem, "c2cs": ctl.c2cs_cert_pem},
+        "gateways": {side: {"up": ctl._gateway_up[side], "pid": ctl._gateway_pid[side]} for side in ("p2cs", "c2cs")},
+        "runner_certs_staged": ctl._runner_certs_staged,
+        "streams": streams,
+        "updated": time.time(),
+    }
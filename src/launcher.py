@@ -1,90 +1,205 @@
 from __future__ import annotations
 
-from util import run_remote
+from util import run_remote, arun_remote
+from logtail import InboundParser, LOG_MAX_BYTES
 # from util import run_remote_debug as run_remote  # to echo submitted commands
 
+# Every launcher has an awaitable twin (a<name>, used by aiocontroller) built from the same <name>_script()
+
+# Readiness waiters prepended to launch scripts (no single quotes: run_remote wraps in bash -c '...')
+# - await_line: follow a log with tail -F (inotify) and return as soon as a line matches;
+#   only new bytes are read, and it gives up early if the watched PID exits
+# - await_listen: return as soon as PORT is in LISTEN state; short exponential backoff
+#   (10ms → 200ms) since a bind has no file event to wait on; fails early if PID exits
+# - show_log: the last N bytes of a log (failure diagnostics), never the whole file
+# - log_size: '@@LOGSIZE <path> <bytes>', the offset later logtail.LogTail polls continue from
+# - report_pid: '@@PID <pid>' from a pidfile, the launched process (recorded in the session journal)
+_WAITERS = r"""
+await_line() {
+    local f="$1" pat="$2" t="$3" pid="${4:-}" rc=0
+    touch "$f"
+    if [ -n "$pid" ]; then
+        coproc __TAIL { exec tail -n +1 -F -s 0.1 --pid="$pid" "$f" 2>/dev/null; }
+    else
+        coproc __TAIL { exec tail -n +1 -F "$f" 2>/dev/null; }
+    fi
+    timeout "$t" grep -m1 -q -e "$pat" <&"${__TAIL[0]}" || rc=$?
+    kill "$__TAIL_PID" 2>/dev/null || true
+    wait "$__TAIL_PID" 2>/dev/null || true
+    if [ "$rc" -ne 0 ]; then echo "NOT READY: no line matching [$pat] in $f within ${t}s (rc=$rc)" >&2; fi
+    return $rc
+}
+await_listen() {
+    local port="$1" t="$2" pid="${3:-}" d=0.01
+    local end=$(( $(date +%s%N) + $t * 1000000000 ))
+    while [ -z "$(ss -Hltn "sport = :$port" 2>/dev/null)" ]; do
+        if [ -n "$pid" ] && ! kill -0 "$pid" 2>/dev/null; then echo "NOT READY: process $pid exited" >&2; return 1; fi
+        if [ "$(date +%s%N)" -ge "$end" ]; then echo "NOT READY: port $port not listening after ${t}s" >&2; return 1; fi
+        sleep "$d"
+        d=$(awk -v d="$d" "BEGIN { d *= 2; print (d > 0.2 ? 0.2 : d) }")
+    done
+}
+show_log() {
+    local f="$1" n="$2" sz
+    sz=$(stat -c %s "$f" 2>/dev/null || echo 0)
+    if [ "$sz" -gt "$n" ]; then echo "@@LOG $f: last $n of $sz bytes"; fi
+    tail -c "$n" "$f" 2>/dev/null || true
+}
+log_size() {
+    echo "@@LOGSIZE $1 $(stat -c %s "$1" 2>/dev/null || echo 0)"
+}
+report_pid() {
+    echo "@@PID $(cat "$1" 2>/dev/null)"
+}
+"""
+
+
+def _log_cap(args) -> int:
+    return int(getattr(args, "log_max_bytes", LOG_MAX_BYTES))
+
+def with_pid(r: dict) -> dict:
+    """A successful launch result plus 'pid', the launched process (from its '@@PID' line; None if absent)"""
+    if not r.get("ok"):
+        return r
+    pid = None
+    for line in (r.get("stdout") or "").splitlines():
+        words = line.split()
+        if len(words) == 2 and words[0] == "@@PID" and words[1].isdigit():
+            pid = int(words[1])
+    return {**r, "pid": pid}
+
 def p2cs(args, uuid: str, *, sess_dir: str) -> dict:
     """
     Launch producer-side s2cs on the gateway endpoint
     - Creates cert/log/proc dirs under the session path
     - Starts s2cs in background, captures PID to procs/p2cs.pid
-    - Tails the log briefly so caller can see early output
+    - Returns as soon as the sync port is listening; only the log size is reported
+      (the tail of the log, bounded by --log-max-bytes, on failure)
     """
-    cmd = f"""
+    return with_pid(run_remote(uuid, "LAUNCH:p2cs", p2cs_script(args, sess_dir=sess_dir), wall=90, wait=90))
+
+async def ap2cs(args, uuid: str, *, sess_dir: str) -> dict:
+    return with_pid(await arun_remote(uuid, "LAUNCH:p2cs", p2cs_script(args, sess_dir=sess_dir), wall=90, wait=90))
+
+def p2cs_script(args, *, sess_dir: str) -> str:
+    """Shell body of p2cs() / ap2cs()"""
+    timeout = int(getattr(args, "ready_timeout", 45))
+    return _WAITERS + f"""
             CERT_DIR="{sess_dir}/certs" && LOG_DIR="{sess_dir}/logs" && PROC_DIR="{sess_dir}/procs" && mkdir -p "$LOG_DIR" "$PROC_DIR"
             setsid stdbuf -oL -eL s2cs \
             --server_crt="$CERT_DIR/server.crt" \
             --server_key="$CERT_DIR/server.key" --verbose \
             --listener_ip={args.p2cs_listener} \
             --type="{args.type}" > "$LOG_DIR/p2cs.log" 2>&1 & echo $! > "$PROC_DIR/p2cs.pid"
-            sleep 1 && cat "$LOG_DIR/p2cs.log"
+            await_listen {int(args.sync_port)} {timeout} "$(cat "$PROC_DIR/p2cs.pid")" || {{ show_log "$LOG_DIR/p2cs.log" {_log_cap(args)}; exit 1; }}
+            report_pid "$PROC_DIR/p2cs.pid"
+            log_size "$LOG_DIR/p2cs.log"
             """
-    return run_remote(uuid, "LAUNCH:p2cs", cmd, wall=90, wait=90)
 
 def c2cs(args, uuid: str, *, sess_dir: str) -> dict:
     """
     Launch consumer-side s2cs on the gateway endpoint
     - Creates cert/log/proc dirs under the session path
     - Starts s2cs in background, captures PID to procs/c2cs.pid
-    - Tails the log briefly so caller can see early output
+    - Returns as soon as the sync port is listening; only the log size is reported
+      (the tail of the log, bounded by --log-max-bytes, on failure)
     """
-    cmd = f"""
+    return with_pid(run_remote(uuid, "LAUNCH:c2cs", c2cs_script(args, sess_dir=sess_dir), wall=90, wait=90))
+
+async def ac2cs(args, uuid: str, *, sess_dir: str) -> dict:
+    return with_pid(await arun_remote(uuid, "LAUNCH:c2cs", c2cs_script(args, sess_dir=sess_dir), wall=90, wait=90))
+
+def c2cs_script(args, *, sess_dir: str) -> str:
+    """Shell body of c2cs() / ac2cs()"""
+    timeout = int(getattr(args, "ready_timeout", 45))
+    return _WAITERS + f"""
             CERT_DIR="{sess_dir}/certs" && LOG_DIR="{sess_dir}/logs" && PROC_DIR="{sess_dir}/procs" && mkdir -p "$LOG_DIR" "$PROC_DIR"
             setsid stdbuf -oL -eL s2cs \
                 --server_crt="$CERT_DIR/server.crt" \
                 --server_key="$CERT_DIR/server.key" --verbose \
                 --listener_ip={args.c2cs_listener} \
                 --type="{args.type}" > "$LOG_DIR/c2cs.log" 2>&1 & echo $! > "$PROC_DIR/c2cs.pid"
-            sleep 1 && cat "$LOG_DIR/c2cs.log" && echo STARTED
+            await_listen {int(args.sync_port)} {timeout} "$(cat "$PROC_DIR/c2cs.pid")" || {{ show_log "$LOG_DIR/c2cs.log" {_log_cap(args)}; exit 1; }}
+            report_pid "$PROC_DIR/c2cs.pid"
+            log_size "$LOG_DIR/c2cs.log"
             """
-    return run_remote(uuid, "LAUNCH:c2cs", cmd, wall=90, wait=90)
 
-def inbound(args, role_label: str, runner_uuid: str, *, sess_dir: str) -> dict:
+def inbound(args, role_label: str, runner_uuid: str, *, sess_dir: str, tag: str = "") -> dict:
     """
     Run s2uc inbound-request on the runner
     - Constructs receiver_ports from args.inbound_src_ports
-    - Starts inbound in background, writes PID
-    - Waits until the log mentions 'prod_listeners:' then returns the log
-    - Parses stream UID and listen ports from the log
+    - Starts inbound in its own process group (setsid) in background, writes PID
+    - Waits (event-driven, bounded by --ready-timeout) until the log mentions 'prod_listeners:', then returns
+      the log only up to that line (at most --log-max-bytes)
+    - Stream UID and listen ports are parsed from it by parse_inbound (logtail.InboundParser)
+    - tag names the stream: logs/pids become inbound-<tag>.log/.pid (untagged: inbound.log/.pid)
     """
+    r = run_remote(runner_uuid, f"INBOUND:{role_label}" + (f":{tag}" if tag else ""),
+                   inbound_script(args, sess_dir=sess_dir, tag=tag), wall=60, wait=60)
+    return parse_inbound(r)
+
+async def ainbound(args, role_label: str, runner_uuid: str, *, sess_dir: str, tag: str = "") -> dict:
+    r = await arun_remote(runner_uuid, f"INBOUND:{role_label}" + (f":{tag}" if tag else ""),
+                          inbound_script(args, sess_dir=sess_dir, tag=tag), wall=60, wait=60)
+    return parse_inbound(r)
+
+def inbound_script(args, *, sess_dir: str, tag: str = "") -> str:
+    """Shell body of inbound() / ainbound()"""
+    name = f"inbound-{tag}" if tag else "inbound"
+    timeout = int(getattr(args, "ready_timeout", 45))
     ports = getattr(args, "inbound_src_ports", [])
     recv_ports_str = ",".join(str(p) for p in ports) if isinstance(ports, (list, tuple)) else str(ports).strip().strip("[]").replace(" ", "")
-    cmd = f"""
+    return _WAITERS + f"""
             CERT_DIR="{sess_dir}/certs" && LOG_DIR="{sess_dir}/logs" && PROC_DIR="{sess_dir}/procs" && mkdir -p "$LOG_DIR" "$PROC_DIR"
-            s2uc inbound-request \
-                --server_cert="$CERT_DIR/server.crt" --remote_ip {args.prod_ip} \
+            setsid s2uc inbound-request \
+                --server_cert="$CERT_DIR/p2cs.crt" --remote_ip {args.prod_ip} \
                 --num_conn {args.num_conn} --receiver_ports={recv_ports_str}  \
-                --s2cs {args.p2cs_ip}:{args.sync_port} > "$LOG_DIR/inbound.log" 2>&1 & echo $! > "$PROC_DIR/inbound.pid" 
-            while ! grep -q "prod_listeners:" "$LOG_DIR/inbound.log"; do sleep 1; done 
-            sleep 1 && cat "$LOG_DIR/inbound.log" 
+                --s2cs {args.p2cs_ip}:{args.sync_port} > "$LOG_DIR/{name}.log" 2>&1 & echo $! > "$PROC_DIR/{name}.pid" 
+            await_line "$LOG_DIR/{name}.log" "prod_listeners:" {timeout} "$(cat "$PROC_DIR/{name}.pid")" || {{ show_log "$LOG_DIR/{name}.log" {_log_cap(args)}; exit 1; }}
+            awk -v n={_log_cap(args)} "{{ b += length(\\$0) + 1; if (b > n) exit; print }} /prod_listeners:/ {{ exit }}" "$LOG_DIR/{name}.log"
+            report_pid "$PROC_DIR/{name}.pid"
+            log_size "$LOG_DIR/{name}.log"
             """
-    r = run_remote(runner_uuid, f"INBOUND:{role_label}", cmd, wall=60, wait=60)
+
+def parse_inbound(r: dict) -> dict:
+    """inbound-request result → {ok, uid, listen_ports, stdout}"""
     if not r.get("ok"):
         return r
 
     out = (r.get("stdout") or "")
-    import re
-    uid = None
-    listen_ports = []
-
-    # Extract stream UID and listener endpoints from the log lines
-    _UID = re.search(r'^([a-f0-9-]{36})\s+.*INVALID_TOKEN PROD', out, re.MULTILINE)
-    _LISTENERS = re.findall(r'(?im)^listeners:\s*"([^"]+)"', out)
-    uid = _UID.group(1) if _UID else None
-    listen_ports = [port.split(":")[-1] for port in _LISTENERS]
-
-    if not uid or not listen_ports:
+    parser = InboundParser()
+    parser.feed(out)
+    parser.close()
+    if not parser.uid or not parser.listen_ports:
         return {"ok": False, "error": "Failed to extract stream UID or listen ports", "stdout": out}
-    return {"ok": True, "uid": uid, "listen_ports": listen_ports, "stdout": out}
+    return with_pid({"ok": True, "uid": parser.uid, "listen_ports": parser.listen_ports, "stdout": out})
 
-def outbound(args, role_label: str, runner_uuid: str, *, stream_uid: str, ports: list[str], sess_dir: str | None = None) -> dict:
+def outbound(args, role_label: str, runner_uuid: str, *, stream_uid: str, ports: list[str], sess_dir: str | None = None,
+             tag: str = "") -> dict:
     """
     Run s2uc outbound-request on the runner
     - Builds receiver ports from args.outbound_dst_ports
     - Builds backend list from inbound listen ports (p2cs_ip:port,...)
-    - Starts outbound in background, writes PID
-    - Waits for success marker in the log, then returns the log
+    - Starts outbound in its own process group (setsid) in background, writes PID
+    - Waits (event-driven, bounded by --ready-timeout) for the success marker in the log; only the log size
+      is returned (the tail of the log, bounded by --log-max-bytes, on failure)
+    - tag names the stream: logs/pids become outbound-<tag>.log/.pid (untagged: outbound.log/.pid)
     """
+    r = run_remote(runner_uuid, f"OUTBOUND:{role_label}" + (f":{tag}" if tag else ""),
+                   outbound_script(args, stream_uid=stream_uid, ports=ports, sess_dir=sess_dir, tag=tag), wall=60, wait=60)
+    return parse_outbound(r)
+
+async def aoutbound(args, role_label: str, runner_uuid: str, *, stream_uid: str, ports: list[str],
+                    sess_dir: str | None = None, tag: str = "") -> dict:
+    r = await arun_remote(runner_uuid, f"OUTBOUND:{role_label}" + (f":{tag}" if tag else ""),
+                          outbound_script(args, stream_uid=stream_uid, ports=ports, sess_dir=sess_dir, tag=tag),
+                          wall=60, wait=60)
+    return parse_outbound(r)
+
+def outbound_script(args, *, stream_uid: str, ports: list[str], sess_dir: str | None = None, tag: str = "") -> str:
+    """Shell body of outbound() / aoutbound()"""
+    name = f"outbound-{tag}" if tag else "outbound"
+    timeout = int(getattr(args, "ready_timeout", 45))
     # Build receiver ports arg from args
     dst_ports = getattr(args, "outbound_dst_ports", [])
     if isinstance(dst_ports, (list, tuple)):
@@ -95,16 +210,73 @@ def outbound(args, role_label: str, runner_uuid: str, *, stream_uid: str, ports:
     # Backends are the inbound listen ports on the producer gateway address
     backends = ",".join(f"{args.p2cs_ip}:{p}" for p in (ports or [5100 + i for i in range(args.num_conn)]))
 
-    cmd = f"""
+    return _WAITERS + f"""
             CERT_DIR="{sess_dir}/certs" && LOG_DIR="{sess_dir}/logs" && PROC_DIR="{sess_dir}/procs" && mkdir -p "$LOG_DIR" "$PROC_DIR"
-            s2uc outbound-request \
-                --server_cert=$CERT_DIR/server.crt --remote_ip {args.c2cs_ip} \
+            setsid s2uc outbound-request \
+                --server_cert="$CERT_DIR/c2cs.crt" --remote_ip {args.c2cs_ip} \
                 --num_conn {args.num_conn} --s2cs {args.c2cs_ip}:{args.sync_port}  \
-                --receiver_ports={recv_ports_str} "{stream_uid}" {backends}  > "$LOG_DIR/outbound.log" 2>&1 & echo $! > "$PROC_DIR/outbound.pid"
-            while ! grep -q "Hello message sent successfully" cat "$LOG_DIR/outbound.log"; do sleep 1 ; done 
-            sleep 1 && cat "$LOG_DIR/outbound.log"
+                --receiver_ports={recv_ports_str} "{stream_uid}" {backends}  > "$LOG_DIR/{name}.log" 2>&1 & echo $! > "$PROC_DIR/{name}.pid"
+            await_line "$LOG_DIR/{name}.log" "Hello message sent successfully" {timeout} "$(cat "$PROC_DIR/{name}.pid")" || {{ show_log "$LOG_DIR/{name}.log" {_log_cap(args)}; exit 1; }}
+            report_pid "$PROC_DIR/{name}.pid"
+            log_size "$LOG_DIR/{name}.log"
             """
-    r = run_remote(runner_uuid, f"OUTBOUND:{role_label}", cmd, wall=60, wait=60)
+
+def parse_outbound(r: dict) -> dict:
     if not r.get("ok"):
         return r
-    return {"ok": True, "stdout": r.get("stdout", "")}
\ No newline at end of file
+    return with_pid({"ok": True, "stdout": r.get("stdout", "")})
+
+def iperf_servers(args, uuid: str, *, ports: list[int], run_dir: str, bind_ip: str | None = None,
+                  one_off: bool = True) -> dict:
+    """
+    Start one iperf3 server per port (data-plane benchmark / tuning)
+    - Binds bind_ip, by default args.prod_ip (where p2cs forwards each tunnelled connection)
+    - one_off servers exit after a single test; otherwise they serve tests until stopped
+    - Daemonized with pidfiles under run_dir (server-<port>.pid) so they can be stopped afterwards
+    - Returns as soon as every port is listening
+    """
+    timeout = int(getattr(args, "ready_timeout", 45))
+    flags = "-s -1 -D" if one_off else "-s -D"
+    start = "\n".join(
+        f'            iperf3 {flags} -B {bind_ip or args.prod_ip} -p {int(p)} --pidfile "$RUN/server-{int(p)}.pid" --logfile "$RUN/server-{int(p)}.log"'
+        for p in ports)
+    ready = "\n".join(
+        f'            await_listen {int(p)} {timeout} "$(cat "$RUN/server-{int(p)}.pid" 2>/dev/null)" || {{ cat "$RUN/server-{int(p)}.log"; exit 1; }}'
+        for p in ports)
+    cmd = _WAITERS + f"""
+            RUN="{run_dir}" && mkdir -p "$RUN"
+{start}
+{ready}
+            echo STARTED
+            """
+    return run_remote(uuid, "IPERF:servers", cmd, wall=60, wait=60)
+
+def iperf_clients(args, uuid: str, *, ports: list[int], run_dir: str, duration: float, lead: float = 1.0,
+                  opts: str = "", host: str | None = None, reverse: bool = True, parallel: int = 1,
+                  label: str = "IPERF:clients") -> dict:
+    """
+    Run one iperf3 client per port, all at once
+    - Connects to host (default args.c2cs_listener, i.e. the consumer-side tunnel ports); in reverse
+      mode (-R, the default, run on the consumer host) data flows producer → consumer
+    - parallel > 1 opens that many streams per client (-P)
+    - Waits lead seconds first so the gateway CPU samplers (submitted alongside) are already running
+    - stdout: '@@WINDOW <start> <end>' (epoch seconds around the transfers), then '@@IPERF <port>'
+      followed by that client's JSON report on one line, per port
+    """
+    mode = (" -R" if reverse else "") + (f" -P {int(parallel)}" if parallel > 1 else "")
+    run = "\n".join(
+        f'            iperf3 -c {host or args.c2cs_listener} -p {int(p)} -t {duration:g} -i 0{mode} -J {opts} > "$RUN/client-{int(p)}.json" 2>&1 &'
+        for p in ports)
+    # One line per report (JSON without its newlines) keeps the output well under the result line limit
+    show = "\n".join(f'            echo "@@IPERF {int(p)}"; tr -d "\\n" < "$RUN/client-{int(p)}.json"; echo' for p in ports)
+    cmd = f"""
+            RUN="{run_dir}" && mkdir -p "$RUN" && rm -f "$RUN"/client-*.json
+            sleep {lead:g}
+            t0=$(date +%s.%N)
+{run}
+            wait
+            echo "@@WINDOW $t0 $(date +%s.%N)"
+{show}
+            """
+    limit = int(lead + duration + 60)
+    return run_remote(uuid, label, cmd, wall=limit, wait=limit)
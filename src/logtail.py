@@ -0,0 +1,97 @@
+"""
+Incremental, bounded log capture for s2cs/s2uc logs
+
+- LOG_MAX_BYTES caps how much of a log any launch script or tail call sends back
+- remote_fns.tail_log returns only the bytes after an offset (whole lines, at most max_bytes);
+  LogTail keeps the offset per log so repeated calls never resend what was already read
+- InboundParser consumes s2uc inbound-request output chunk by chunk (partial lines are held back)
+  and extracts the stream UID and listener ports as soon as their lines appear
+"""
+from __future__ import annotations
+import re
+from typing import Callable, List, Optional
+
+import remote_fns
+from util import call_remote
+
+LOG_MAX_BYTES = 64 * 1024
+
+# s2uc inbound-request output: '<uuid> INVALID_TOKEN PROD ...', 'listeners: "<ip>:<port>"' (one per
+# connection), then 'prod_listeners: ...' once every listener is up
+_UID = re.compile(r"^([a-f0-9-]{36})\s+.*INVALID_TOKEN PROD")
+_LISTENER = re.compile(r'^listeners:\s*"([^"]+)"', re.IGNORECASE)
+_READY = re.compile(r"prod_listeners:")
+
+
+class InboundParser:
+    """Streaming parser for s2uc inbound-request output"""
+
+    def __init__(self):
+        self.uid: Optional[str] = None
+        self.listen_ports: List[str] = []
+        self.ready = False
+        self._partial = ""
+
+    def feed(self, chunk: str) -> bool:
+        """Consume more output; returns True once the UID and the complete listener list are known"""
+        lines = (self._partial + chunk).split("\n")
+        self._partial = lines.pop()
+        for line in lines:
+            self._line(line.rstrip("\r"))
+        return self.done
+
+    def close(self) -> bool:
+        """End of output: parse a final line without a newline"""
+        if self._partial:
+            self._line(self._partial.rstrip("\r"))
+            self._partial = ""
+        return self.done
+
+    def _line(self, line: str) -> None:
+        if self.ready:
+            return
+        if self.uid is None:
+            m = _UID.match(line)
+            if m:
+                self.uid = m.group(1)
+                return
+        m = _LISTENER.match(line)
+        if m:
+            self.listen_ports.append(m.group(1).split(":")[-1])
+        elif _READY.search(line):
+            self.ready = True
+
+    @property
+    def done(self) -> bool:
+        return bool(self.uid and self.listen_ports and self.ready)
+
+
+class LogTail:
+    """Follow one remote log: each poll() returns only the lines written since the previous one"""
+
+    def __init__(self, endpoint_id: str, path: str, *, offset: int = 0, max_bytes: int = LOG_MAX_BYTES,
+                 label: str = "LOG:tail"):
+        self.endpoint_id = endpoint_id
+        self.path = path
+        self.offset = int(offset)
+        self.max_bytes = int(max_bytes)
+        self.label = label
+
+    def poll(self) -> dict:
+        """
+        {ok, data, offset, size, more, skipped}; on success the offset advances past data
+        (more: further complete lines are already waiting beyond max_bytes)
+        """
+        r = call_remote(self.endpoint_id, self.label, remote_fns.tail_log, self.path, self.offset, self.max_bytes, wait=60)
+        if not r.get("ok"):
+            return r
+        res = r["result"]
+        self.offset = res["offset"]
+        return {"ok": True, **res}
+
+    def follow(self, feed: Callable[[str], bool]) -> dict:
+        """Poll until feed(data) returns True or nothing new is waiting; returns the last poll result"""
+        while True:
+            r = self.poll()
+            if not r.get("ok") or feed(r["data"]) or not r["more"]:
+                return r
@@ -1,16 +1,26 @@
 from __future__ import annotations
+import atexit
 import logging
 import signal
 import sys
+import threading
 
+import backends
 from config import get_args
 from controller import StreamController
+from journal import SessionJournal
+from scheduler import StepScheduler
+from telemetry import from_args as telemetry_collector, format_summary
+from util import configure_executor_pool, shutdown_executors
+from watchdog import from_args as watchdog_from_args
+from tracing import TRACER, span, summary
 
 
 def _install_signal_cleanup(ctl: StreamController):
     """
     Install SIGINT/SIGTERM handlers that:
     - attempt controller.cleanup()
+    - shut down pooled Compute executors
     - then exit with status 1
     Ensures stray processes are killed when the user Ctrl-C's
     """
@@ -20,6 +30,7 @@ def _install_signal_cleanup(ctl: StreamController):
             res = ctl.cleanup()
             logging.info("Cleanup (signal): %s", res)
         finally:
+            shutdown_executors()
             sys.exit(1)
     signal.signal(signal.SIGINT, handler)
     signal.signal(signal.SIGTERM, handler)
@@ -35,67 +46,211 @@ def main():
         #]
     )
 
-    ctl = StreamController(args)
-    _install_signal_cleanup(ctl)
-
-    #  Cleanup previous session's proxies
-    if args.cleanup:
-        pre = ctl.preclean_previous_session()
-        logging.info("Pre-clean (previous session): %s", pre)
-        if any(not r.get("ok") for r in pre.values()):
-            logging.error("Pre-clean failed: %s", pre)
-            sys.exit(2)
-    
-    #  Cleanup all the proxies
-    if not args.no_deep_clean:
-        deep = ctl.deep_clean_previous_session()
-        logging.info("Deep-clean: %s", deep)
-        if any(not r.get("ok") for r in deep.values()):
-            logging.error("Deep-clean failed: %s", deep)
-            sys.exit(2)
-
-    # Fail if requested ports are busy
+    # Executors are pooled per endpoint for the whole process; release them on exit
+    configure_executor_pool(max_size=args.executor_pool_size, idle_s=args.executor_idle)
+    backends.configure(persist_s=args.ssh_persist, control_dir=args.ssh_control_dir)
+    atexit.register(shutdown_executors)
+    if args.sim or args.sim_profile or args.sim_record or args.sim_replay:
+        import simcompute
+        simcompute.install(root=args.sim_root, profile=args.sim_profile, record=args.sim_record, replay=args.sim_replay)
+        atexit.register(simcompute.uninstall)
+
+    if args.campaign:
+        # Many gateway pairs / streams from one spec, with shared resolution and bounded concurrency
+        from campaign import run as run_campaign
+        try:
+            code = run_campaign(args)
+        finally:
+            write_trace(args)
+        sys.exit(code)
+
+    if args.daemon:
+        # Long-running mode: keep endpoints, executors and gateways warm behind a local control API
+        from daemon import serve
+        sys.exit(serve(args, build=session_steps, report=_report))
+
     try:
-        ctl.verify_requested_ports_available()
-    except Exception as e:
-        logging.error("Port availability check failed: %s", e)
-        sys.exit(2)
-
-    # Markers inside the real SciStream PID dir (/tmp/.scistream/{sess})
-    mark = ctl.create_remote_markers()
-    if any(not r.get("ok") for r in mark.values()):
-        logging.error("Failed to create session markers: %s", mark)
-        sys.exit(2)
-
-    # Crypto: keygen on both ends + cross-trust
-    crypto = ctl.setup_crypto()
-    if any(not r.get("ok") for r in crypto.values()):
-        logging.error("Crypto setup failed: %s", crypto)
-        sys.exit(2)
-
-    # PSK distribution
-    psk = ctl.distribute_psk()
-    if any(not r.get("ok") for r in psk.values()):
-        logging.error("PSK distribution failed: %s", psk)
-        sys.exit(2)
-
-    # Launch p2cs and c2cs
-    r1 = ctl.launch_p2cs()
-    r2 = ctl.launch_c2cs()
-    if not r1.get("ok") or not r2.get("ok"):
-        logging.error("Service launch failed: p2cs=%s c2cs=%s", r1, r2)
-        res = ctl.cleanup()
-        logging.info("Cleanup after launch failure: %s", res)
-        sys.exit(3)
-
-    # Connect: inbound → parse UID/ports → outbound
-    conn = ctl.connect()
-    if any(not v.get("ok") for v in conn.values()):
-        logging.error("Connect failed: %s", conn)
-        res = ctl.cleanup()
-        logging.info("Cleanup after connect failure: %s", res)
-        sys.exit(4)
+        with span("session"):
+            if args.resume:
+                # Continue an interrupted session from its journal: only the steps that no longer hold run again
+                try:
+                    ctl = StreamController(args, resume=SessionJournal.load(args.journal_dir, args.resume))
+                except ValueError as e:
+                    logging.error("%s", e)
+                    sys.exit(2)
+                _install_signal_cleanup(ctl)
+                done = ctl.resume_check()
+                steps = {**done, **session_steps(ctl, args, done=done).run()}
+            else:
+                ctl = StreamController(args)
+                _install_signal_cleanup(ctl)
+                steps = session_steps(ctl, args).run()
+            code = _report(ctl, steps)
+    finally:
+        write_trace(args)
+    if code:
+        sys.exit(code)
+    if args.telemetry or args.watch:
+        monitor(ctl, args)
+
+
+def monitor(ctl: StreamController, args) -> None:
+    """
+    --telemetry / --watch: stay up; log a per-connection summary every --telemetry-report seconds
+    and/or relaunch dead s2cs/s2uc processes (watchdog.py)
+    SIGINT/SIGTERM end the run: the watchdog and the collectors stop first (so nothing is relaunched
+    behind the teardown and no sample is submitted to a shut-down executor), then the session is cleaned up
+    """
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, lambda sig, frame: stop.set())
+    signal.signal(signal.SIGTERM, lambda sig, frame: stop.set())
+    collector = telemetry_collector(ctl) if args.telemetry else None
+    dog = watchdog_from_args(ctl) if args.watch else None
+    for svc in (collector, dog):
+        if svc is not None:
+            svc.start()
+    logging.info("Monitoring streams; Ctrl-C to stop and clean up")
+    try:
+        while not stop.wait(args.telemetry_report):
+            if collector is not None:
+                logging.info("Telemetry:\n%s", format_summary(collector.summary()))
+    finally:
+        if dog is not None:
+            dog.stop()
+            w = dog.summary()
+            logging.info("Watchdog: %d recoveries (max time to recover %s s), %d failed",
+                         w["recoveries"], w["ttr_s_max"], w["failed_recoveries"])
+        if collector is not None:
+            collector.stop(timeout=0)
+            logging.info("Final telemetry:\n%s", format_summary(collector.summary()))
+        logging.info("Cleanup: %s", ctl.cleanup())
+        if collector is not None:
+            collector.stop(timeout=collector.batch_s)
+        ctl.close()
+
+
+def write_trace(args) -> None:
+    """With --trace: dump the span trace and log the critical-path / remote-call timing summary"""
+    if not getattr(args, "trace", None):
+        return
+    try:
+        TRACER.write(args.trace)
+    except OSError as e:
+        logging.error("Could not write trace %s: %s", args.trace, e)
+    logging.info("Timing summary:\n%s", summary())
+
+
+def session_steps(ctl: StreamController, args, *, done=()) -> StepScheduler:
+    """
+    Build the session bring-up (and the connect path of every registered stream) as a dependency graph
+    done: steps a resumed session still has (StreamController.resume_check); they are left out, and so are
+    the dependencies on them
+    """
+    # Independent steps run concurrently
+    sched = StepScheduler(max_workers=max(8, 2 * len(ctl.streams) + 3))
+
+    def add(step: str, fn, needs: tuple = ()) -> None:
+        if step not in done:
+            sched.add(step, fn, needs=[n for n in needs if n not in done])
+
+    # One fused submission per gateway: cleanups → marker → keygen (a resumed session's own processes are
+    # no previous session's: never cleaned)
+    resumed = bool(done) or bool(getattr(args, "resume", None))
+    add("prepare", lambda: ctl.prepare_gateways(preclean=args.cleanup and not resumed,
+                                                deep_clean=not (args.no_deep_clean or resumed)))
+
+    # Port allocation must see the cleaned state; cross-trust (+ PSK) needs both gateway certs
+    add("ports", ctl.allocate_ports, needs=("prepare",))
+    add("crypto", lambda: ctl.distribute_certs(include_psk=True), needs=("prepare",))
+
+    # Launch p2cs and c2cs side by side once the gateways are prepared (a resumed gateway whose s2cs
+    # no longer holds is stopped first)
+    launch = {"p2cs": ctl.launch_p2cs, "c2cs": ctl.launch_c2cs}
+    for side, fn in launch.items():
+        add(f"launch:{side}", (lambda side=side: ctl.restart_gateway(side)) if resumed else fn,
+            needs=("prepare", "ports", "crypto"))
+
+    # Connect each stream: inbound → parse UID/ports → outbound (runner staging overlaps the launches)
+    for name, st in ctl.streams.items():
+        if ctl._step_name("outbound", name) in done:
+            continue
+        ctl.add_connect_steps(sched, stream=name, keep_uid=ctl._step_name("inbound", name) in done,
+                              after_p2cs=tuple(d for d in ("launch:p2cs",) if d not in done),
+                              after_c2cs=tuple(d for d in ("launch:c2cs",) if d not in done),
+                              after_crypto=tuple(d for d in ("prepare",) if d not in done))
+    return sched
+
+
+def _step_result(steps: dict, name: str) -> dict:
+    """Return a step's own result dict, or a failure dict describing why it has none"""
+    st = steps.get(name) or {}
+    res = st.get("result")
+    if isinstance(res, dict):
+        return res
+    if st.get("ok"):
+        return {"ok": True}
+    return {"ok": False, "error": st.get("error")}
+
+
+def _report(ctl: StreamController, steps: dict) -> int:
+    """Log each phase outcome; returns 0, or the phase-specific exit status of the first failure"""
+    prep = _step_result(steps, "prepare")
+    if "preclean" not in prep:
+        logging.error("Gateway preparation failed: %s", prep)
+        return 2
+
+    for name, what in (("preclean", "Pre-clean"), ("deepclean", "Deep-clean")):
+        if prep[name]:
+            logging.info("%s (previous session): %s", what, prep[name])
+            if any(not r.get("ok") for r in prep[name].values()):
+                logging.error("%s failed: %s", what, prep[name])
+                return 2
+
+    if not steps["ports"]["ok"]:
+        logging.error("Port allocation failed: %s", steps["ports"].get("error"))
+        return 2
+
+    if any(not r.get("ok") for r in prep["markers"].values()):
+        logging.error("Failed to create session markers: %s", prep["markers"])
+        return 2
+
+    if any(not r.get("ok") for r in prep["keygen"].values()):
+        logging.error("Crypto setup failed: %s", prep["keygen"])
+        return 2
+    if not steps["crypto"]["ok"]:
+        logging.error("Crypto setup / PSK distribution failed: %s", _step_result(steps, "crypto"))
+        return 2
+
+    if not steps["launch:p2cs"]["ok"] or not steps["launch:c2cs"]["ok"]:
+        logging.error("Service launch failed: p2cs=%s c2cs=%s",
+                      _step_result(steps, "launch:p2cs"), _step_result(steps, "launch:c2cs"))
+        _cleanup_or_keep(ctl, "launch")
+        return 3
+
+    failed = {}
+    for name in ctl.streams:
+        conn = ctl.connect_results(steps, name)
+        if any(not v.get("ok") for v in conn.values()):
+            failed[name] = conn
+        else:
+            logging.info("Stream %s connected: uid=%s listen_ports=%s",
+                         name, ctl.streams[name]["uid"], ",".join(ctl.streams[name]["listen_ports"]))
+    if failed:
+        logging.error("Connect failed: %s", failed)
+        _cleanup_or_keep(ctl, "connect")
+        return 4
+    return 0
+
+
+def _cleanup_or_keep(ctl: StreamController, what: str) -> None:
+    """After a failed bring-up: clean up, or keep the session for --resume with --keep-on-failure"""
+    if getattr(ctl.args, "keep_on_failure", False) and ctl.journal is not None:
+        logging.warning("Session %s kept after the %s failure; continue it with --resume %s (journal: %s)",
+                        ctl.session_id, what, ctl.session_id, ctl.journal.path)
+        return
+    res = ctl.cleanup()
+    logging.info("Cleanup after %s failure: %s", what, res)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,584 @@
+"""
+Native Python functions executed on Globus Compute endpoints
+
+Each function is registered once per process (see util.call_remote) and then
+submitted by function ID with typed arguments. They run inside the endpoint's
+worker interpreter, so every import lives inside the function body and results
+are plain dicts instead of printed status strings.
+"""
+from __future__ import annotations
+
+
+def wait_port(host: str, port: int, timeout_s: float = 60.0) -> dict:
+    """
+    Wait until a TCP connect to host:port succeeds or the deadline passes
+    Retries back off from 10ms to 250ms (a refused connect returns immediately),
+    so readiness is noticed within a fraction of a second rather than on whole-second ticks
+    Returns {'ready': bool, 'elapsed': seconds, 'attempts': n, 'error': last error or None}
+    """
+    import socket, time
+
+    start = time.monotonic()
+    deadline = start + float(timeout_s)
+    attempts = 0
+    last_err = None
+    delay = 0.01
+    while True:
+        attempts += 1
+        remaining = deadline - time.monotonic()
+        try:
+            with socket.create_connection((host, int(port)), timeout=max(0.1, min(2.0, remaining))):
+                return {"ready": True, "elapsed": time.monotonic() - start, "attempts": attempts, "error": None}
+        except OSError as e:
+            last_err = str(e)
+        if time.monotonic() >= deadline:
+            return {"ready": False, "elapsed": time.monotonic() - start, "attempts": attempts, "error": last_err}
+        time.sleep(min(delay, max(0.0, deadline - time.monotonic())))
+        delay = min(delay * 2, 0.25)
+
+
+def check_ports_free(ports: list, ip: str = "0.0.0.0") -> dict:
+    """
+    Attempt to bind each port on ip (wildcard by default); any bind failure marks it busy
+    Returns {'free': [...], 'busy': [...]}
+    """
+    import socket
+
+    free, busy = [], []
+    for p in ports:
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            s.bind((ip, int(p)))  # if this fails, the port is taken or not bindable
+            free.append(int(p))
+        except OSError:
+            busy.append(int(p))
+        finally:
+            s.close()
+    return {"free": free, "busy": busy}
+
+
+def write_files(files: list) -> dict:
+    """
+    Write several files in one call; each entry is {'path', 'data' (str or bytes), 'mode' (optional)}
+    Parent directories are created ('~' is expanded); files are replaced atomically via a temp file + rename
+    Returns {'written': [{'path', 'bytes'}]}
+    """
+    import os, tempfile
+
+    written = []
+    for f in files:
+        path = os.path.expanduser(f["path"])
+        data = f["data"]
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        d = os.path.dirname(path) or "."
+        os.makedirs(d, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=d, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                fh.write(data)
+            os.chmod(tmp, int(f.get("mode") or 0o644))
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+        written.append({"path": path, "bytes": len(data)})
+    return {"written": written}
+
+
+def stage_files(files: list, store: str) -> dict:
+    """
+    Content-addressed write_files (util.stage_remote_files); each entry is
+    {'path', 'sha256' (of the content), 'mode' (optional), 'data' (optional, str or bytes)}
+    - A file that already has that content is left alone (only its mode is fixed)
+    - Otherwise the content is 'data', or store/<sha256>: a payload this host received earlier, for any path
+    - Every payload received is kept in the store (dir 0700, files 0600), so each is sent to a host once
+    - An entry whose content is neither given nor stored is reported missing (nothing is written for it)
+    - Files are replaced atomically via a temp file + rename; 'data' that does not match its sha256 raises ValueError
+    - {'path', 'data', 'mode', 'secret': True} (no sha256) is written in place and never kept in the store;
+      a copy an earlier run stored there is removed
+    Returns {'written': [{'path', 'bytes'}], 'unchanged': [path], 'missing': [sha256], 'stored': [sha256]}
+    """
+    import hashlib, os, tempfile
+
+    store = os.path.expanduser(store)
+
+    def read(path: str, sha: str) -> bytes | None:
+        """path's content if it hashes to sha"""
+        try:
+            with open(path, "rb") as fh:
+                data = fh.read()
+        except OSError:
+            return None
+        return data if hashlib.sha256(data).hexdigest() == sha else None
+
+    def put(path: str, data: bytes, mode: int) -> None:
+        d = os.path.dirname(path) or "."
+        os.makedirs(d, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=d, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                fh.write(data)
+            os.chmod(tmp, mode)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+
+    def keep(sha: str, data: bytes) -> None:
+        """Put a payload in the store (once per call)"""
+        if sha in known:
+            return
+        known[sha] = data
+        if read(os.path.join(store, sha), sha) is None:
+            os.makedirs(store, mode=0o700, exist_ok=True)
+            put(os.path.join(store, sha), data, 0o600)
+
+    known: dict = {}
+    written, unchanged, missing = [], [], []
+    for f in files:
+        path = os.path.expanduser(f["path"])
+        data = f.get("data")
+        if f.get("secret"):
+            data = data.encode("utf-8") if isinstance(data, str) else data
+            put(path, data, int(f.get("mode") or 0o600))
+            try:
+                os.unlink(os.path.join(store, hashlib.sha256(data).hexdigest()))
+            except OSError:
+                pass
+            written.append({"path": path, "bytes": len(data)})
+            continue
+        sha, mode = f["sha256"], int(f.get("mode") or 0o644)
+        if data is not None:
+            data = data.encode("utf-8") if isinstance(data, str) else data
+            if hashlib.sha256(data).hexdigest() != sha:
+                raise ValueError(f"content of {path} does not match its sha256")
+            keep(sha, data)
+        current = read(path, sha)
+        if current is not None:
+            # Already in place (from an earlier session or run): kept, and remembered for other paths
+            keep(sha, current)
+            if os.stat(path).st_mode & 0o777 != mode:
+                os.chmod(path, mode)
+            unchanged.append(path)
+            continue
+        data = known[sha] if sha in known else read(os.path.join(store, sha), sha)
+        if data is None:
+            missing.append(sha)
+            continue
+        known[sha] = data
+        put(path, data, mode)
+        written.append({"path": path, "bytes": len(data)})
+    return {"written": written, "unchanged": unchanged, "missing": sorted(set(missing)), "stored": sorted(known)}
+
+
+def sample_cpu(pidfile: str, seconds: float, interval: float = 0.5) -> dict:
+    """
+    Sample CPU time of a process session and of the whole host every interval, for seconds
+    The session is the one led by the PID in pidfile (s2cs is started with setsid, so this
+    includes the stunnel/haproxy processes it spawns); a missing pidfile samples the host only
+    Returns {'pid', 'clk_tck', 'ncpu', 'samples': [[epoch, session_ticks | None, host_busy_ticks, host_total_ticks], ...]}
+    """
+    import os, time
+
+    try:
+        with open(os.path.expanduser(pidfile)) as fh:
+            pid = int(fh.read().strip())
+    except (OSError, ValueError):
+        pid = None
+
+    def session_ticks():
+        if pid is None:
+            return None
+        total = 0
+        for d in os.listdir("/proc"):
+            if not d.isdigit():
+                continue
+            try:
+                with open(f"/proc/{d}/stat") as fh:
+                    st = fh.read()
+            except OSError:
+                continue
+            # Fields after "(comm) ": state ppid pgrp session ... utime(11) stime(12)
+            f = st[st.rindex(")") + 2:].split()
+            if int(f[3]) == pid:
+                total += int(f[11]) + int(f[12])
+        return total
+
+    def host_ticks():
+        with open("/proc/stat") as fh:
+            v = [int(x) for x in fh.readline().split()[1:9]]
+        idle = v[3] + (v[4] if len(v) > 4 else 0)
+        return sum(v) - idle, sum(v)
+
+    samples = []
+    end = time.time() + float(seconds)
+    while True:
+        now = time.time()
+        samples.append([now, session_ticks(), *host_ticks()])
+        if now >= end:
+            break
+        time.sleep(min(float(interval), max(0.0, end - now)))
+    return {"pid": pid, "clk_tck": os.sysconf("SC_CLK_TCK"), "ncpu": os.cpu_count(), "samples": samples}
+
+
+def reserve_ports(requests: list, ip: str, port_range: list, resv_dir: str, ttl_s: float = 600.0,
+                  contiguous: bool = False, strict: bool = False) -> dict:
+    """
+    Find and reserve free ports on this host for several owners in one call
+    - requests: [{'owner', 'preferred': [...], 'count' (default len(preferred))}], served in order
+    - A reservation is a file resv_dir/<port> holding its owner, created with O_EXCL so concurrent
+      controllers on the same host cannot both take a port; the port must also bind on ip
+    - Reservations older than ttl_s are stale (their controller died before binding/releasing) and are reclaimed;
+      ports already reserved by the same owner are kept (re-allocating is idempotent)
+    - Preferred ports are kept where free; busy ones are replaced from port_range [lo, hi]
+      (contiguous: the whole set is one block of consecutive ports; strict: no replacement, fail instead)
+    Returns {'allocations': {owner: {'ports': [...], 'replaced': {busy: new}}}, 'errors': {owner: message}}
+    """
+    import os, socket, time
+
+    resv_dir = os.path.expanduser(resv_dir)
+    os.makedirs(resv_dir, exist_ok=True)
+    lo, hi = int(port_range[0]), int(port_range[1])
+
+    def bindable(p: int) -> bool:
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            s.bind((ip, p))
+            return True
+        except OSError:
+            return False
+        finally:
+            s.close()
+
+    def reserve(p: int, owner: str) -> bool:
+        path = os.path.join(resv_dir, str(p))
+        try:
+            with open(path) as fh:
+                holder = fh.read().strip()
+            if holder == owner:
+                return True
+            if time.time() - os.stat(path).st_mtime < float(ttl_s):
+                return False
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, "w") as fh:
+            fh.write(owner)
+        if bindable(p):
+            return True
+        os.unlink(path)
+        return False
+
+    def release(ports, owner: str) -> None:
+        for p in ports:
+            path = os.path.join(resv_dir, str(p))
+            try:
+                with open(path) as fh:
+                    if fh.read().strip() == owner:
+                        os.unlink(path)
+            except OSError:
+                pass
+
+    def block(count: int, owner: str):
+        start = lo
+        while start + count - 1 <= hi:
+            got = []
+            for p in range(start, start + count):
+                if not reserve(p, owner):
+                    break
+                got.append(p)
+            if len(got) == count:
+                return got
+            release(got, owner)
+            start += len(got) + 1
+        return None
+
+    allocations, errors = {}, {}
+    for req in requests:
+        owner = req["owner"]
+        preferred = [int(p) for p in req.get("preferred") or []]
+        count = int(req.get("count") or len(preferred))
+        taken = [p for p in preferred[:count] if reserve(p, owner)]
+        busy = [p for p in preferred[:count] if p not in taken]
+        if not busy and len(taken) == count:
+            allocations[owner] = {"ports": taken, "replaced": {}}
+            continue
+        if strict:
+            release(taken, owner)
+            errors[owner] = f"ports busy or reserved: {','.join(map(str, busy))}"
+            continue
+        if contiguous:
+            release(taken, owner)
+            got = block(count, owner)
+            if got is None:
+                errors[owner] = f"no block of {count} free ports in {lo}-{hi}"
+            else:
+                allocations[owner] = {"ports": got, "replaced": {}}
+            continue
+        extra = []
+        for p in range(lo, hi + 1):
+            if len(taken) + len(extra) >= count:
+                break
+            if p not in preferred and reserve(p, owner):
+                extra.append(p)
+        if len(taken) + len(extra) < count:
+            release(taken + extra, owner)
+            errors[owner] = f"only {len(taken) + len(extra)} of {count} ports free in {lo}-{hi}"
+            continue
+        # Replacements take the busy ports' positions, so the order still pairs with the producer ports
+        it = iter(extra)
+        ports = [p if p in taken else next(it) for p in preferred[:count]] + list(it)
+        allocations[owner] = {"ports": ports, "replaced": {b: ports[preferred.index(b)] for b in busy}}
+    return {"allocations": allocations, "errors": errors}
+
+
+def release_ports(resv_dir: str, owner: str, ports: list | None = None) -> dict:
+    """
+    Remove the port reservations held by owner, or by any owner under it ('<owner>:...',
+    e.g. a session id releases every stream of that session); with ports, only those of them
+    Returns {'released': [...]}
+    """
+    import os
+
+    resv_dir = os.path.expanduser(resv_dir)
+    only = None if ports is None else {str(int(p)) for p in ports}
+    released = []
+    try:
+        names = os.listdir(resv_dir)
+    except FileNotFoundError:
+        return {"released": released}
+    for name in names:
+        if not name.isdigit() or (only is not None and name not in only):
+            continue
+        path = os.path.join(resv_dir, name)
+        try:
+            with open(path) as fh:
+                holder = fh.read().strip()
+                if holder == owner or holder.startswith(owner + ":"):
+                    os.unlink(path)
+                    released.append(int(name))
+        except OSError:
+            pass
+    return {"released": sorted(released)}
+
+
+def socket_stats(procs_dir: str, ports: list, seconds: float, interval: float = 1.0) -> dict:
+    """
+    Sample kernel TCP statistics (ss -tie) of a session's established connections every interval, for seconds
+    - Connections are those owned by the processes named in procs_dir/*.pid and by every process in their
+      sessions (s2cs is started with setsid, so this includes its stunnel/haproxy children), plus any
+      connection with a local or peer port in ports (fallback when /proc/<pid>/fd is not readable)
+    - Counters are cumulative per socket; rates are derived by the caller
+    Returns {'pids': [...], 'error', 'samples': [[epoch, [[local, peer, recv_q, send_q, bytes_out, bytes_in,
+    retrans, rtt_ms], ...]], ...]}
+    """
+    import glob, os, re, subprocess, time
+
+    ports = {int(p) for p in ports}
+    num = re.compile(r"\b(bytes_acked|bytes_sent|bytes_received|retrans|rtt):([\d.]+)(?:/([\d.]+))?")
+
+    def session_pids():
+        leaders = set()
+        for f in glob.glob(os.path.join(os.path.expanduser(procs_dir), "*.pid")):
+            try:
+                with open(f) as fh:
+                    leaders.add(int(fh.read().strip()))
+            except (OSError, ValueError):
+                continue
+        pids = set()
+        for d in os.listdir("/proc"):
+            if not d.isdigit():
+                continue
+            try:
+                with open(f"/proc/{d}/stat") as fh:
+                    st = fh.read()
+            except OSError:
+                continue
+            # Fields after "(comm) ": state ppid pgrp session ...
+            if int(d) in leaders or int(st[st.rindex(")") + 2:].split()[3]) in leaders:
+                pids.add(int(d))
+        return pids
+
+    def inodes(pids):
+        found = set()
+        for pid in pids:
+            try:
+                fds = os.listdir(f"/proc/{pid}/fd")
+            except OSError:
+                continue
+            for fd in fds:
+                try:
+                    link = os.readlink(f"/proc/{pid}/fd/{fd}")
+                except OSError:
+                    continue
+                if link.startswith("socket:["):
+                    found.add(link[8:-1])
+        return found
+
+    def port_of(addr: str) -> int:
+        try:
+            return int(addr.rsplit(":", 1)[1])
+        except (IndexError, ValueError):
+            return -1
+
+    def connections(owned):
+        out = subprocess.run(["ss", "-Htie", "state", "established"], capture_output=True, text=True, timeout=10).stdout
+        rows, cur = [], None
+        for line in out.splitlines():
+            if line[:1] in (" ", "\t"):
+                if cur is not None:
+                    # Info line: cumulative TCP counters of the socket above
+                    for k, a, b in num.findall(line):
+                        cur[k] = float(b if k == "retrans" and b else a)
+                continue
+            f = line.split()
+            if len(f) < 4:
+                cur = None
+                continue
+            ino = next((t[4:] for t in f[4:] if t.startswith("ino:")), None)
+            local, peer = f[2], f[3]
+            if ino in owned or port_of(local) in ports or port_of(peer) in ports:
+                cur = {"local": local, "peer": peer, "recv_q": int(f[0]), "send_q": int(f[1])}
+                rows.append(cur)
+            else:
+                cur = None
+        return [[r["local"], r["peer"], r["recv_q"], r["send_q"],
+                 int(r.get("bytes_acked", r.get("bytes_sent", 0))), int(r.get("bytes_received", 0)),
+                 int(r.get("retrans", 0)), r.get("rtt")] for r in rows]
+
+    pids, samples, error = set(), [], None
+    end = time.time() + float(seconds)
+    while True:
+        now = time.time()
+        try:
+            # Proxy processes and their connections come and go, so ownership is refreshed on every tick
+            tick = session_pids()
+            pids |= tick
+            samples.append([now, connections(inodes(tick))])
+        except (OSError, subprocess.SubprocessError) as e:
+            error = str(e)
+            break
+        if now >= end:
+            break
+        time.sleep(min(float(interval), max(0.0, end - now)))
+    return {"pids": sorted(pids), "samples": samples, "error": error}
+
+
+def check_procs(pidfiles: list, addrs: list, paths: list | None = None) -> dict:
+    """
+    One health snapshot of a session's processes and listeners (watchdog.py; with paths, the --resume check)
+    - A pidfile's process is alive when it exists and is not a zombie; a missing or unreadable pidfile counts as dead
+    - An 'ip:port' is listening when /proc/net/tcp{,6} has a LISTEN socket on it or on the wildcard address;
+      nothing connects to the port, so the proxies never see a health check
+    - paths: which of these files exist (certs, markers)
+    Returns {'procs': {pidfile: {'pid', 'alive'}}, 'listening': {addr: bool}, 'files': {path: bool}}
+    """
+    import os, socket
+
+    def alive(pid: int) -> bool:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        try:
+            with open(f"/proc/{pid}/stat") as fh:
+                st = fh.read()
+            return st[st.rindex(")") + 2] != "Z"
+        except (OSError, ValueError, IndexError):
+            return True
+
+    def listeners() -> set:
+        found = set()
+        for path, family in (("/proc/net/tcp", socket.AF_INET), ("/proc/net/tcp6", socket.AF_INET6)):
+            try:
+                with open(path) as fh:
+                    rows = fh.read().splitlines()[1:]
+            except OSError:
+                continue
+            for row in rows:
+                f = row.split()
+                if len(f) < 4 or f[3] != "0A":  # 0A = LISTEN
+                    continue
+                ip_hex, port_hex = f[1].split(":")
+                raw = bytes.fromhex(ip_hex)
+                # The kernel prints the address as host-order 32-bit words
+                raw = b"".join(raw[i:i + 4][::-1] for i in range(0, len(raw), 4))
+                ip = socket.inet_ntop(family, raw)
+                if ip.startswith("::ffff:"):
+                    ip = ip[7:]
+                found.add((("0.0.0.0" if ip == "::" else ip), int(port_hex, 16)))
+        return found
+
+    procs = {}
+    for f in pidfiles:
+        try:
+            with open(os.path.expanduser(f)) as fh:
+                pid = int(fh.read().strip())
+        except (OSError, ValueError):
+            procs[f] = {"pid": None, "alive": False}
+            continue
+        procs[f] = {"pid": pid, "alive": alive(pid)}
+
+    bound = listeners() if addrs else set()
+    listening = {}
+    for a in addrs:
+        ip, _, port = a.rpartition(":")
+        listening[a] = (ip, int(port)) in bound or ("0.0.0.0", int(port)) in bound
+    files = {p: os.path.isfile(os.path.expanduser(p)) for p in paths or []}
+    return {"procs": procs, "listening": listening, "files": files}
+
+
+def tail_log(path: str, offset: int = 0, max_bytes: int = 65536) -> dict:
+    """
+    Read the complete lines of a log written after offset, at most max_bytes of them
+    - A negative offset means the most recent output only: the last max_bytes, from the first whole line
+    - A file shorter than offset was truncated or replaced; reading restarts at 0
+    - A partial last line is left for the next call, unless one line alone exceeds max_bytes
+    Returns {'data', 'offset' (where the next call continues), 'size', 'more', 'skipped' (bytes jumped over), 'error'}
+    """
+    import os
+
+    path = os.path.expanduser(path)
+    max_bytes = int(max_bytes)
+    try:
+        size = os.path.getsize(path)
+    except OSError as e:
+        return {"data": "", "offset": max(0, int(offset)), "size": None, "more": False, "skipped": 0, "error": str(e)}
+    start = int(offset)
+    if start > size:
+        start = 0
+    with open(path, "rb") as fh:
+        if start < 0:
+            start = max(0, size - max_bytes)
+            if start:
+                fh.seek(start - 1)
+                head = fh.read(max_bytes)
+                nl = head.find(b"\n")
+                start += nl if nl >= 0 else 0
+        fh.seek(start)
+        data = fh.read(max_bytes)
+    # Only a read cut short by max_bytes can leave complete lines behind (a partial last line is not more)
+    full = len(data) >= max_bytes
+    cut = data.rfind(b"\n") + 1
+    if cut:
+        data = data[:cut]
+    elif len(data) < max_bytes:
+        data = b""
+    end = start + len(data)
+    return {"data": data.decode("utf-8", "replace"), "offset": end, "size": size, "more": full and size > end and bool(data),
+            "skipped": start if int(offset) < 0 else 0, "error": None}
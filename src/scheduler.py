@@ -0,0 +1,145 @@
+from __future__ import annotations
+import contextvars, logging
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from tracing import TRACER
+
+
+def step_ok(result: Any) -> bool:
+    """
+    Decide whether a step result counts as success
+    - dict with an 'ok' key: that flag
+    - dict of result dicts (per-role results): all of them ok
+    - anything else (including None): success, since the step did not raise
+    """
+    if isinstance(result, dict):
+        if "ok" in result:
+            return bool(result.get("ok"))
+        vals = list(result.values())
+        if vals and all(isinstance(v, dict) for v in vals):
+            return all(step_ok(v) for v in vals)
+    return True
+
+
+def run_parallel(tasks: Dict[str, Callable[[], Any]], max_workers: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Run independent zero-arg callables concurrently and return {name: result}
+    Exceptions are converted into {'ok': False, 'error': ...} so callers keep the usual result-dict shape
+    Workers inherit the caller's context, so their trace spans nest under the caller's span
+    """
+    if not tasks:
+        return {}
+    if len(tasks) == 1:
+        (name, fn), = tasks.items()
+        return {name: _call(name, fn)}
+    with ThreadPoolExecutor(max_workers=max_workers or len(tasks)) as pool:
+        futs = {name: pool.submit(contextvars.copy_context().run, _call, name, fn) for name, fn in tasks.items()}
+        return {name: f.result() for name, f in futs.items()}
+
+
+def _call(name: str, fn: Callable[[], Any]) -> Any:
+    try:
+        return fn()
+    except Exception as e:
+        logging.exception("%s failed", name)
+        return {"ok": False, "label": name, "error": str(e)}
+
+
+class StepScheduler:
+    """
+    Dependency-graph runner for session steps
+
+    - add() registers a named step and the steps it needs
+    - run() starts every step as soon as all of its dependencies succeeded,
+      so independent steps overlap and wall-clock time approaches the critical path
+    - A failed step (raised, or returned a failed result per step_ok) causes its
+      dependents to be skipped; unrelated branches keep running
+    """
+
+    def __init__(self, max_workers: int = 8):
+        self.max_workers = max_workers
+        self._steps: Dict[str, tuple] = {}
+        self._order: list[str] = []
+
+    def add(self, name: str, fn: Callable[[], Any], *, needs: Iterable[str] = (),
+            check: Callable[[Any], bool] = step_ok) -> str:
+        """Register a step; 'needs' may reference steps added later, 'check' decides success"""
+        if name in self._steps:
+            raise ValueError(f"Duplicate step '{name}'")
+        self._steps[name] = (fn, tuple(needs), check)
+        self._order.append(name)
+        return name
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._steps
+
+    def _validate(self) -> None:
+        """Reject unknown dependencies and cycles before anything is submitted"""
+        for name, (_, needs, _) in self._steps.items():
+            for d in needs:
+                if d not in self._steps:
+                    raise ValueError(f"Step '{name}' needs unknown step '{d}'")
+        state: Dict[str, int] = {}
+
+        def visit(n: str, path: tuple) -> None:
+            if state.get(n) == 2:
+                return
+            if state.get(n) == 1:
+                raise ValueError("Dependency cycle: " + " -> ".join(path + (n,)))
+            state[n] = 1
+            for d in self._steps[n][1]:
+                visit(d, path + (n,))
+            state[n] = 2
+
+        for n in self._order:
+            visit(n, ())
+
+    def run(self) -> Dict[str, dict]:
+        """
+        Execute the graph and return {step: {'ok', 'result' | 'error' | 'skipped'}}
+        Entries are in registration order regardless of completion order
+        """
+        self._validate()
+        outcome: Dict[str, dict] = {}
+        pending = list(self._order)
+        running: Dict[Any, str] = {}
+
+        def execute(name: str) -> dict:
+            fn, needs, check = self._steps[name]
+            # Step spans carry their dependencies so tracing.critical_path can walk the graph
+            with TRACER.span(f"step:{name}", needs=list(needs)) as sp:
+                try:
+                    res = fn()
+                except Exception as e:
+                    logging.exception("Step %s failed", name)
+                    return {"ok": False, "error": str(e)}
+                ok = bool(check(res))
+                sp["attrs"]["ok"] = ok
+                return {"ok": ok, "result": res}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while pending or running:
+                for name in list(pending):
+                    needs = self._steps[name][1]
+                    failed = [d for d in needs if d in outcome and not outcome[d]["ok"]]
+                    ready = all(d in outcome for d in needs)
+                    if failed:
+                        pending.remove(name)
+                        outcome[name] = {"ok": False, "skipped": True,
+                                         "error": f"dependency failed: {', '.join(failed)}"}
+                        logging.debug("Step %s skipped (failed: %s)", name, failed)
+                    elif ready:
+                        pending.remove(name)
+                        running[pool.submit(contextvars.copy_context().run, execute, name)] = name
+                        logging.debug("Step %s started", name)
+                if not running:
+                    # Skips above may have unblocked (or doomed) more steps; loop again
+                    continue
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for fut in done:
+                    name = running.pop(fut)
+                    outcome[name] = fut.result()
+                    logging.debug("Step %s finished ok=%s", name, outcome[name]["ok"])
+
+        return {n: outcome[n] for n in self._order}
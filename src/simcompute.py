@@ -0,0 +1,467 @@
+"""
+Simulated Globus Compute backend for offline runs and benchmarks
+
+Stands in for the Executor / Client interface util.run_remote and util.call_remote use:
+- ShellFunction payloads run locally with bash in a per-endpoint sandbox directory
+  (cwd + HOME), native functions run in-process
+- Each endpoint gets configurable queue delay, network latency, jitter, worker count
+  and failure injection (random failure rate or a fully 'down' endpoint)
+- Record mode wraps the real SDK and stores every response; replay mode serves them back
+  (with their recorded latency) without touching any endpoint
+- Stand-in s2cs / s2uc / iperf3 tools are placed on the sandbox PATH so the whole controller flow
+  (and the throughput benchmark's plumbing) runs locally
+
+Install with install(...) (main.py does this for --sim-profile / --sim-record / --sim-replay).
+"""
+from __future__ import annotations
+import hashlib, itertools, json, logging, os, random, re, signal, subprocess, threading, time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+import util
+
+DEFAULT_PROFILE = {
+    # Per-endpoint behaviour; "endpoints" entries override "default" key by key
+    "default": {"queue_s": 0.05, "net_s": 0.02, "jitter": 0.2, "fail_rate": 0.0, "down": False, "workers": 4},
+    "endpoints": {},
+    # Endpoints listed by Client.get_endpoints(): name -> id
+    "visible": {"thats": "sim-thats", "neat": "sim-neat", "swell": "sim-swell"},
+    "seed": None,
+}
+
+_SESSION_RE = re.compile(r"\d{8}-\d{6}-[0-9a-f]{8}")
+_TOKEN_RE = re.compile(r"@@([0-9a-f]{12})\b")
+_PEM_RE = re.compile(r"-----BEGIN ([A-Z ]+)-----.*?-----END \1-----", re.S)
+_HEX64_RE = re.compile(r"\b[0-9a-f]{64}\b")
+
+
+def load_profile(path: Optional[str]) -> dict:
+    """DEFAULT_PROFILE merged with a JSON profile file (if given)"""
+    prof = json.loads(json.dumps(DEFAULT_PROFILE))
+    if path:
+        with open(os.path.expanduser(path)) as fh:
+            user = json.load(fh)
+        prof["default"].update(user.get("default") or {})
+        prof["endpoints"].update(user.get("endpoints") or {})
+        if user.get("visible"):
+            prof["visible"] = dict(user["visible"])
+        if "seed" in user:
+            prof["seed"] = user["seed"]
+    return prof
+
+
+# --------------------------------- Stand-in tools ---------------------------------
+
+_STUB_S2CS = r'''#!/usr/bin/env python3
+# Simulated s2cs: accept connections on <listener_ip>:5000 until killed
+import socket, sys
+opts = dict(a.lstrip("-").split("=", 1) for a in sys.argv[1:] if "=" in a)
+s = socket.socket(); s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+s.bind((opts.get("listener_ip", "127.0.0.1"), int(opts.get("port", 5000)))); s.listen(64)
+print("s2cs (simulated) listening", opts, flush=True)
+while True:
+    c, _ = s.accept(); c.close()
+'''
+
+_STUB_S2UC = r'''#!/usr/bin/env python3
+# Simulated s2uc: print what the real tool prints on success, then stay up like a running stream
+import sys, time, uuid
+mode = sys.argv[1] if len(sys.argv) > 1 else ""
+opts = dict(a.lstrip("-").split("=", 1) for a in sys.argv[2:] if a.startswith("--") and "=" in a)
+ports = [p for p in opts.get("receiver_ports", "").split(",") if p]
+if mode == "inbound-request":
+    print(f"{uuid.uuid4()} INVALID_TOKEN PROD", flush=True)
+    for i, _ in enumerate(ports or ["0"]):
+        print(f'listeners: "0.0.0.0:{5100 + i}"', flush=True)
+    print("prod_listeners: ok", flush=True)
+else:
+    print("Hello message sent successfully", flush=True)
+time.sleep(86400)
+'''
+
+_STUB_IPERF3 = r'''#!/usr/bin/env python3
+# Simulated iperf3 (-s [-1] -D -B IP -p PORT --pidfile F, or -c HOST -p PORT -t SECS [-P N] -J): no traffic is sent;
+# a server listens until stopped (-1: one test or 120s), a client waits -t seconds and prints a plausible
+# JSON report whose rate grows with -P and levels off around 5 streams (so tuning has a knee to find)
+import json, os, random, socket, sys, time
+a = sys.argv[1:]
+opt = lambda k, d=None: a[a.index(k) + 1] if k in a else d
+if "-s" in a:
+    s = socket.socket(); s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    s.bind((opt("-B", "0.0.0.0"), int(opt("-p", 5201)))); s.listen(4)
+    if "-D" in a:
+        if os.fork():
+            sys.exit(0)
+        os.setsid()
+        null = os.open(os.devnull, os.O_RDWR)
+        for fd in (0, 1, 2):
+            os.dup2(null, fd)
+    if opt("--pidfile"):
+        open(opt("--pidfile"), "w").write(str(os.getpid()))
+    s.settimeout(120 if "-1" in a else None)
+    while True:
+        try:
+            s.accept()[0].close()
+        except OSError:
+            break
+        if "-1" in a:
+            break
+    sys.exit(0)
+t, n = float(opt("-t", 10)), int(opt("-P", 1)); time.sleep(t)
+rates = [random.uniform(0.45e9, 0.55e9) * min(1.0, 5.0 / n) for _ in range(n)]
+streams = [{"sender": {"bits_per_second": r, "retransmits": random.randint(0, 10), "mean_rtt": random.randint(900, 1100),
+                       "min_rtt": 800}} for r in rates]
+print(json.dumps({"start": {"timestamp": {"timesecs": int(time.time() - t)}}, "end": {
+    "streams": streams,
+    "sum_sent": {"bits_per_second": sum(rates), "retransmits": sum(x["sender"]["retransmits"] for x in streams)},
+    "sum_received": {"bits_per_second": sum(rates) * 0.999, "seconds": t},
+    "cpu_utilization_percent": {"host_total": random.uniform(5, 15), "remote_total": random.uniform(5, 15)}}}, indent=1))
+'''
+
+
+# ------------------------------------ Results --------------------------------------
+
+class SimShellResult:
+    """Mirror of the SDK's ShellResult"""
+
+    def __init__(self, cmd: str, stdout: str, stderr: str, returncode: int):
+        self.cmd, self.stdout, self.stderr, self.returncode = cmd, stdout, stderr, returncode
+
+
+class SimTaskError(RuntimeError):
+    """A simulated task that failed (injected failure, endpoint down, missing replay)"""
+
+
+def _normalize(text: str) -> tuple[str, Dict[str, str]]:
+    """Replace run-specific values (session ids, batch tokens, PEMs, fingerprints) by placeholders"""
+    found: Dict[str, str] = {}
+    m = _SESSION_RE.search(text)
+    if m:
+        found["<SESSION>"] = m.group(0)
+    m = _TOKEN_RE.search(text)
+    if m:
+        found["<TOKEN>"] = m.group(1)
+    text = _SESSION_RE.sub("<SESSION>", text)
+    text = _TOKEN_RE.sub("@@<TOKEN>", text)
+    text = _PEM_RE.sub("<PEM>", text)
+    text = _HEX64_RE.sub("<FP>", text)
+    return text, found
+
+
+def _denormalize(text: str, found: Dict[str, str]) -> str:
+    for ph, val in found.items():
+        text = text.replace(ph, val)
+    return text
+
+
+class Recording:
+    """Recorded responses keyed by (endpoint, normalized request); repeated keys replay in order"""
+
+    def __init__(self, path: str):
+        self.path = os.path.expanduser(path)
+        self._lock = threading.Lock()
+        self._entries: Dict[str, list] = {}
+        self._cursor: Dict[str, int] = {}
+        # Client.get_endpoints() listing seen while recording (replayed as-is)
+        self.endpoints: Optional[list] = None
+
+    @staticmethod
+    def key(endpoint_id: str, request: str) -> str:
+        return hashlib.sha256(f"{endpoint_id}\n{request}".encode()).hexdigest()
+
+    def load(self) -> "Recording":
+        with open(self.path) as fh:
+            data = json.load(fh)
+        self._entries = data.get("entries", {})
+        self.endpoints = data.get("endpoints")
+        return self
+
+    def add(self, key: str, entry: dict) -> None:
+        with self._lock:
+            self._entries.setdefault(key, []).append(entry)
+
+    def next(self, key: str) -> Optional[dict]:
+        with self._lock:
+            seq = self._entries.get(key)
+            if not seq:
+                return None
+            i = self._cursor.get(key, 0)
+            self._cursor[key] = i + 1
+            return seq[min(i, len(seq) - 1)]
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._lock:
+            data = {"version": 1, "endpoints": self.endpoints, "entries": self._entries}
+        with open(self.path, "w") as fh:
+            json.dump(data, fh, indent=1)
+        logging.info("Recorded %d responses to %s", sum(len(v) for v in data["entries"].values()), self.path)
+
+
+# ------------------------------------ Backend --------------------------------------
+
+class SimBackend:
+    """
+    Factory for simulated executors/clients (see install)
+    mode: 'sim' (run locally), 'record' (real SDK + record), 'replay' (serve a recording)
+    """
+
+    def __init__(self, root: str, profile: dict, *, mode: str = "sim", recording: Optional[Recording] = None,
+                 stub_tools: bool = True):
+        self.root = os.path.abspath(os.path.expanduser(root))
+        self.profile = profile
+        self.mode = mode
+        self.recording = recording
+        self.stub_tools = stub_tools
+        self._rng = random.Random(profile.get("seed"))
+        self._rng_lock = threading.Lock()
+        self._fn_ids = itertools.count(1)
+        self._functions: Dict[str, Callable] = {}
+        self.bin_dir = os.path.join(self.root, "bin")
+        os.makedirs(self.bin_dir, exist_ok=True)
+        if stub_tools:
+            for name, body in (("s2cs", _STUB_S2CS), ("s2uc", _STUB_S2UC), ("iperf3", _STUB_IPERF3)):
+                path = os.path.join(self.bin_dir, name)
+                with open(path, "w") as fh:
+                    fh.write(body)
+                os.chmod(path, 0o755)
+
+    # Endpoint behaviour
+    def endpoint_profile(self, endpoint_id: str) -> dict:
+        prof = dict(self.profile["default"])
+        names = {v: k for k, v in self.profile["visible"].items()}
+        prof.update(self.profile["endpoints"].get(endpoint_id) or self.profile["endpoints"].get(names.get(endpoint_id, "")) or {})
+        return prof
+
+    def sample(self, base: float, jitter: float) -> float:
+        if base <= 0:
+            return 0.0
+        with self._rng_lock:
+            return max(0.0, base * (1 + self._rng.uniform(-jitter, jitter)))
+
+    def roll(self, rate: float) -> bool:
+        if rate <= 0:
+            return False
+        with self._rng_lock:
+            return self._rng.random() < rate
+
+    def sandbox(self, endpoint_id: str) -> str:
+        d = os.path.join(self.root, "endpoints", re.sub(r"[^A-Za-z0-9_.-]", "_", endpoint_id))
+        os.makedirs(os.path.join(d, "home"), exist_ok=True)
+        return d
+
+    # SDK surface
+    def executor(self, endpoint_id: str):
+        return SimExecutor(self, endpoint_id)
+
+    def client(self):
+        return SimClient(self)
+
+    def register(self, fn: Callable) -> str:
+        fid = f"sim-fn-{next(self._fn_ids)}"
+        self._functions[fid] = fn
+        return fid
+
+    def function(self, fid: str) -> Callable:
+        return self._functions[fid]
+
+    def kill_tools(self) -> int:
+        """Kill every process started from the stand-in tools directory; returns how many were signalled"""
+        n = 0
+        for pid in filter(str.isdigit, os.listdir("/proc")):
+            try:
+                with open(f"/proc/{pid}/cmdline", "rb") as fh:
+                    argv = fh.read().split(b"\0")
+            except OSError:
+                continue
+            if any(a.startswith(self.bin_dir.encode() + b"/") for a in argv):
+                try:
+                    os.kill(int(pid), signal.SIGKILL)
+                    n += 1
+                except OSError:
+                    pass
+        return n
+
+    def close(self) -> None:
+        if self.mode == "record" and self.recording is not None:
+            self.recording.save()
+        if self.stub_tools:
+            self.kill_tools()
+
+
+class SimClient:
+    def __init__(self, backend: SimBackend):
+        self._b = backend
+        self._inner = util.Client() if backend.mode == "record" else None
+
+    def get_endpoints(self):
+        rec = self._b.recording
+        if self._inner is not None:
+            visible = list(self._inner.get_endpoints())
+            rec.endpoints = [{"name": e.get("name"), "id": e.get("id") or e.get("uuid")} for e in visible]
+            return visible
+        if rec is not None and rec.endpoints is not None:
+            return list(rec.endpoints)
+        return [{"name": n, "id": eid} for n, eid in self._b.profile["visible"].items()]
+
+    def register_function(self, fn: Callable, **kwargs) -> str:
+        fid = self._inner.register_function(fn, **kwargs) if self._inner is not None else self._b.register(fn)
+        self._b._functions.setdefault(fid, fn)
+        return fid
+
+
+class SimExecutor:
+    """Executor stand-in for one endpoint: latency/failure injection around local (or recorded) execution"""
+
+    def __init__(self, backend: SimBackend, endpoint_id: str):
+        self._b = backend
+        self.endpoint_id = endpoint_id
+        self._prof = backend.endpoint_profile(endpoint_id)
+        self._pool = ThreadPoolExecutor(max_workers=max(1, int(self._prof.get("workers", 4))),
+                                        thread_name_prefix=f"sim-{endpoint_id}")
+        self._inner = util.Executor(endpoint_id=endpoint_id) if backend.mode == "record" else None
+
+    # -- latency/failure envelope
+    def _envelope(self, run: Callable[[], object]) -> object:
+        p = self._prof
+        time.sleep(self._b.sample(p.get("net_s", 0), p.get("jitter", 0)))
+        if p.get("down"):
+            raise SimTaskError(f"endpoint {self.endpoint_id} is down (simulated)")
+        time.sleep(self._b.sample(p.get("queue_s", 0), p.get("jitter", 0)))
+        if self._b.roll(float(p.get("fail_rate", 0))):
+            raise SimTaskError(f"injected failure on endpoint {self.endpoint_id}")
+        try:
+            return run()
+        finally:
+            time.sleep(self._b.sample(p.get("net_s", 0), p.get("jitter", 0)))
+
+    def _shell(self, cmd: str, walltime: Optional[float]) -> SimShellResult:
+        box = self._b.sandbox(self.endpoint_id)
+        env = dict(os.environ, HOME=os.path.join(box, "home"))
+        if self._b.stub_tools:
+            env["PATH"] = self._b.bin_dir + os.pathsep + env.get("PATH", "")
+        try:
+            p = subprocess.run(cmd, shell=True, cwd=box, env=env, capture_output=True, text=True,
+                               timeout=walltime, executable="/bin/bash")
+            rc, out, err = p.returncode, p.stdout, p.stderr
+        except subprocess.TimeoutExpired as e:
+            rc, out, err = 124, e.stdout or "", (e.stderr or "") + "walltime exceeded"
+            out = out.decode() if isinstance(out, bytes) else out
+            err = err.decode() if isinstance(err, bytes) else err
+        return SimShellResult(cmd, out, err, rc)
+
+    def _replay(self, request: str) -> dict:
+        norm, _ = _normalize(request)
+        entry = self._b.recording.next(Recording.key(self.endpoint_id, norm))
+        if entry is None:
+            raise SimTaskError(f"no recorded response for this request on {self.endpoint_id}")
+        time.sleep(float(entry.get("elapsed", 0)))
+        return entry
+
+    def _record(self, request: str, entry: dict) -> None:
+        norm, _ = _normalize(request)
+        self._b.recording.add(Recording.key(self.endpoint_id, norm), entry)
+
+    # -- SDK surface
+    def submit(self, fn, *args, walltime: Optional[float] = None, **kwargs) -> Future:
+        cmd = getattr(fn, "cmd", None)
+        if cmd is None:
+            return self._pool.submit(self._envelope, lambda: fn(*args, **kwargs))
+        # Like ShellFunction: the command line is cmd.format(**kwargs), and a non-zero exit is returned, not raised
+        line = cmd.format(walltime=walltime, **kwargs)
+        mode = self._b.mode
+        if mode == "replay":
+            def replay():
+                e = self._replay(line)
+                _, found = _normalize(line)
+                return SimShellResult(line, _denormalize(e["stdout"], found), _denormalize(e["stderr"], found), e["returncode"])
+            return self._pool.submit(replay)
+        if mode == "record":
+            return self._recorded(self._inner.submit(fn, *args, walltime=walltime, **kwargs), line, shell=True)
+        return self._pool.submit(self._envelope, lambda: self._shell(line, walltime))
+
+    def submit_to_registered_function(self, function_id: str, args=None, kwargs=None) -> Future:
+        args, kwargs = tuple(args or ()), dict(kwargs or {})
+        fn = self._b.function(function_id)
+        request = f"{fn.__module__}.{fn.__qualname__}{json.dumps([args, kwargs], sort_keys=True, default=str)}"
+        if self._b.mode == "replay":
+            def replay():
+                e = self._replay(request)
+                if e.get("error"):
+                    raise SimTaskError(e["error"])
+                _, found = _normalize(request)
+                return json.loads(_denormalize(json.dumps(e["result"]), found))
+            return self._pool.submit(replay)
+        if self._b.mode == "record":
+            return self._recorded(self._inner.submit_to_registered_function(function_id, args=args, kwargs=kwargs),
+                                  request, shell=False)
+        return self._pool.submit(self._envelope, lambda: fn(*args, **kwargs))
+
+    def _recorded(self, inner: Future, request: str, *, shell: bool) -> Future:
+        """Pass the real future's outcome through, storing it (normalized) in the recording"""
+        out: Future = Future()
+        t0 = time.monotonic()
+        _, found = _normalize(request)
+        rev = {v: k for k, v in found.items()}
+
+        def norm(text: str) -> str:
+            for val, ph in rev.items():
+                text = text.replace(val, ph)
+            return text
+
+        def done(f: Future) -> None:
+            elapsed = time.monotonic() - t0
+            try:
+                res = f.result()
+            except Exception as e:
+                entry = ({"stdout": "", "stderr": norm(str(e)), "returncode": 1} if shell else {"error": str(e)})
+                self._record(request, {**entry, "elapsed": elapsed})
+                out.set_exception(e)
+                return
+            if shell:
+                entry = {"stdout": norm(getattr(res, "stdout", "") or ""), "stderr": norm(getattr(res, "stderr", "") or ""),
+                         "returncode": int(getattr(res, "returncode", 0) or 0)}
+            else:
+                entry = {"result": json.loads(norm(json.dumps(res, default=str)))}
+            self._record(request, {**entry, "elapsed": elapsed})
+            out.set_result(res)
+
+        inner.add_done_callback(done)
+        return out
+
+    def shutdown(self, wait: bool = True, cancel_futures: bool = False) -> None:
+        self._pool.shutdown(wait=wait, cancel_futures=cancel_futures)
+        if self._inner is not None:
+            self._inner.shutdown(wait=wait, cancel_futures=cancel_futures)
+
+
+_ACTIVE: Optional[SimBackend] = None
+
+
+def install(*, root: str, profile: Optional[str] = None, record: Optional[str] = None,
+            replay: Optional[str] = None, stub_tools: bool = True) -> SimBackend:
+    """
+    Route util's executor pool and function registration through a SimBackend
+    Exactly one of: plain simulation (default), record=<file> (real endpoints), replay=<file>
+    """
+    global _ACTIVE
+    if record and replay:
+        raise ValueError("record and replay are mutually exclusive")
+    mode = "record" if record else "replay" if replay else "sim"
+    recording = Recording(record) if record else Recording(replay).load() if replay else None
+    backend = SimBackend(root, load_profile(profile), mode=mode, recording=recording,
+                         stub_tools=stub_tools and mode == "sim")
+    util.set_backend(executor_factory=backend.executor, client_factory=backend.client)
+    _ACTIVE = backend
+    logging.info("Simulated Compute backend active (%s, sandbox %s)", mode, backend.root)
+    return backend
+
+
+def uninstall() -> None:
+    """Close the active backend and restore the Globus Compute SDK"""
+    global _ACTIVE
+    util.shutdown_executors()
+    if _ACTIVE is not None:
+        _ACTIVE.close()
+        _ACTIVE = None
+    util.set_backend(executor_factory=None, client_factory=None)
@@ -0,0 +1,237 @@
+"""
+Live per-stream data-plane telemetry
+
+A collector thread per gateway (p2cs, c2cs) keeps a remote_fns.socket_stats call running: each
+call samples the kernel TCP stats of the session's connections (sockets owned by the processes
+in procs/*.pid and their sessions) every --telemetry-interval for --telemetry-batch seconds and
+returns the batch. Samples go into one bounded ring buffer per connection (--telemetry-history
+samples), so memory stays flat over a beamtime
+
+Connections are attributed to streams by port:
+  p2cs  local port in the stream's inbound listen ports, or peer port in its --inbound-src-ports
+  c2cs  local port in the stream's --outbound-dst-ports, or peer port in its inbound listen ports
+
+summary() is computed on demand from the buffers: per connection the current / mean rate,
+p5/p50/p95 of the per-interval rates, retransmits, send/receive queue depth and RTT, plus
+  stalled  data is queued (send or receive queue > 0) but the byte counters have not moved
+           for --stall-after seconds
+  slow     p50 rate below --slow-ratio x the best p50 among the stream's connections on the same gateway
+"""
+from __future__ import annotations
+import logging, statistics, threading, time
+from collections import deque
+from typing import Dict, List, Optional
+
+import remote_fns
+from util import call_remote
+
+ROLES = ("p2cs", "c2cs")
+
+
+def _port(addr: str) -> int:
+    try:
+        return int(addr.rsplit(":", 1)[1])
+    except (IndexError, ValueError):
+        return -1
+
+
+def _pct(vals: List[float], q: float) -> float:
+    """Nearest-rank percentile of sorted vals"""
+    return vals[min(len(vals) - 1, int(round(q * (len(vals) - 1))))]
+
+
+class TelemetryCollector:
+    """Samples every gateway connection of a controller's session in the background; see the module docstring"""
+
+    def __init__(self, ctl, *, interval: float = 1.0, batch_s: float = 5.0, history: int = 600,
+                 stall_s: float = 5.0, slow_ratio: float = 0.5):
+        self.ctl = ctl
+        self.interval = float(interval)
+        self.batch_s = max(float(batch_s), self.interval)
+        self.history = int(history)
+        self.stall_s = float(stall_s)
+        self.slow_ratio = float(slow_ratio)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        # (role, local, peer) -> {'role', 'local', 'peer', 'samples': deque[(t, out, in, retrans, send_q, recv_q, rtt)], 'last_seen'}
+        self._conns: Dict[tuple, dict] = {}
+        self._status: Dict[str, dict] = {role: {"ok": None, "error": None, "batches": 0, "at": None} for role in ROLES}
+
+    # ------------------------------ Collection ------------------------------
+
+    def start(self) -> None:
+        if self._threads and not self._stop.is_set():
+            return
+        self._stop.clear()
+        for role in ROLES:
+            t = threading.Thread(target=self._run, args=(role,), name=f"telemetry-{role}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        logging.info("Telemetry: sampling p2cs/c2cs connections every %.1fs (batches of %.0fs)", self.interval, self.batch_s)
+
+    def stop(self, timeout: Optional[float] = None) -> bool:
+        """
+        Stop collecting; a batch in flight is waited for (at most timeout seconds) and still ingested
+        Returns whether every collector thread has finished (call again to keep waiting)
+        """
+        self._stop.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = [t for t in self._threads if t.is_alive()]
+        return not self._threads
+
+    @property
+    def running(self) -> bool:
+        return any(t.is_alive() for t in self._threads)
+
+    def _run(self, role: str) -> None:
+        ep = self.ctl.args.p2cs_ep if role == "p2cs" else self.ctl.args.c2cs_ep
+        eid = self.ctl._eid(ep)
+        while not self._stop.is_set():
+            r = call_remote(eid, f"TELEMETRY:{role}", remote_fns.socket_stats, f"{self.ctl.sess_dir}/procs",
+                            sorted(self._ports(role)), self.batch_s, self.interval, wait=int(self.batch_s) + 60)
+            res = r.get("result") or {}
+            with self._lock:
+                st = self._status[role]
+                st.update(ok=bool(r.get("ok")) and not res.get("error"), error=r.get("error") or res.get("error"),
+                          at=time.time())
+                if r.get("ok"):
+                    st["batches"] += 1
+                    self._ingest(role, res.get("samples") or [])
+            if not st["ok"]:
+                logging.warning("Telemetry %s: %s", role, st["error"])
+                self._stop.wait(max(self.interval, 5.0))
+
+    def _ports(self, role: str) -> set:
+        """Every port that identifies a session connection on this gateway (see _stream_of)"""
+        ports = set()
+        for st in self.ctl.streams.values():
+            listen = {int(p) for p in st["listen_ports"]}
+            ports |= listen | set(st["args"].inbound_src_ports if role == "p2cs" else st["args"].outbound_dst_ports)
+        return ports
+
+    def _ingest(self, role: str, samples: list) -> None:
+        """Append one batch to the ring buffers; caller holds the lock"""
+        for t, rows in samples:
+            for local, peer, recv_q, send_q, out_b, in_b, retrans, rtt in rows:
+                key = (role, local, peer)
+                c = self._conns.get(key)
+                if c is None:
+                    c = self._conns[key] = {"role": role, "local": local, "peer": peer,
+                                            "samples": deque(maxlen=self.history), "last_seen": t}
+                c["samples"].append((t, out_b, in_b, retrans, send_q, recv_q, rtt))
+                c["last_seen"] = t
+        # Connections gone for a whole history window are forgotten
+        horizon = time.time() - self.history * self.interval
+        for key in [k for k, c in self._conns.items() if c["last_seen"] < horizon]:
+            del self._conns[key]
+
+    # ------------------------------- Summaries -------------------------------
+
+    def _stream_of(self, role: str, local: str, peer: str) -> Optional[str]:
+        lp, pp = _port(local), _port(peer)
+        for st in self.ctl.streams.values():
+            listen = {int(p) for p in st["listen_ports"]}
+            if role == "p2cs" and (lp in listen or pp in st["args"].inbound_src_ports):
+                return st["name"]
+            if role == "c2cs" and (lp in st["args"].outbound_dst_ports or pp in listen):
+                return st["name"]
+        return None
+
+    def _conn_summary(self, c: dict, now: float) -> dict:
+        s = list(c["samples"])
+        t, out_b, in_b, retrans, send_q, recv_q, rtt = s[-1]
+        rates, moved_at = [], s[0][0]
+        for a, b in zip(s, s[1:]):
+            moved = (b[1] - a[1]) + (b[2] - a[2])
+            if b[0] > a[0]:
+                rates.append(max(0, moved) * 8 / (b[0] - a[0]))
+            if moved > 0:
+                moved_at = b[0]
+        queued = send_q > 0 or recv_q > 0
+        active = now - c["last_seen"] <= 2 * self.batch_s + self.interval
+        srt = sorted(rates)
+        return {
+            "role": c["role"], "local": c["local"], "peer": c["peer"],
+            "active": active,
+            "bytes_out": out_b, "bytes_in": in_b,
+            "bps": rates[-1] if rates else None,
+            "bps_mean": statistics.fmean(rates) if rates else None,
+            "bps_p5": _pct(srt, 0.05) if srt else None,
+            "bps_p50": _pct(srt, 0.5) if srt else None,
+            "bps_p95": _pct(srt, 0.95) if srt else None,
+            "retransmits": retrans - s[0][3],
+            "send_q": send_q, "recv_q": recv_q,
+            "send_q_max": max(x[4] for x in s), "recv_q_max": max(x[5] for x in s),
+            "rtt_ms": rtt,
+            "stalled_s": round(t - moved_at, 3) if queued else 0.0,
+            "stalled": active and queued and t - moved_at >= self.stall_s,
+            "slow": False,
+            "window_s": round(t - s[0][0], 3),
+        }
+
+    def summary(self, stream: Optional[str] = None) -> dict:
+        """
+        {'streams': {name: {'bps', 'connections': [...], 'stalled': n, 'slow': n}}, 'unassigned': [...], 'collectors': {...}}
+        for every stream (or just one)
+        """
+        now = time.time()
+        with self._lock:
+            conns = [(self._stream_of(c["role"], c["local"], c["peer"]), self._conn_summary(c, now))
+                     for c in self._conns.values() if c["samples"]]
+            collectors = {role: dict(st) for role, st in self._status.items()}
+        names = [stream] if stream is not None else list(self.ctl.streams)
+        out = {"streams": {}, "unassigned": [c for name, c in conns if name is None and stream is None],
+               "collectors": collectors, "at": now}
+        for name in names:
+            mine = [c for n, c in conns if n == name]
+            for role in ROLES:
+                peers = [c for c in mine if c["role"] == role and c["active"] and c["bps_p50"] is not None]
+                if len(peers) < 2:
+                    continue
+                best = max(c["bps_p50"] for c in peers)
+                for c in peers:
+                    c["slow"] = c["bps_p50"] < self.slow_ratio * best
+            live = [c for c in mine if c["active"]]
+            out["streams"][name] = {
+                # Data-plane rate of the stream: what the consumer-side gateway delivers (p2cs when c2cs has no data yet)
+                "bps": sum(c["bps"] or 0 for c in live if c["role"] == "c2cs")
+                       or sum(c["bps"] or 0 for c in live if c["role"] == "p2cs"),
+                "connections": sorted(mine, key=lambda c: (c["role"], c["local"], c["peer"])),
+                "stalled": sum(c["stalled"] for c in mine),
+                "slow": sum(c["slow"] for c in mine),
+            }
+        return out
+
+
+def format_summary(summary: dict) -> str:
+    """Human-readable table of a summary() result"""
+    lines = []
+    for name, st in summary["streams"].items():
+        lines.append(f"[{name}] {st['bps'] / 1e9:.3f} Gbps, {len(st['connections'])} connections,"
+                     f" {st['stalled']} stalled, {st['slow']} slow")
+        lines.append(f"  {'gw':<4} {'local':<22} {'peer':<22} {'Gbps':>7} {'p5':>7} {'p50':>7} {'p95':>7}"
+                     f" {'retr':>6} {'sendq':>8} {'recvq':>8} {'rtt ms':>7}  flags")
+        for c in st["connections"]:
+            g = lambda v: f"{v / 1e9:>7.3f}" if v is not None else f"{'-':>7}"
+            flags = " ".join(f for f, on in (("STALLED", c["stalled"]), ("SLOW", c["slow"]), ("closed", not c["active"])) if on)
+            if c["stalled"]:
+                flags += f" ({c['stalled_s']:.0f}s)"
+            rtt = f"{c['rtt_ms']:>7.2f}" if c["rtt_ms"] is not None else f"{'-':>7}"
+            lines.append(f"  {c['role']:<4} {c['local'][:22]:<22} {c['peer'][:22]:<22} {g(c['bps'])} {g(c['bps_p5'])}"
+                         f" {g(c['bps_p50'])} {g(c['bps_p95'])} {c['retransmits']:>6d} {c['send_q']:>8d}"
+                         f" {c['recv_q']:>8d} {rtt}  {flags}")
+    if summary["unassigned"]:
+        lines.append(f"{len(summary['unassigned'])} session connection(s) not matched to a stream")
+    for role, st in summary["collectors"].items():
+        if st["ok"] is False:
+            lines.append(f"collector {role}: {st['error']}")
+    return "\n".join(lines)
+
+
+def from_args(ctl) -> TelemetryCollector:
+    """Collector configured from the controller's --telemetry-* flags"""
+    a = ctl.args
+    return TelemetryCollector(ctl, interval=a.telemetry_interval, batch_s=a.telemetry_batch, history=a.telemetry_history,
+                              stall_s=a.stall_after, slow_ratio=a.slow_ratio)
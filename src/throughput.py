@@ -0,0 +1,266 @@
+"""
+Data-plane throughput benchmark through the established tunnel (iperf3)
+
+For every proxy type x connection count: bring up a session (gateways + one stream with that
+num_conn), start one iperf3 server per producer port on the producer host, drive one reverse-mode
+iperf3 client per consumer-side tunnel port from the consumer host (producer → consumer), and sample
+the CPU of each gateway's s2cs session (s2cs + the proxies it spawned) and of the gateway hosts
+while the transfers run; then tear the session down
+
+Connection i uses the i-th --inbound-src-ports port on the producer and the i-th --outbound-dst-ports
+port on c2cs, so both lists must hold at least the largest connection count
+
+Reported per run: aggregate and per-connection Gbps (received), sender retransmits, gateway CPU %
+(s2cs session, 100 = one core; host, all cores) and the producer/consumer CPU iperf3 reports
+Gateway CPU windows come from the consumer's clock; they assume synced clocks (coverage < 1 = partial)
+
+Examples
+  python3 throughput.py -d 10 --num-conn 1,4,11 --types StunnelSubprocess,HAProxy
+  python3 throughput.py -d 30 --json tput.json -- --producer-ep prod-host --consumer-ep cons-host
+Controller flags go after '--' (endpoints, IPs, ports, --key-type, ...)
+"""
+from __future__ import annotations
+import argparse, json, logging, statistics, sys
+from typing import Dict, List, Optional
+
+import launcher
+import remote_fns
+from config import get_args
+from controller import StreamController, DEFAULT_STREAM
+from main import session_steps, _report
+from scheduler import run_parallel
+from util import call_remote, run_remote, configure_executor_pool, shutdown_executors
+from tracing import span
+
+
+def parse_iperf(stdout: str) -> dict:
+    """Split launcher.iperf_clients output into {'window': (start, end) | None, 'reports': {port: json | {'error'}}}"""
+    window, reports, port = None, {}, None
+    for line in (stdout or "").splitlines():
+        if line.startswith("@@WINDOW "):
+            t0, t1 = line.split()[1:3]
+            window = (float(t0), float(t1))
+        elif line.startswith("@@IPERF "):
+            port = int(line.split()[1])
+        elif port is not None and line.strip():
+            try:
+                reports[port] = json.loads(line)
+            except ValueError:
+                reports[port] = {"error": line.strip()[:200]}
+            port = None
+    return {"window": window, "reports": reports}
+
+
+def connection_stats(port: int, report: dict) -> dict:
+    """Received Gbps, sender retransmits and mean sender RTT of one client report (error set if the test failed)"""
+    end = report.get("end") or {}
+    recv = end.get("sum_received") or {}
+    if report.get("error") or "bits_per_second" not in recv:
+        return {"port": port, "ok": False, "error": report.get("error") or "no result"}
+    cpu = end.get("cpu_utilization_percent") or {}
+    # Sender-side TCP RTT in microseconds, per stream (only where the sender's stats are reported)
+    rtts = [(st.get("sender") or {}).get("mean_rtt") for st in end.get("streams") or []]
+    rtts = [v for v in rtts if v]
+    return {
+        "port": port, "ok": True,
+        "gbps": recv["bits_per_second"] / 1e9,
+        "retransmits": (end.get("sum_sent") or {}).get("retransmits"),
+        "rtt_ms": statistics.fmean(rtts) / 1000.0 if rtts else None,
+        # Reverse mode: the client host is the consumer, the remote (server) host is the producer
+        "consumer_cpu": cpu.get("host_total"),
+        "producer_cpu": cpu.get("remote_total"),
+    }
+
+
+def cpu_window(sampled: dict, start: float, end: float) -> dict:
+    """
+    CPU use between the samples that bracket [start, end]
+    Returns {'session_pct', 'host_pct', 'coverage'}; session_pct is None when no session was sampled
+    """
+    samples = sampled.get("samples") or []
+    if len(samples) < 2 or end <= start:
+        return {"session_pct": None, "host_pct": None, "coverage": 0.0}
+    a = next((s for s in reversed(samples) if s[0] <= start), samples[0])
+    b = next((s for s in samples if s[0] >= end), samples[-1])
+    if b[0] <= a[0]:
+        return {"session_pct": None, "host_pct": None, "coverage": 0.0}
+    dt = b[0] - a[0]
+    covered = max(0.0, min(b[0], end) - max(a[0], start)) / (end - start)
+    session = None
+    if a[1] is not None and b[1] is not None:
+        session = 100.0 * (b[1] - a[1]) / float(sampled.get("clk_tck") or 100) / dt
+    host = 100.0 * (b[2] - a[2]) / (b[3] - a[3]) if b[3] > a[3] else None
+    return {"session_pct": session, "host_pct": host, "coverage": round(covered, 3)}
+
+
+def measure_stream(ctl: StreamController, stream: Optional[str] = None, *, duration: float = 10.0,
+                   lead: float = 1.0, iperf_opts: str = "") -> dict:
+    """
+    Drive iperf3 traffic through one connected stream and sample both gateways meanwhile
+    Returns {'ok', 'num_conn', 'gbps', 'per_conn': [...], 'retransmits', 'cpu': {...}} (error on failure)
+    """
+    st = ctl._stream(stream)
+    sargs = st["args"]
+    n = sargs.num_conn
+    src, dst = list(sargs.inbound_src_ports)[:n], list(sargs.outbound_dst_ports)[:n]
+    if len(src) < n or len(dst) < n:
+        return {"ok": False, "error": f"num_conn {n} needs {n} inbound and outbound ports"}
+    run_dir = f"{ctl.sess_dir}/iperf/{st['name']}"
+    prod, cons = ctl.host_eid("producer"), ctl.host_eid("consumer")
+
+    with span("tput:measure", stream=st["name"], num_conn=n):
+        srv = launcher.iperf_servers(sargs, prod, ports=src, run_dir=run_dir)
+        try:
+            if not srv.get("ok"):
+                return {"ok": False, "error": "iperf3 servers failed to start", "servers": srv}
+            # Samplers cover the client's lead-in, the transfers and some slack for submission skew
+            window_s = lead + duration + 2.0
+            runs = run_parallel({
+                "clients": lambda: launcher.iperf_clients(sargs, cons, ports=dst, run_dir=run_dir,
+                                                          duration=duration, lead=lead, opts=iperf_opts),
+                **{
+                    role: (lambda role=role, ep=ep: call_remote(
+                        ctl._eid(ep), f"CPU:{role}", remote_fns.sample_cpu,
+                        f"{ctl.sess_dir}/procs/{role}.pid", window_s, 0.5, wait=int(window_s) + 60))
+                    for role, ep in (("p2cs", sargs.p2cs_ep), ("c2cs", sargs.c2cs_ep))
+                },
+            })
+        finally:
+            stop = StreamController._kill_pidfiles_script([f"{run_dir}/server-{int(p)}.pid" for p in src])
+            run_remote(prod, "IPERF:stop", stop)
+
+    cl = runs["clients"]
+    if not cl.get("ok"):
+        return {"ok": False, "error": "iperf3 clients failed", "clients": cl}
+    parsed = parse_iperf(cl.get("stdout") or "")
+    per_conn = [connection_stats(p, parsed["reports"].get(p) or {"error": "no report"}) for p in dst]
+    good = [c for c in per_conn if c["ok"]]
+
+    cpu: Dict[str, Optional[dict]] = {}
+    for role in ("p2cs", "c2cs"):
+        r = runs[role]
+        cpu[role] = cpu_window(r.get("result") or {}, *parsed["window"]) if r.get("ok") and parsed["window"] else None
+    for side in ("producer", "consumer"):
+        vals = [c[f"{side}_cpu"] for c in good if c.get(f"{side}_cpu") is not None]
+        cpu[side] = {"iperf_pct": statistics.fmean(vals)} if vals else None
+
+    retrans = [c["retransmits"] for c in good if c.get("retransmits") is not None]
+    res = {
+        "ok": len(good) == len(per_conn),
+        "num_conn": n,
+        "duration": duration,
+        "gbps": sum(c["gbps"] for c in good),
+        "per_conn": per_conn,
+        "retransmits": sum(retrans) if retrans else None,
+        "cpu": cpu,
+    }
+    if not res["ok"]:
+        res["error"] = f"{len(per_conn) - len(good)} of {len(per_conn)} connections failed"
+    return res
+
+
+def run_one(args: argparse.Namespace, proxy_type: str, num_conn: int, *, duration: float, lead: float,
+            iperf_opts: str) -> dict:
+    """Fresh session with the given proxy type and connection count → measure → tear down"""
+    targs = argparse.Namespace(**{
+        **vars(args), "type": proxy_type, "num_conn": num_conn, "stream": None,
+        "inbound_src_ports": list(args.inbound_src_ports)[:num_conn],
+        "outbound_dst_ports": list(args.outbound_dst_ports)[:num_conn],
+    })
+    row = {"type": proxy_type, "num_conn": num_conn}
+    ctl = None
+    with span("tput:run", type=proxy_type, num_conn=num_conn):
+        try:
+            ctl = StreamController(targs)
+            code = _report(ctl, session_steps(ctl, targs).run())
+            if code:
+                return {**row, "ok": False, "error": f"session bring-up failed with status {code}"}
+            return {**row, **measure_stream(ctl, DEFAULT_STREAM, duration=duration, lead=lead, iperf_opts=iperf_opts)}
+        except Exception as e:
+            logging.exception("Throughput run %s x%d failed", proxy_type, num_conn)
+            return {**row, "ok": False, "error": str(e)}
+        finally:
+            if ctl is not None:
+                ctl.cleanup()
+                ctl.close()
+
+
+def _pct(v: Optional[float]) -> str:
+    return f"{v:>6.0f}" if v is not None else f"{'-':>6}"
+
+
+def format_table(rows: List[dict]) -> str:
+    lines = [f"  {'type':<20} {'conn':>4} {'Gbps':>7} {'min':>6} {'median':>6} {'max':>6} {'retr':>7} "
+             f"{'p2cs%':>6} {'host%':>6} {'c2cs%':>6} {'host%':>6} {'prod%':>6} {'cons%':>6}",
+             "  (per-connection Gbps min/median/max; s2cs session CPU with 100 = one core, host = all cores)"]
+    for r in rows:
+        head = f"  {r['type'][:20]:<20} {r['num_conn']:>4}"
+        if not r.get("gbps") and not r.get("ok"):
+            lines.append(f"{head} FAILED: {r.get('error')}")
+            continue
+        g = sorted(c["gbps"] for c in r["per_conn"] if c["ok"])
+        cpu = r["cpu"]
+        cols = [_pct((cpu.get(k) or {}).get(f)) for k, f in (("p2cs", "session_pct"), ("p2cs", "host_pct"),
+                                                             ("c2cs", "session_pct"), ("c2cs", "host_pct"),
+                                                             ("producer", "iperf_pct"), ("consumer", "iperf_pct"))]
+        retr = f"{r['retransmits']:>7d}" if r.get("retransmits") is not None else f"{'-':>7}"
+        lines.append(f"{head} {r['gbps']:>7.2f} {g[0]:>6.2f} {statistics.median(g):>6.2f} {g[-1]:>6.2f} {retr} "
+                     + " ".join(cols) + ("" if r.get("ok") else f"  ({r.get('error')})"))
+    return "\n".join(lines)
+
+
+def _int_list(s: str) -> List[int]:
+    try:
+        vals = [int(v) for v in s.split(",") if v.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError("must be comma-separated integers")
+    if not vals or min(vals) < 1:
+        raise argparse.ArgumentTypeError("must be positive integers")
+    return vals
+
+
+def main(argv: List[str] | None = None) -> int:
+    argv = list(sys.argv[1:] if argv is None else argv)
+    extra: List[str] = []
+    if "--" in argv:
+        i = argv.index("--")
+        argv, extra = argv[:i], argv[i + 1:]
+    p = argparse.ArgumentParser(description="Data-plane throughput benchmark through the SciStream tunnel (iperf3)")
+    p.add_argument("-d", "--duration", type=float, default=10.0, help="Seconds of traffic per run")
+    p.add_argument("--num-conn", type=_int_list, default=None, help="Connection counts to sweep (default: the controller's --num-conn)")
+    p.add_argument("--types", default=None, help="Comma-separated proxy types to sweep (default: the controller's --type)")
+    p.add_argument("--lead", type=float, default=1.0, help="Seconds the clients wait so the CPU samplers are running first")
+    p.add_argument("--iperf-opts", default="", help="Extra iperf3 client options (e.g. '-w 4M' or '-Z')")
+    p.add_argument("--json", default=None, help="Write the full per-run results to this file")
+    p.add_argument("-v", "--verbose", action="store_true")
+    opts = p.parse_args(argv)
+    logging.basicConfig(level=logging.INFO if opts.verbose else logging.WARNING, format="%(asctime)s %(levelname)s %(message)s")
+
+    args = get_args(extra)
+    configure_executor_pool(max_size=args.executor_pool_size, idle_s=args.executor_idle)
+    if args.sim or args.sim_profile or args.sim_replay:
+        import simcompute
+        simcompute.install(root=args.sim_root, profile=args.sim_profile, replay=args.sim_replay)
+    conns = opts.num_conn or [args.num_conn]
+    need = max(conns)
+    if len(args.inbound_src_ports) < need or len(args.outbound_dst_ports) < need:
+        p.error(f"--num-conn {need} needs at least {need} --inbound-src-ports and --outbound-dst-ports")
+    types = [t.strip() for t in (opts.types or args.type).split(",") if t.strip()]
+
+    rows = []
+    try:
+        for t in types:
+            for n in conns:
+                rows.append(run_one(args, t, n, duration=opts.duration, lead=opts.lead, iperf_opts=opts.iperf_opts))
+                logging.info("%s x%d: %s", t, n, "%.2f Gbps" % rows[-1]["gbps"] if rows[-1].get("gbps") else rows[-1].get("error"))
+    finally:
+        shutdown_executors()
+    print(format_table(rows))
+    if opts.json:
+        with open(opts.json, "w") as fh:
+            json.dump(rows, fh, indent=1, default=str)
+    return 0 if all(r.get("ok") for r in rows) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
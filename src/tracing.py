@@ -0,0 +1,164 @@
+from __future__ import annotations
+import functools, inspect, itertools, json, logging, os, threading, time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Optional
+
+# Span id of the innermost open span in this context (propagated into worker threads, see scheduler)
+_CURRENT: ContextVar[Optional[int]] = ContextVar("streamhub_span", default=None)
+
+
+class Tracer:
+    """
+    In-process span recorder
+
+    - span() times a block; spans opened inside it (same thread, threads started through
+      scheduler.run_parallel / StepScheduler, or asyncio tasks created inside it) become its children
+    - add() records an already-measured interval (e.g. the remote execution window of a submission)
+    - Spans are kept in a bounded deque so a long-running daemon does not grow without limit
+    - write() dumps Chrome trace-event JSON (chrome://tracing, https://ui.perfetto.dev)
+    """
+
+    def __init__(self, max_spans: int = 100_000):
+        self._lock = threading.Lock()
+        self._spans: deque = deque(maxlen=max_spans)
+        self._ids = itertools.count(1)
+        self.started = time.time()
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        """Time the enclosed block; yields the span record so callers can add attributes"""
+        rec = {"id": next(self._ids), "parent": _CURRENT.get(), "name": name, "start": time.time(),
+               "end": None, "thread": threading.current_thread().name, "attrs": attrs}
+        token = _CURRENT.set(rec["id"])
+        try:
+            yield rec
+        except BaseException as e:
+            rec["attrs"]["error"] = str(e) or type(e).__name__
+            raise
+        finally:
+            rec["end"] = time.time()
+            _CURRENT.reset(token)
+            with self._lock:
+                self._spans.append(rec)
+
+    def add(self, name: str, start: float, end: float, **attrs) -> None:
+        """Record a measured interval (epoch seconds) as a child of the current span"""
+        rec = {"id": next(self._ids), "parent": _CURRENT.get(), "name": name, "start": start,
+               "end": max(start, end), "thread": threading.current_thread().name, "attrs": attrs}
+        with self._lock:
+            self._spans.append(rec)
+
+    def spans(self) -> list[dict]:
+        with self._lock:
+            return sorted(self._spans, key=lambda s: s["start"])
+
+    def reset(self) -> None:
+        with self._lock:
+            self._spans.clear()
+        self.started = time.time()
+
+    def chrome_trace(self) -> dict:
+        """Spans as Chrome trace 'complete' events (µs since tracer start), one track per thread"""
+        tids: Dict[str, int] = {}
+        events = []
+        for s in self.spans():
+            tid = tids.setdefault(s["thread"], len(tids) + 1)
+            events.append({
+                "name": s["name"], "ph": "X", "pid": os.getpid(), "tid": tid,
+                "ts": round((s["start"] - self.started) * 1e6), "dur": round((s["end"] - s["start"]) * 1e6),
+                "args": {"id": s["id"], "parent": s["parent"], **s["attrs"]},
+            })
+        events += [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": t}}
+                   for t, tid in tids.items()]
+        return {"traceEvents": events, "displayTimeUnit": "ms", "otherData": {"started": self.started}}
+
+    def write(self, path: str) -> None:
+        path = os.path.expanduser(path)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as fh:
+            json.dump(self.chrome_trace(), fh, default=str)
+        logging.info("Trace written to %s", path)
+
+
+TRACER = Tracer()
+
+
+def span(name: str, **attrs):
+    """Shorthand for TRACER.span()"""
+    return TRACER.span(name, **attrs)
+
+
+def traced(name: Optional[str] = None) -> Callable:
+    """Decorator: run the function (or coroutine function) inside a span (default name 'ctl:<function name>')"""
+    def deco(fn: Callable) -> Callable:
+        label = name or f"ctl:{fn.__name__}"
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def awrapper(*args, **kwargs):
+                with TRACER.span(label):
+                    return await fn(*args, **kwargs)
+            return awrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with TRACER.span(label):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+
+def critical_path(spans: list[dict]) -> list[dict]:
+    """
+    Chain of scheduler steps ('step:*' spans, with their 'needs') that determined the end time:
+    start from the step that finished last and repeatedly follow the dependency that finished last
+    """
+    steps = {s["name"][5:]: s for s in spans if s["name"].startswith("step:")}
+    if not steps:
+        return []
+    cur = max(steps.values(), key=lambda s: s["end"])
+    path = [cur]
+    while True:
+        deps = [steps[d] for d in cur["attrs"].get("needs") or () if d in steps]
+        if not deps:
+            break
+        cur = max(deps, key=lambda s: s["end"])
+        path.append(cur)
+    return path[::-1]
+
+
+def summary(tracer: Tracer = TRACER) -> str:
+    """Human-readable timing report: critical path of scheduler steps + per-label remote call split"""
+    spans = tracer.spans()
+    if not spans:
+        return "No spans recorded"
+    t0 = min(s["start"] for s in spans)
+    wall = max(s["end"] for s in spans) - t0
+    lines = []
+
+    path = critical_path(spans)
+    if path:
+        cp = path[-1]["end"] - path[0]["start"]
+        lines.append(f"Critical path: {cp:.3f}s of {wall:.3f}s wall")
+        lines.append(f"  {'step':<24} {'start':>8} {'dur':>8}")
+        for s in path:
+            lines.append(f"  {s['name'][5:]:<24} {s['start'] - t0:>8.3f} {s['end'] - s['start']:>8.3f}")
+
+    calls: Dict[str, list] = {}
+    for s in spans:
+        if s["name"].startswith("remote:"):
+            calls.setdefault(s["name"][7:], []).append(s)
+    if calls:
+        cols = ("submit", "queue", "exec", "retrieve")
+        lines.append("Remote calls (seconds; queue/retrieve assume synced clocks, '-' = not measured):")
+        lines.append(f"  {'label':<28} {'n':>3} {'total':>8} " + " ".join(f"{c:>8}" for c in cols))
+        for label, ss in sorted(calls.items(), key=lambda kv: -sum(s["end"] - s["start"] for s in kv[1])):
+            total = sum(s["end"] - s["start"] for s in ss)
+            parts = []
+            for c in cols:
+                vals = [s["attrs"][f"{c}_s"] for s in ss if s["attrs"].get(f"{c}_s") is not None]
+                parts.append(f"{sum(vals):>8.3f}" if vals else f"{'-':>8}")
+            lines.append(f"  {label[:28]:<28} {len(ss):>3} {total:>8.3f} " + " ".join(parts))
+    return "\n".join(lines)
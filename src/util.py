@@ -1,10 +1,159 @@
 from __future__ import annotations
-import logging, shlex, time, uuid, base64
-from typing import Dict, Optional
-from globus_compute_sdk import Executor, ShellFunction
+import asyncio, base64, hashlib, logging, shlex, threading, time, uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+from globus_compute_sdk import Client, Executor, ShellFunction
+
+import backends, remote_fns
+from tracing import TRACER
 
 DEFAULT_BASE = "/tmp/.scistream"
 
+
+class ExecutorPool:
+    """
+    Process-wide cache of Globus Compute executors keyed by endpoint ID
+    - One Executor per endpoint, reused across run_remote calls and controller steps
+    - Bounded: least-recently-used idle executors are shut down past max_size
+    - Executors idle for longer than idle_s are shut down on the next lease
+    """
+
+    def __init__(self, max_size: int = 8, idle_s: float = 300.0):
+        self.max_size = max_size
+        self.idle_s = idle_s
+        self._lock = threading.Lock()
+        # endpoint_id -> [executor, last_used (monotonic), in-flight leases]
+        self._entries: "OrderedDict[str, list]" = OrderedDict()
+
+    def configure(self, *, max_size: Optional[int] = None, idle_s: Optional[float] = None) -> None:
+        """Adjust limits; takes effect on the next lease"""
+        with self._lock:
+            if max_size is not None:
+                self.max_size = max(1, int(max_size))
+            if idle_s is not None:
+                self.idle_s = float(idle_s)
+
+    def _evict_locked(self, now: float) -> list:
+        """Pop idle-expired and over-capacity entries (never ones in use); caller shuts them down"""
+        victims = []
+        for eid, (gce, last, inflight) in list(self._entries.items()):
+            if inflight == 0 and self.idle_s > 0 and now - last > self.idle_s:
+                victims.append(self._entries.pop(eid)[0])
+        for eid, (gce, last, inflight) in list(self._entries.items()):
+            if len(self._entries) <= self.max_size:
+                break
+            if inflight == 0:
+                victims.append(self._entries.pop(eid)[0])
+        return victims
+
+    @contextmanager
+    def lease(self, endpoint_id: str):
+        """
+        Yield the pooled Executor for endpoint_id, creating it on first use
+        The executor is built outside the lock, so a slow construction for one endpoint never holds up leases
+        for the others; if two threads race to create one, the loser's copy is shut down
+        """
+        entry = self._acquire(endpoint_id)
+        if entry is None:
+            fresh = new_executor(endpoint_id)
+            entry = self._acquire(endpoint_id, fresh)
+            if entry[0] is not fresh:
+                self._shutdown_all([fresh])
+        try:
+            yield entry[0]
+        finally:
+            with self._lock:
+                entry[1] = time.monotonic()
+                entry[2] -= 1
+
+    def _acquire(self, endpoint_id: str, fresh=None) -> Optional[list]:
+        """Take a lease on the pooled entry, inserting fresh if there is none; None when neither exists"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(endpoint_id)
+            if entry is None:
+                if fresh is None:
+                    return None
+                entry = self._entries[endpoint_id] = [fresh, now, 0]
+            entry[1] = now
+            entry[2] += 1
+            self._entries.move_to_end(endpoint_id)
+            victims = self._evict_locked(now)
+        self._shutdown_all(victims)
+        return entry
+
+    def shutdown(self) -> None:
+        """Shut down every pooled executor without waiting for outstanding tasks"""
+        with self._lock:
+            victims = [e[0] for e in self._entries.values()]
+            self._entries.clear()
+        self._shutdown_all(victims)
+
+    @staticmethod
+    def _shutdown_all(executors: list) -> None:
+        for gce in executors:
+            try:
+                gce.shutdown(wait=False, cancel_futures=True)
+            except Exception:
+                logging.debug("Executor shutdown failed", exc_info=True)
+
+
+_POOL = ExecutorPool()
+
+# Optional replacements for the SDK's Executor/Client (e.g. simcompute); None = Globus Compute
+_EXECUTOR_FACTORY: Optional[Callable[[str], object]] = None
+_CLIENT_FACTORY: Optional[Callable[[], object]] = None
+
+def set_backend(*, executor_factory: Optional[Callable[[str], object]] = None,
+                client_factory: Optional[Callable[[], object]] = None) -> None:
+    """
+    Swap the execution backend used by run_remote/call_remote (None restores the Globus Compute SDK)
+    Pooled executors and registered function IDs belong to the old backend and are dropped
+    """
+    global _EXECUTOR_FACTORY, _CLIENT_FACTORY, _CLIENT
+    _POOL.shutdown()
+    with _FN_LOCK:
+        _EXECUTOR_FACTORY, _CLIENT_FACTORY = executor_factory, client_factory
+        _FUNCTION_IDS.clear()
+        _CLIENT = None
+
+def new_executor(endpoint_id: str):
+    """An Executor for endpoint_id: a local/SSH one for those IDs (backends.py), otherwise from the active backend"""
+    if backends.handles(endpoint_id):
+        return backends.executor(endpoint_id)
+    return _EXECUTOR_FACTORY(endpoint_id) if _EXECUTOR_FACTORY else Executor(endpoint_id=endpoint_id)
+
+def new_client():
+    """A Compute Client from the active backend"""
+    return _CLIENT_FACTORY() if _CLIENT_FACTORY else Client()
+
+def configure_executor_pool(*, max_size: Optional[int] = None, idle_s: Optional[float] = None) -> None:
+    """Set the bounds of the process-wide executor pool"""
+    _POOL.configure(max_size=max_size, idle_s=idle_s)
+
+def shutdown_executors() -> None:
+    """Shut down all pooled executors (called on exit and from signal handlers)"""
+    _POOL.shutdown()
+
+# Callbacks notified with (endpoint_id, error) when a submission to that endpoint fails
+_FAILURE_HOOKS: list[Callable[[str, Exception], None]] = []
+
+def add_endpoint_failure_hook(fn: Callable[[str, Exception], None]) -> None:
+    """Register a callback for failed run_remote/call_remote submissions (e.g. endpoint cache invalidation)"""
+    _FAILURE_HOOKS.append(fn)
+
+def remove_endpoint_failure_hook(fn: Callable[[str, Exception], None]) -> None:
+    if fn in _FAILURE_HOOKS:
+        _FAILURE_HOOKS.remove(fn)
+
+def _endpoint_failed(uuid_str: str, err: Exception) -> None:
+    for fn in list(_FAILURE_HOOKS):
+        try:
+            fn(uuid_str, err)
+        except Exception:
+            logging.exception("Endpoint failure hook failed")
+
 def make_session_id() -> str:
     """Generate a sortable unique session id: YYYYMMDD-HHMMSS-<8hex>"""
     ts = time.strftime("%Y%m%d-%H%M%S")
@@ -16,6 +165,20 @@ def session_dir(base: Optional[str], session_id: str) -> str:
     b = base or DEFAULT_BASE
     return f"{b.rstrip('/')}/{session_id}"
 
+def ports_for(existing: list[int], n: int, exclude=()) -> list[int]:
+    """First n of existing, extended with consecutive ports after the last one (skipping exclude) when it is shorter"""
+    if not existing:
+        raise ValueError("need at least one port to derive a port list from")
+    out = list(existing)[:n]
+    nxt = out[-1] + 1
+    while len(out) < n:
+        if nxt not in out and nxt not in exclude:
+            out.append(nxt)
+        nxt += 1
+    if out[-1] > 65535:
+        raise ValueError(f"not enough ports above {existing[0]} for {n} connections")
+    return out
+
 def _export_env(env: Dict[str, str]) -> str:
     """
     Produce a block of 'export KEY=VALUE' lines with proper shell-quoting
@@ -38,73 +201,420 @@ def run_remote(uuid_str: str, label: str, script_body: str, *,
                wall: int = 180, wait: int = 180,
                login_shell: bool = False) -> dict:
     """
-    Submit a shell script to a Globus Compute endpoint and wait for results
+    Submit a shell script to an endpoint (Globus Compute, or local/SSH, see backends.py) and wait for results
+    - Reuses the pooled Executor for the endpoint instead of opening a new one
     - Wraps the payload in 'bash -lc' for a login shell environment
     - Enables 'set -euo pipefail' for safer shell behavior
     - Allows passing environment variables via 'env' (exported before script)
-    Returns a dict with ok/label/stdout/stderr or ok=False on exception
+    - Traced as span 'remote:<label>' split into submit / queue / exec / retrieve
+      (exec is timed on the endpoint; see _split_timing)
+    Returns a dict with ok/label/stdout/stderr/timing or ok=False on exception
+    """
+    cmd = _shell_command(script_body, env, login_shell)
+    with TRACER.span(f"remote:{label}", endpoint=uuid_str) as sp:
+        try:
+            t_submit = time.time()
+            with _POOL.lease(uuid_str) as gce:
+                fut = gce.submit(ShellFunction(cmd), walltime=wall)
+                t_submitted = time.time()
+                res = fut.result(timeout=wait)
+            return _shell_result(label, res, sp, t_submit, t_submitted)
+        except Exception as e:
+            return _remote_failed(uuid_str, label, sp, e)
+
+async def arun_remote(uuid_str: str, label: str, script_body: str, *,
+                      env: Optional[Dict[str, str]] = None,
+                      wall: int = 180, wait: int = 180,
+                      login_shell: bool = False) -> dict:
+    """
+    Awaitable run_remote: the Compute future is awaited on the event loop instead of blocking a thread
+    - Same script wrapping, tracing and result dict as run_remote (a timeout after wait seconds is ok=False)
+    - Cancelling the awaiting task cancels the Compute task (if it has not started) and re-raises CancelledError
+    """
+    cmd = _shell_command(script_body, env, login_shell)
+    with TRACER.span(f"remote:{label}", endpoint=uuid_str) as sp:
+        try:
+            t_submit = time.time()
+            with _POOL.lease(uuid_str) as gce:
+                fut = gce.submit(ShellFunction(cmd), walltime=wall)
+                t_submitted = time.time()
+                res = await _await_future(fut, wait)
+            return _shell_result(label, res, sp, t_submit, t_submitted)
+        except asyncio.CancelledError:
+            sp["attrs"]["error"] = "cancelled"
+            raise
+        except Exception as e:
+            return _remote_failed(uuid_str, label, sp, e)
+
+def _shell_command(script_body: str, env: Optional[Dict[str, str]], login_shell: bool) -> str:
+    """
+    Full command line of a shell payload, ready for ShellFunction
+    Braces are doubled: ShellFunction runs cmd.format(**kwargs) on the endpoint (walltime is one of them),
+    so shell functions, ${VAR:-x} and awk blocks would otherwise fail there with "unexpected '{' in field name"
     """
     env_block = _export_env(env or {})
     shell_flag = "-lc" if login_shell else "-c"
-    cmd = f"""bash {shell_flag} '
+    # The remote start/end stamps are printed after the payload, outside its bash -c
+    cmd = f"""__T0=$(date +%s.%N); bash {shell_flag} '
           set -euo pipefail
           {env_block}
           {script_body}
-          '"""
-    with Executor(endpoint_id=uuid_str) as gce:
-        fut = gce.submit(ShellFunction(cmd), walltime=wall)
+          '
+          __RC=$?; echo "{_TIMING_TAG} $__T0 $(date +%s.%N)" >&2; exit $__RC"""
+    return cmd.replace("{", "{{").replace("}", "}}")
+
+def _shell_result(label: str, res, sp: dict, t_submit: float, t_submitted: float) -> dict:
+    """
+    Result dict of a finished ShellFunction (timing recorded on the span)
+    The SDK does not raise on a failing script: a non-zero returncode is ok=False, with the output kept
+    (launch failures print the log tail on stdout)
+    """
+    t_done = time.time()
+    out = getattr(res, "stdout", "") or ""
+    err, remote = _strip_timing(getattr(res, "stderr", "") or "")
+    timing = _split_timing(t_submit, t_submitted, t_done, remote)
+    sp["attrs"].update(timing)
+    logging.debug("%s stdout: %s", label, out.strip())
+    if err.strip():
+        logging.debug("%s stderr: %s", label, err.strip())
+    rc = getattr(res, "returncode", 0) or 0
+    if rc != 0:
+        sp["attrs"]["error"] = f"exit status {rc}"
+        logging.debug("%s exited with status %s", label, rc)
+        return {"ok": False, "label": label, "returncode": rc, "stdout": out, "stderr": err, "timing": timing,
+                "error": f"exit status {rc}: {err.strip()[-2000:]}"}
+    return {"ok": True, "label": label, "stdout": out, "stderr": err, "timing": timing}
+
+def _remote_failed(uuid_str: str, label: str, sp: dict, e: Exception) -> dict:
+    logging.exception("%s failed", label)
+    sp["attrs"]["error"] = str(e)
+    _endpoint_failed(uuid_str, e)
+    return {"ok": False, "label": label, "error": str(e)}
+
+async def _await_future(fut, wait: float):
+    """
+    Await a concurrent (Compute) future without a blocking thread; on timeout or cancellation the
+    future is cancelled too, so a queued task does not run after nobody waits for it
+    """
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(fut), timeout=wait)
+    except asyncio.TimeoutError:
+        fut.cancel()
+        raise TimeoutError(f"no result within {wait}s") from None
+    except asyncio.CancelledError:
+        fut.cancel()
+        raise
+
+_TIMING_TAG = "@@STREAMHUB-TIMING"
+
+def _strip_timing(stderr: str) -> tuple[str, Optional[tuple]]:
+    """Remove the remote timing line from stderr; returns (stderr, (start, end) epoch seconds or None)"""
+    keep, stamps = [], None
+    for line in stderr.splitlines(keepends=True):
+        if line.startswith(_TIMING_TAG):
+            try:
+                _, a, b = line.split()
+                stamps = (float(a), float(b))
+            except ValueError:
+                pass
+            continue
+        keep.append(line)
+    return "".join(keep), stamps
+
+def _split_timing(t_submit: float, t_submitted: float, t_done: float, remote: Optional[tuple]) -> dict:
+    """
+    Split one submission into phases and record them as child spans:
+    - submit:   local submit() call (serialization + handing the task to the executor)
+    - exec:     remote wall time of the script, measured on the endpoint
+    - queue:    submitted → remote start; retrieve: remote end → result in hand
+      (these two compare remote and local clocks; their sum, wait - exec, is exact)
+    """
+    timing = {"submit_s": t_submitted - t_submit, "queue_s": None, "exec_s": None, "retrieve_s": None,
+              "wait_s": t_done - t_submitted}
+    TRACER.add("submit", t_submit, t_submitted)
+    if remote:
+        r0, r1 = remote
+        timing["exec_s"] = r1 - r0
+        timing["queue_s"] = max(0.0, r0 - t_submitted)
+        timing["retrieve_s"] = max(0.0, t_done - r1)
+        TRACER.add("queue", t_submitted, min(r0, t_done))
+        TRACER.add("exec", r0, r1, clock="remote")
+        TRACER.add("retrieve", max(r1, t_submitted), t_done)
+    else:
+        TRACER.add("wait", t_submitted, t_done)
+    return timing
+
+# Function IDs of native remote functions, registered once per process
+_FUNCTION_IDS: Dict[str, str] = {}
+_FN_LOCK = threading.Lock()
+_CLIENT: Optional[Client] = None
+
+def _function_id(fn: Callable) -> str:
+    """Register fn with the Compute service on first use and return the cached function ID"""
+    global _CLIENT
+    key = f"{fn.__module__}.{fn.__qualname__}"
+    with _FN_LOCK:
+        fid = _FUNCTION_IDS.get(key)
+        if fid is None:
+            if _CLIENT is None:
+                _CLIENT = new_client()
+            fid = _CLIENT.register_function(fn)
+            _FUNCTION_IDS[key] = fid
+            logging.debug("Registered %s as %s", key, fid)
+        return fid
+
+def _submit_function(gce, fid: Optional[str], fn: Callable, args: tuple, kwargs: dict):
+    """Submit by registered ID (Compute) or, without one, the function itself (backends.py executors)"""
+    if fid is None:
+        return gce.submit_function(fn, *args, **kwargs)
+    return gce.submit_to_registered_function(fid, args=args, kwargs=kwargs)
+
+def call_remote(uuid_str: str, label: str, fn: Callable, *args, wait: int = 180, **kwargs) -> dict:
+    """
+    Run a native Python function (see remote_fns) on an endpoint
+    - Compute: the function is registered once and then submitted by ID with typed arguments
+    - local/SSH endpoints (backends.py) take the function itself
+    - Returns {ok, label, result} with the function's return value, or ok=False on exception
+    - Traced as span 'remote:<label>' split into submit / wait (no remote-side timing for native calls)
+    """
+    with TRACER.span(f"remote:{label}", endpoint=uuid_str, function=fn.__name__) as sp:
         try:
-            res = fut.result(timeout=wait)
-            out = getattr(res, "stdout", "") or ""
-            err = getattr(res, "stderr", "") or ""
-            logging.debug("%s stdout: %s", label, out.strip())
-            if err.strip():
-                logging.debug("%s stderr: %s", label, err.strip())
-            return {"ok": True, "label": label, "stdout": out, "stderr": err}
+            fid = None if backends.handles(uuid_str) else _function_id(fn)
+            t_submit = time.time()
+            with _POOL.lease(uuid_str) as gce:
+                fut = _submit_function(gce, fid, fn, args, kwargs)
+                t_submitted = time.time()
+                value = fut.result(timeout=wait)
+            sp["attrs"].update(_split_timing(t_submit, t_submitted, time.time(), None))
+            logging.debug("%s result: %s", label, value)
+            return {"ok": True, "label": label, "result": value}
         except Exception as e:
-            logging.exception("%s failed", label)
-            return {"ok": False, "label": label, "error": str(e)}
+            return _remote_failed(uuid_str, label, sp, e)
 
-def key_gen(args, endpoint_name: str, uuid: str, *, sess_dir: str) -> dict:
+async def acall_remote(uuid_str: str, label: str, fn: Callable, *args, wait: int = 180, **kwargs) -> dict:
+    """Awaitable call_remote (see arun_remote for timeout and cancellation behaviour)"""
+    with TRACER.span(f"remote:{label}", endpoint=uuid_str, function=fn.__name__) as sp:
+        try:
+            key = f"{fn.__module__}.{fn.__qualname__}"
+            # Registration is a blocking service call, made once per function and process
+            fid = None if backends.handles(uuid_str) else _FUNCTION_IDS.get(key) or await asyncio.to_thread(_function_id, fn)
+            t_submit = time.time()
+            with _POOL.lease(uuid_str) as gce:
+                fut = _submit_function(gce, fid, fn, args, kwargs)
+                t_submitted = time.time()
+                value = await _await_future(fut, wait)
+            sp["attrs"].update(_split_timing(t_submit, t_submitted, time.time(), None))
+            logging.debug("%s result: %s", label, value)
+            return {"ok": True, "label": label, "result": value}
+        except asyncio.CancelledError:
+            sp["attrs"]["error"] = "cancelled"
+            raise
+        except Exception as e:
+            return _remote_failed(uuid_str, label, sp, e)
+
+def write_remote_files(uuid_str: str, label: str, files: list[dict]) -> dict:
+    """Write several {'path', 'data', 'mode'} files on one endpoint in a single submission"""
+    return call_remote(uuid_str, label, remote_fns.write_files, files)
+
+async def awrite_remote_files(uuid_str: str, label: str, files: list[dict]) -> dict:
+    return await acall_remote(uuid_str, label, remote_fns.write_files, files)
+
+# Content-addressed staging: payloads go to an endpoint-side store keyed by SHA-256, so each is sent to a host once
+ARTIFACT_STORE = "~/.scistream/artifacts"
+# Digests each endpoint's store holds, as far as this process has seen ({endpoint ID: set})
+_STAGED: Dict[str, set] = {}
+_STAGED_LOCK = threading.Lock()
+
+def _stage_entries(uuid_str: str, files: list[dict], known) -> list[dict]:
+    """
+    remote_fns.stage_files entries for files: a payload travels only if the host is not known to hold it,
+    and then only with its first entry (the others take it from the host's store)
+    Secret files (f['secret']) always travel and are never hashed, so neither store nor cache sees them
+    """
+    with _STAGED_LOCK:
+        have = set(known or ()) | _STAGED.get(uuid_str, set())
+    out = []
+    for f in files:
+        if f.get("secret"):
+            out.append({"path": f["path"], "data": f["data"], "mode": f.get("mode") or 0o600, "secret": True})
+            continue
+        data = f["data"].encode("utf-8") if isinstance(f["data"], str) else f["data"]
+        sha = hashlib.sha256(data).hexdigest()
+        e = {"path": f["path"], "sha256": sha, "mode": f.get("mode") or 0o644}
+        if sha not in have:
+            e["data"] = f["data"]
+            have.add(sha)
+        out.append(e)
+    return out
+
+def _stage_resend(entries: list[dict], files: list[dict], r: dict) -> list[dict]:
+    """The entries of payloads the host reported missing (it lost its store), now with their data"""
+    missing = set((r.get("result") or {}).get("missing") or []) if r.get("ok") else set()
+    out, sent = [], set()
+    for e, f in zip(entries, files):
+        if e.get("sha256") in missing:
+            out.append({**e, **({"data": f["data"]} if e["sha256"] not in sent else {})})
+            sent.add(e["sha256"])
+    return out
+
+def _staged(uuid_str: str, entries: list[dict], r: dict, retry: dict | None = None) -> dict:
+    """Fold a resend into the first result, record what the host holds, and count the payload bytes sent"""
+    if retry is not None:
+        if not retry.get("ok"):
+            return retry
+        first, again = r["result"], retry["result"]
+        r = {**r, "result": {"written": first["written"] + again["written"],
+                             "unchanged": first["unchanged"] + again["unchanged"],
+                             "missing": again["missing"],
+                             "stored": sorted(set(first["stored"]) | set(again["stored"]))}}
+    with _STAGED_LOCK:
+        if not r.get("ok"):
+            _STAGED.pop(uuid_str, None)
+            return r
+        _STAGED.setdefault(uuid_str, set()).update(r["result"]["stored"])
+    res = r["result"]
+    res["sent_bytes"] = sum(len(e["data"]) for e in entries if "data" in e)
+    if res["missing"]:
+        return {**r, "ok": False, "error": f"payloads missing on the endpoint: {', '.join(res['missing'])}"}
+    logging.debug("%s: %d written, %d unchanged, %d payload bytes sent", r.get("label"), len(res["written"]),
+                  len(res["unchanged"]), res["sent_bytes"])
+    return r
+
+def stage_remote_files(uuid_str: str, label: str, files: list[dict], *, store: str | None = None,
+                       known=()) -> dict:
+    """
+    write_remote_files by content (remote_fns.stage_files), in a single submission in the usual case
+    - Files already holding their content are not rewritten
+    - A payload is sent only if the endpoint is not known to hold it (known: digests the caller last saw
+      there, plus what this process staged), and once per submission however many paths it goes to
+    - If the endpoint lost a payload it was thought to hold, the missing ones are sent in a second submission
+    result['result'] is {'written', 'unchanged', 'missing', 'stored' (digests the endpoint now holds), 'sent_bytes'}
+    """
+    store = store or ARTIFACT_STORE
+    entries = _stage_entries(uuid_str, files, known)
+    r = call_remote(uuid_str, label, remote_fns.stage_files, entries, store)
+    resend = _stage_resend(entries, files, r)
+    if not resend:
+        return _staged(uuid_str, entries, r)
+    return _staged(uuid_str, entries + resend, r, call_remote(uuid_str, label, remote_fns.stage_files, resend, store))
+
+async def astage_remote_files(uuid_str: str, label: str, files: list[dict], *, store: str | None = None,
+                              known=()) -> dict:
+    store = store or ARTIFACT_STORE
+    entries = _stage_entries(uuid_str, files, known)
+    r = await acall_remote(uuid_str, label, remote_fns.stage_files, entries, store)
+    resend = _stage_resend(entries, files, r)
+    if not resend:
+        return _staged(uuid_str, entries, r)
+    return _staged(uuid_str, entries + resend, r,
+                   await acall_remote(uuid_str, label, remote_fns.stage_files, resend, store))
+
+# openssl -newkey arguments per --key-type (EC/Ed25519 keys are generated in milliseconds, RSA in ~100ms+)
+KEY_TYPES = {
+    "rsa": "-newkey rsa:2048",
+    "ecdsa": "-newkey ec -pkeyopt ec_paramgen_curve:prime256v1",
+    "ed25519": "-newkey ed25519",
+}
+DEFAULT_CRED_DIR = "~/.scistream/creds"
+
+def _cert_cn(args, endpoint_name: str) -> str:
+    """CN for a gateway cert: the producer listener for p2cs, the consumer listener otherwise"""
+    return args.p2cs_listener if endpoint_name.lower() in ("p2cs", (args.p2cs_ep or "").lower()) else args.c2cs_listener
+
+def _san_ips(args) -> list[str]:
+    """The subjectAltName IP set every gateway cert carries (order-independent, de-duplicated)"""
+    ips = (args.p2cs_ip, args.prod_ip, args.c2cs_listener, args.c2cs_ip, args.cons_ip, args.inbound_ip, args.outbound_ip)
+    return sorted({ip for ip in ips if ip})
+
+def cred_key(args, endpoint_name: str) -> str:
+    """Credential-store key: hash of key type, CN and the SAN IP set (same inputs → same reusable cert)"""
+    key_type = getattr(args, "key_type", "rsa")
+    raw = f"{key_type}|{_cert_cn(args, endpoint_name)}|{','.join(_san_ips(args))}"
+    return hashlib.sha256(raw.encode()).hexdigest()[:16]
+
+def cert_fingerprint(pem: str) -> str:
+    """SHA-256 fingerprint (hex) of a PEM certificate's DER bytes"""
+    body = "".join(l for l in pem.strip().splitlines() if l and not l.startswith("-----"))
+    return hashlib.sha256(base64.b64decode(body)).hexdigest()
+
+def _shell_path(path: str) -> str:
+    """'~/x' → '$HOME/x' so the remote shell expands it inside double quotes"""
+    return "$HOME/" + path[2:] if path.startswith("~/") else path
+
+def trust_file(args, peer_cert_pem: str) -> dict:
+    """write_files entry recording a peer gateway cert in the persistent trust store (by fingerprint)"""
+    cred_dir = getattr(args, "cred_dir", None) or DEFAULT_CRED_DIR
+    return {"path": f"{cred_dir}/trust/{cert_fingerprint(peer_cert_pem)}.crt", "data": peer_cert_pem, "mode": 0o644}
+
+def key_gen_script(args, endpoint_name: str, *, sess_dir: str, peer_fp: str | None = None) -> str:
     """
-    Generate a self-signed cert/key pair remotely via openssl and return the cert PEM
+    Shell body that provides the gateway cert/key for this session and prints the cert PEM
+    - Credentials live in a per-gateway store (--cred-dir/<cred_key>) and are reused across sessions
+      while valid for more than --cert-renew-days; otherwise a new pair is generated (--key-type)
+    - The pair is copied into sess_dir/certs/server.{key,crt} where s2cs reads it
+    - If peer_fp is given and that peer cert is already in the trust store, it becomes
+      sess_dir/certs/peer.crt and the peer distribution can be skipped
+    - Status lines on stderr: 'CRED REUSED|NEW <key>' and 'TRUSTED <fp>'
     CN is chosen based on which side we're on (producer/consumer)
     """
-    cn = args.p2cs_listener if endpoint_name.lower() == "thats" else args.c2cs_listener
-    script = f"""
-                mkdir -p "{sess_dir}/certs"
-                openssl req -x509 -nodes -days 365 -newkey rsa:2048 \
-                -keyout "{sess_dir}/certs/server.key" \
-                -out "{sess_dir}/certs/server.crt" \
-                -subj "/CN={cn}" \
-                -addext "subjectAltName=IP:{args.p2cs_ip}, IP:{args.prod_ip}, IP:{args.c2cs_listener}, IP:{args.c2cs_ip}, IP:{args.cons_ip}, IP:{args.inbound_ip}, IP:{args.outbound_ip}" 2>/dev/null
-                cat "{sess_dir}/certs/server.crt"
+    cn = _cert_cn(args, endpoint_name)
+    key = cred_key(args, endpoint_name)
+    key_type = getattr(args, "key_type", "rsa")
+    cred_dir = _shell_path(getattr(args, "cred_dir", None) or DEFAULT_CRED_DIR)
+    days = int(getattr(args, "cert_days", 365))
+    margin = int(float(getattr(args, "cert_renew_days", 7)) * 86400)
+    san = ", ".join(f"IP:{ip}" for ip in _san_ips(args))
+    trust = f"""
+                if [ -s "$TRUST/{peer_fp}.crt" ]; then cp "$TRUST/{peer_fp}.crt" "$CERTS/peer.crt"; echo "TRUSTED {peer_fp}" >&2; fi""" if peer_fp else ""
+    return f"""
+                CRED="{cred_dir}/{key}" && TRUST="{cred_dir}/trust" && CERTS="{sess_dir}/certs"
+                mkdir -p "$CRED" "$TRUST" "$CERTS" && chmod 700 "{cred_dir}" "$CRED"
+                if [ -s "$CRED/server.key" ] && openssl x509 -checkend {margin} -noout -in "$CRED/server.crt" >/dev/null 2>&1; then
+                    echo "CRED REUSED {key}" >&2
+                else
+                    openssl req -x509 -nodes -days {days} {KEY_TYPES[key_type]} \
+                    -keyout "$CRED/.server.key.new" \
+                    -out "$CRED/.server.crt.new" \
+                    -subj "/CN={cn}" \
+                    -addext "subjectAltName={san}" 2>/dev/null
+                    chmod 600 "$CRED/.server.key.new"
+                    mv -f "$CRED/.server.key.new" "$CRED/server.key" && mv -f "$CRED/.server.crt.new" "$CRED/server.crt"
+                    echo "CRED NEW {key}" >&2
+                fi
+                cp -p "$CRED/server.key" "$CRED/server.crt" "$CERTS/"{trust}
+                cat "$CRED/server.crt"
                 """
-    r = run_remote(uuid, f"KEYGEN:{endpoint_name}", script)
+
+def parse_key_gen(r: dict) -> dict:
+    """Turn a KEYGEN run result into {ok, label, cert_pem, fingerprint, reused, trusted} (or a failure dict)"""
     if not r.get("ok"): 
         return r
     pem = (r.get("stdout") or "").strip()
     if not pem.startswith("-----BEGIN CERTIFICATE-----"):
         return {"ok": False, "label": r.get("label"), "error": "No certificate in stdout"}
-    return {"ok": True, "label": r.get("label"), "cert_pem": pem}
+    err = (r.get("stderr") or "").split()
+    trusted = err[err.index("TRUSTED") + 1] if "TRUSTED" in err[:-1] else None
+    return {"ok": True, "label": r.get("label"), "cert_pem": pem, "fingerprint": cert_fingerprint(pem),
+            "reused": "REUSED" in err, "trusted": trusted}
+
+def key_gen(args, endpoint_name: str, uuid: str, *, sess_dir: str) -> dict:
+    """
+    Provide the gateway cert/key pair remotely (reused from the credential store, or generated via openssl)
+    and return the cert PEM
+    """
+    script = key_gen_script(args, endpoint_name, sess_dir=sess_dir)
+    return parse_key_gen(run_remote(uuid, f"KEYGEN:{endpoint_name}", script))
 
 def crt_dist(args, endpoint_name: str, uuid: str, *, sess_dir: str, peer_cert_pem: str) -> dict:
     """
     Write the other gateway cert PEM into sess_dir/certs/peer.crt on the remote host
-    No need but added a python heredoc to safely base64-decode the payload
-    """
-    b64 = base64.b64encode(peer_cert_pem.encode("utf-8")).decode("ascii")
-    script = f"""
-mkdir -p "{sess_dir}/certs"
-python3 - <<'PY'
-import base64,os
-p="{sess_dir}/certs/peer.crt"
-os.makedirs(os.path.dirname(p), exist_ok=True)
-with open(p,"wb") as f: f.write(base64.b64decode("{b64}".encode("ascii")))
-print("OK")
-PY
-"""
-    return run_remote(uuid, f"CRT-DIST:{endpoint_name}", script)
+    """
+    return stage_remote_files(uuid, f"CRT-DIST:{endpoint_name}", [peer_cert_file(sess_dir, peer_cert_pem)],
+                              store=getattr(args, "artifact_dir", None))
+
+def peer_cert_file(sess_dir: str, peer_cert_pem: str) -> dict:
+    """write_files entry for the peer gateway's cert"""
+    return {"path": f"{sess_dir}/certs/peer.crt", "data": peer_cert_pem, "mode": 0o644}
 
 def key_dist(args, endpoint_name: str, uuid: str, *, sess_dir: str, psk_secret: str | None=None) -> dict:
     """
@@ -113,15 +623,9 @@ def key_dist(args, endpoint_name: str, uuid: str, *, sess_dir: str, psk_secret:
     """
     if not psk_secret:
         return {"ok": True, "label": f"KEY-DIST:{endpoint_name}", "skipped": True}
-    b64 = base64.b64encode(psk_secret.encode("utf-8")).decode("ascii")
-    script = f"""
-mkdir -p "{sess_dir}/certs"
-python3 - <<'PY'
-import base64,os
-p="{sess_dir}/certs/psk.secrets"
-os.makedirs(os.path.dirname(p), exist_ok=True)
-with open(p,"wb") as f: f.write(base64.b64decode("{b64}".encode("ascii")))
-print("OK")
-PY
-"""
-    return run_remote(uuid, f"KEY-DIST:{endpoint_name}", script)
\ No newline at end of file
+    return stage_remote_files(uuid, f"KEY-DIST:{endpoint_name}", [psk_file(sess_dir, psk_secret)],
+                              store=getattr(args, "artifact_dir", None))
+
+def psk_file(sess_dir: str, psk_secret: str) -> dict:
+    """write_files entry for the PSK secrets file (owner-readable only; staged as a secret, outside the artifact store)"""
+    return {"path": f"{sess_dir}/certs/psk.secrets", "data": psk_secret, "mode": 0o600, "secret": True}
@@ -0,0 +1,235 @@
+"""
+Session supervision (--watch): notice dead s2cs / s2uc processes and bring the streams back
+
+Every --watch-interval a health round submits one remote_fns.check_procs call per endpoint of the
+session, all concurrently: on the gateways the s2cs pidfile and its sync port (a process that is
+alive but no longer listening counts as down), on the runners the s2uc pidfile of every connected
+stream. A failure is repaired with the smallest relaunch that restores every stream:
+  p2cs down       restart it (launcher.p2cs), then reconnect every stream (inbound + outbound:
+                  the UIDs died with it)
+  c2cs down       restart it (launcher.c2cs), then re-run outbound-request for every stream with
+                  the UID and listen ports saved from inbound-request
+  inbound dead    reconnect that stream
+  outbound dead   re-run that stream's outbound-request with its saved UID and ports
+An endpoint that cannot be reached is reported, not repaired (there is nothing to relaunch on).
+A component whose recovery failed --watch-max-attempts times in a row is left alone until it is
+seen healthy again
+
+Each recovery is kept as an event with its time to recover (detection → streams back) and the
+outage (last healthy check → streams back, an upper bound)
+"""
+from __future__ import annotations
+import logging, threading, time
+from collections import deque
+from typing import Dict, List, Optional
+
+import remote_fns
+from scheduler import run_parallel, step_ok
+from tracing import span
+from util import call_remote
+
+GATEWAYS = ("p2cs", "c2cs")
+
+
+class Watchdog:
+    """Supervises one controller's session in a background thread; see the module docstring"""
+
+    def __init__(self, ctl, *, interval: float = 2.0, max_attempts: int = 3, history: int = 100):
+        self.ctl = ctl
+        self.interval = float(interval)
+        self.max_attempts = int(max_attempts)
+        # Held for a whole check + recovery round; hold it to change streams without racing a recovery
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.events: deque = deque(maxlen=int(history))
+        self.rounds = 0
+        self.last: Dict[str, dict] = {}
+        self._healthy_at: Dict[str, float] = {}
+        self._attempts: Dict[str, int] = {}
+
+    # ------------------------------ Supervision -----------------------------
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="watchdog", daemon=True)
+        self._thread.start()
+        logging.info("Watchdog: checking gateways and runners every %.1fs", self.interval)
+
+    def stop(self, timeout: Optional[float] = None) -> bool:
+        """Stop supervising; a round in flight (a recovery included) is waited for at most timeout seconds"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return not self.running
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.check_once()
+            except Exception:
+                logging.exception("Watchdog round failed")
+
+    def check_once(self) -> Optional[dict]:
+        """One health round, plus a recovery if anything is down; returns the recovery event (None when healthy)"""
+        with self.lock:
+            started = time.time()
+            health = self.check()
+            detected = time.time()
+            self.rounds += 1
+            self.last = health
+            failed = []
+            for comp, h in health.items():
+                if h["ok"]:
+                    self._healthy_at[comp] = started
+                    self._attempts.pop(comp, None)
+                elif h["ok"] is False and self._attempts.get(comp, 0) < self.max_attempts:
+                    failed.append(comp)
+            if not failed or self._stop.is_set():
+                return None
+            return self.recover({c: health[c] for c in failed}, detected=detected)
+
+    # -------------------------------- Health --------------------------------
+
+    def _targets(self) -> Dict[str, Dict[str, dict]]:
+        """{endpoint ID: {component: {'kind', 'stream', 'pidfile', 'addr'}}} for everything that should be running"""
+        ctl = self.ctl
+        plan: Dict[str, Dict[str, dict]] = {}
+        for side in GATEWAYS:
+            if not ctl._gateway_up[side]:
+                continue
+            ep, listener = ((ctl.args.p2cs_ep, ctl.args.p2cs_listener) if side == "p2cs"
+                            else (ctl.args.c2cs_ep, ctl.args.c2cs_listener))
+            plan.setdefault(ctl._eid(ep), {})[side] = {
+                "kind": side, "stream": None, "pidfile": ctl._pidfile(side),
+                "addr": f"{listener}:{int(ctl.args.sync_port)}"}
+        for st in list(ctl.streams.values()):
+            if not st["connected"]:
+                continue
+            for kind in ("inbound", "outbound"):
+                plan.setdefault(ctl._runner_eid(kind), {})[ctl._step_name(kind, st["name"])] = {
+                    "kind": kind, "stream": st["name"], "pidfile": ctl._pidfile(kind, st), "addr": None}
+        return plan
+
+    def check(self) -> Dict[str, dict]:
+        """
+        {component: {'ok', 'kind', 'stream', 'pid', 'alive', 'listening'?, 'error'?}} for every gateway that was
+        launched (and not stopped since) and every connected stream's s2uc ('inbound', 'outbound:det2', ...)
+        ok is None when the endpoint could not be asked (unknown, not a failure)
+        """
+        plan = self._targets()
+        done = run_parallel({
+            eid: (lambda eid=eid, comps=comps: call_remote(
+                eid, "WATCH:health", remote_fns.check_procs,
+                [c["pidfile"] for c in comps.values()], [c["addr"] for c in comps.values() if c["addr"]], wait=30))
+            for eid, comps in plan.items()
+        })
+        health: Dict[str, dict] = {}
+        for eid, comps in plan.items():
+            r = done[eid]
+            res = r.get("result") or {}
+            for comp, c in comps.items():
+                h = {"kind": c["kind"], "stream": c["stream"]}
+                if not r.get("ok"):
+                    health[comp] = {**h, "ok": None, "error": r.get("error")}
+                    continue
+                proc = res["procs"].get(c["pidfile"]) or {"pid": None, "alive": False}
+                h.update(pid=proc["pid"], alive=proc["alive"], ok=proc["alive"])
+                if c["addr"]:
+                    h["listening"] = bool(res["listening"].get(c["addr"]))
+                    h["ok"] = h["ok"] and h["listening"]
+                if not h["ok"]:
+                    h["error"] = ("process exited" if not proc["alive"]
+                                  else f"sync port {c['addr']} not listening")
+                health[comp] = h
+        for comp, h in health.items():
+            if h["ok"] is None:
+                logging.warning("Watchdog: cannot check %s: %s", comp, h["error"])
+        return health
+
+    # ------------------------------- Recovery -------------------------------
+
+    def recover(self, failed: Dict[str, dict], *, detected: float | None = None) -> dict:
+        """
+        Relaunch the failed components and reconnect the streams that depended on them (see the module docstring)
+        Returns the recorded event {'ok', 'failed', 'detected_at', 'recovered_at', 'ttr_s', 'outage_s',
+        'gateways', 'streams'}
+        """
+        ctl = self.ctl
+        detected = detected or time.time()
+        gateways = [g for g in GATEWAYS if g in failed]
+        connected = [n for n, st in ctl.streams.items() if st["connected"]]
+        full = set(connected) if "p2cs" in gateways else set()
+        outbound = set(connected) if "c2cs" in gateways else set()
+        for h in failed.values():
+            if h["kind"] == "inbound":
+                full.add(h["stream"])
+            elif h["kind"] == "outbound":
+                outbound.add(h["stream"])
+        outbound -= full
+        logging.warning("Watchdog: %s down (%s); restarting %s, reconnecting %s",
+                        ", ".join(sorted(failed)), "; ".join(f"{c}: {h.get('error')}" for c, h in sorted(failed.items())),
+                        ", ".join(gateways) or "no gateway", ", ".join(sorted(full | outbound)) or "no stream")
+
+        with span("watchdog:recover", failed=",".join(sorted(failed))):
+            restarts = run_parallel({g: (lambda g=g: ctl.restart_gateway(g)) for g in gateways})
+            streams: Dict[str, dict] = {}
+            if all(step_ok(r) for r in restarts.values()):
+                streams = run_parallel({
+                    n: (lambda n=n: ctl.reconnect_stream(n, keep_uid=n in outbound))
+                    for n in sorted(full | outbound) if n in ctl.streams
+                })
+        recovered = time.time()
+        ok = all(step_ok(r) for r in restarts.values()) and all(step_ok(r) for r in streams.values())
+        since = min((self._healthy_at.get(c, detected) for c in failed), default=detected)
+        event = {
+            "ok": ok,
+            "failed": {c: h.get("error") for c, h in failed.items()},
+            "detected_at": detected,
+            "recovered_at": recovered if ok else None,
+            "ttr_s": round(recovered - detected, 3) if ok else None,
+            "outage_s": round(recovered - since, 3) if ok else None,
+            "gateways": restarts,
+            "streams": streams,
+        }
+        self.events.append(event)
+        if ok:
+            logging.info("Watchdog: recovered %s in %.2fs (outage <= %.2fs)",
+                         ", ".join(sorted(failed)), event["ttr_s"], event["outage_s"])
+            return event
+        for comp in failed:
+            self._attempts[comp] = self._attempts.get(comp, 0) + 1
+            if self._attempts[comp] >= self.max_attempts:
+                logging.error("Watchdog: giving up on %s after %d failed recoveries", comp, self._attempts[comp])
+        logging.error("Watchdog: recovery of %s failed: gateways=%s streams=%s",
+                      ", ".join(sorted(failed)), restarts, streams)
+        return event
+
+    def summary(self) -> dict:
+        """
+        {'running', 'rounds', 'health' (last round), 'recoveries', 'failed_recoveries', 'ttr_s_max', 'gave_up', 'events'}
+        (JSON-ready)
+        """
+        events: List[dict] = list(self.events)
+        ttr = [e["ttr_s"] for e in events if e["ok"]]
+        return {
+            "running": self.running,
+            "rounds": self.rounds,
+            "health": self.last,
+            "recoveries": len(ttr),
+            "failed_recoveries": len(events) - len(ttr),
+            "ttr_s_max": max(ttr) if ttr else None,
+            "gave_up": sorted(c for c, n in self._attempts.items() if n >= self.max_attempts),
+            "events": events,
+        }
+
+
+def from_args(ctl) -> Watchdog:
+    a = ctl.args
+    return Watchdog(ctl, interval=a.watch_interval, max_attempts=a.watch_max_attempts)
@@ -0,0 +1,73 @@
+"""Awaitable remote calls on the local backend: concurrency, failures, timeouts, cancellation"""
+from __future__ import annotations
+import asyncio, os, shutil, sys, time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+pytest.importorskip("globus_compute_sdk")
+if not shutil.which("bash"):
+    pytest.skip("needs bash", allow_module_level=True)
+
+import remote_fns, util  # noqa: E402
+from aiocontroller import gather_results  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def local_pool():
+    yield
+    util._POOL.shutdown()
+
+
+def test_scripts_overlap_on_one_event_loop():
+    async def main():
+        t0 = time.monotonic()
+        res = await gather_results({
+            f"s{i}": util.arun_remote("local", f"T:{i}", f'sleep 0.5; echo "${{N:-none}} {i}"', env={"N": "n"})
+            for i in range(8)
+        })
+        return res, time.monotonic() - t0
+
+    res, elapsed = asyncio.run(main())
+    assert all(r["ok"] for r in res.values())
+    assert [r["stdout"].strip() for r in res.values()] == [f"n {i}" for i in range(8)]
+    assert elapsed < 3  # 8 x 0.5s ran concurrently
+    assert res["s0"]["timing"]["exec_s"] is not None  # remote start/end stamps came back
+
+
+def test_failing_script_keeps_its_output():
+    r = asyncio.run(util.arun_remote("local", "T:fail", "echo partial; echo boom >&2; exit 3"))
+    assert r["ok"] is False and r["returncode"] == 3
+    assert r["stdout"].strip() == "partial" and "boom" in r["error"]
+
+
+def test_native_function(tmp_path):
+    log = tmp_path / "x.log"
+    log.write_text("a\nb\n")
+    r = asyncio.run(util.acall_remote("local", "LOG", remote_fns.tail_log, str(log), 0))
+    assert r["ok"] and r["result"]["data"] == "a\nb\n"
+
+
+def test_timeout_and_cancellation():
+    r = asyncio.run(util.arun_remote("local", "T:slow", "sleep 5", wait=0.3))
+    assert r["ok"] is False and "no result within" in r["error"]
+
+    async def cancelled():
+        task = asyncio.ensure_future(util.arun_remote("local", "T:cancel", "sleep 5"))
+        await asyncio.sleep(0.2)
+        task.cancel()
+        await task
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(cancelled())
+
+
+def test_gather_results_turns_exceptions_into_results():
+    async def boom():
+        raise OSError("no route")
+
+    async def fine():
+        return {"ok": True}
+
+    assert asyncio.run(gather_results({"a": fine(), "b": boom()})) == {
+        "a": {"ok": True}, "b": {"ok": False, "error": "OSError: no route"}}
@@ -0,0 +1,69 @@
+"""Deep clean stops the previous session (newest marker) only: processes and port reservations alike"""
+from __future__ import annotations
+import os, shutil, subprocess, sys, time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+pytest.importorskip("globus_compute_sdk")
+if not shutil.which("setsid"):
+    pytest.skip("needs setsid", allow_module_level=True)
+
+from config import get_args  # noqa: E402
+from controller import StreamController  # noqa: E402
+
+
+@pytest.fixture
+def host(tmp_path):
+    """A gateway's pid dir and session base, and a controller (not yet marked) that cleans them"""
+    pids, base = tmp_path / "pids", tmp_path / "base"
+    (pids / "ports").mkdir(parents=True)
+    ctl = StreamController.__new__(StreamController)
+    ctl.args = get_args(["--session-base", str(base), "--pid-dir", str(pids)])
+    ctl.session_id, ctl.pid_dir = "me", str(pids)
+    procs = []
+    yield ctl, pids, base, procs
+    for p in procs:
+        p.kill()
+        p.wait()
+
+
+def session(pids, base, procs, sid: str):
+    """A running session: a setsid process recorded in its procs dir, and its marker"""
+    p = subprocess.Popen(["setsid", "sleep", "60"])
+    procs.append(p)
+    (base / sid / "procs").mkdir(parents=True)
+    (base / sid / "procs" / "s2cs.pid").write_text(str(p.pid))
+    (pids / f".session-{sid}.mark").touch()
+    time.sleep(0.05)  # distinct marker mtimes
+    return p
+
+
+def deep_clean(ctl) -> None:
+    r = subprocess.run(["bash", "-c", "set -euo pipefail\n" + ctl._deep_clean_script()], capture_output=True, text=True,
+                       timeout=30)
+    assert r.returncode == 0 and r.stdout.split() == ["OK"], r.stderr
+
+
+def test_only_the_previous_session_is_stopped(host):
+    ctl, pids, base, procs = host
+    other = session(pids, base, procs, "other")  # e.g. a daemon started earlier
+    prev = session(pids, base, procs, "prev")
+    for port, owner in ((5100, "prev:a"), (5101, "other:a"), (5102, "prev:b:1f2e")):
+        (pids / "ports" / str(port)).write_text(owner)
+    deep_clean(ctl)
+    assert prev.wait(5) is not None
+    assert other.poll() is None
+    assert sorted(os.listdir(pids / "ports")) == ["5101"]
+
+
+def test_without_a_marker_nothing_session_scoped_is_touched(host):
+    ctl, pids, base, procs = host
+    p = subprocess.Popen(["setsid", "sleep", "60"])
+    procs.append(p)
+    (base / "unmarked" / "procs").mkdir(parents=True)
+    (base / "unmarked" / "procs" / "s2cs.pid").write_text(str(p.pid))
+    (pids / "ports" / "5100").write_text("unmarked:a")
+    deep_clean(ctl)
+    time.sleep(0.2)
+    assert p.poll() is None and os.listdir(pids / "ports") == ["5100"]
@@ -0,0 +1,69 @@
+"""ExecutorPool: building one endpoint's executor must not block leases on the others"""
+from __future__ import annotations
+import os, sys, threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+pytest.importorskip("globus_compute_sdk")
+
+import util  # noqa: E402
+
+
+class FakeExecutor:
+    def __init__(self, endpoint_id: str):
+        self.endpoint_id, self.closed = endpoint_id, False
+
+    def shutdown(self, wait: bool = True, cancel_futures: bool = False) -> None:
+        self.closed = True
+
+
+def test_slow_construction_does_not_hold_the_pool(monkeypatch):
+    slow_started, release = threading.Event(), threading.Event()
+
+    def new_executor(eid):
+        if eid == "slow":
+            slow_started.set()
+            release.wait(5)
+        return FakeExecutor(eid)
+
+    monkeypatch.setattr(util, "new_executor", new_executor)
+    pool = util.ExecutorPool()
+
+    def lease_slow():
+        with pool.lease("slow"):
+            pass
+
+    t = threading.Thread(target=lease_slow)
+    t.start()
+    assert slow_started.wait(5)
+    with pool.lease("fast") as gce:  # waited for the slow construction when it ran under the lock
+        assert gce.endpoint_id == "fast"
+    release.set()
+    t.join(5)
+    assert not t.is_alive()
+
+
+def test_racing_creations_keep_one_executor(monkeypatch):
+    built, barrier = [], threading.Barrier(4)
+
+    def new_executor(eid):
+        barrier.wait(5)
+        built.append(FakeExecutor(eid))
+        return built[-1]
+
+    monkeypatch.setattr(util, "new_executor", new_executor)
+    pool = util.ExecutorPool()
+    got = []
+
+    def lease():
+        with pool.lease("ep") as gce:
+            got.append(gce)
+
+    threads = [threading.Thread(target=lease) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    assert len(built) == 4 and len({id(g) for g in got}) == 1
+    assert sum(not e.closed for e in built) == 1 and not got[0].closed
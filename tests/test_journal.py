@@ -0,0 +1,78 @@
+"""SessionJournal: a controller snapshot survives a restart and tells --resume what can be reused"""
+from __future__ import annotations
+import argparse, json, os, sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+
+from config import get_args  # noqa: E402
+from journal import SessionJournal  # noqa: E402
+
+SID = "20250101-120000-1a2b3c4d"
+
+
+def controller(args: argparse.Namespace) -> SimpleNamespace:
+    """The controller state snapshot() reads, for one connected stream"""
+    sargs = argparse.Namespace(**{**vars(args), "outbound_dst_ports": ["5100"], "num_conn": 2})
+    return SimpleNamespace(
+        args=args, session_id=SID, sess_dir=f"/tmp/.scistream/{SID}",
+        endpoints={"thats": "eid-p2cs", "neat": "eid-c2cs", "inbound": "eid-in", "outbound": "eid-out"},
+        streams={"a": {"args": sargs, "reserved": ["5100"], "uid": "uid-1", "listen_ports": ["5074"],
+                       "connected": True, "pids": {"inbound": 11, "outbound": 12}}},
+        p2cs_cert_pem="P2CS PEM", c2cs_cert_pem="C2CS PEM",
+        _gateway_up={"p2cs": True, "c2cs": True}, _gateway_pid={"p2cs": 101, "c2cs": 202},
+        _runner_certs_staged=True,
+    )
+
+
+def test_record_then_load(tmp_path):
+    args = get_args([])
+    path = SessionJournal.path_for(str(tmp_path), SID)
+    j = SessionJournal(path)
+    ctl = controller(args)
+    j.record(ctl, "prepare")
+    j.record(ctl, "launch:p2cs", ok=False)
+    assert not [n for n in os.listdir(tmp_path) if n.startswith(".tmp-")]  # replaced atomically
+
+    back = SessionJournal.load(str(tmp_path), SID)
+    assert back.session_id == SID and back.data["sess_dir"] == ctl.sess_dir
+    assert back.step_ok("prepare") and not back.step_ok("launch:p2cs") and not back.step_ok("crypto")
+    assert back.data["certs"] == {"p2cs": "P2CS PEM", "c2cs": "C2CS PEM"}
+    assert back.data["gateways"]["c2cs"] == {"up": True, "pid": 202}
+    st = back.data["streams"]["a"]
+    assert st["outbound_dst_ports"] == ["5100"] and st["num_conn"] == 2 and st["pids"] == {"inbound": 11, "outbound": 12}
+    assert st["overrides"] == {}
+
+
+def test_settings_and_endpoints_checked_on_resume(tmp_path):
+    args = get_args([])
+    j = SessionJournal(SessionJournal.path_for(str(tmp_path), SID))
+    j.record(controller(args))
+    back = SessionJournal.load(str(tmp_path), SID)
+    assert back.mismatched(get_args([])) == []
+    assert back.mismatched(get_args(["--sync-port", "5999", "--key-type", "ed25519"])) == ["sync_port", "key_type"]
+    assert back.known_endpoints(args) == {"p2cs": "eid-p2cs", "c2cs": "eid-c2cs",
+                                          "inbound": "eid-in", "outbound": "eid-out"}
+    # A runner moved to another endpoint name is resolved again
+    moved = get_args(["--inbound-ep", "elsewhere"])
+    assert "inbound" not in back.known_endpoints(moved) and "outbound" in back.known_endpoints(moved)
+
+
+def test_load_errors_and_remove(tmp_path):
+    with pytest.raises(ValueError, match="No journal"):
+        SessionJournal.load(str(tmp_path), SID)
+    path = SessionJournal.path_for(str(tmp_path), SID)
+    with open(path, "w") as fh:
+        fh.write("{not json")
+    with pytest.raises(ValueError, match="Unreadable"):
+        SessionJournal.load(str(tmp_path), SID)
+    with open(path, "w") as fh:
+        json.dump({"version": SessionJournal.VERSION, "session_id": "someone-else"}, fh)
+    with pytest.raises(ValueError, match="not a version"):
+        SessionJournal.load(str(tmp_path), SID)
+    j = SessionJournal(path)
+    j.remove()
+    j.remove()  # already gone: fine
+    assert not os.path.exists(path)
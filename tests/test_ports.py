@@ -0,0 +1,96 @@
+"""remote_fns.reserve_ports / release_ports: reservations are owned, replaced when busy, reclaimed when stale"""
+from __future__ import annotations
+import os, socket, sys, time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+
+from remote_fns import release_ports, reserve_ports  # noqa: E402
+
+IP = "127.0.0.1"
+
+
+def free_block(n: int) -> list[int]:
+    """n consecutive ports that bind on IP right now"""
+    for start in range(42000, 60000, n + 1):
+        socks = []
+        try:
+            for p in range(start, start + n):
+                s = socket.socket()
+                socks.append(s)
+                s.bind((IP, p))
+            return list(range(start, start + n))
+        except OSError:
+            continue
+        finally:
+            for s in socks:
+                s.close()
+    pytest.skip("no free port block")
+
+
+def holders(resv) -> dict:
+    return {int(n): (resv / n).read_text() for n in os.listdir(resv)}
+
+
+def test_reserve_is_owned_and_idempotent(tmp_path):
+    resv = tmp_path / "ports"
+    ports = free_block(4)
+    rng = [ports[0], ports[-1]]
+    r = reserve_ports([{"owner": "s1:a", "preferred": ports[:2]}], IP, rng, str(resv))
+    assert r == {"allocations": {"s1:a": {"ports": ports[:2], "replaced": {}}}, "errors": {}}
+    assert holders(resv) == {ports[0]: "s1:a", ports[1]: "s1:a"}
+    # The same owner asking again keeps its ports
+    again = reserve_ports([{"owner": "s1:a", "preferred": ports[:2]}], IP, rng, str(resv))
+    assert again["allocations"]["s1:a"]["ports"] == ports[:2]
+    # Another owner gets replacements from the range, in the busy ports' positions
+    other = reserve_ports([{"owner": "s2:a", "preferred": [ports[1], ports[0]]}], IP, rng, str(resv))
+    got = other["allocations"]["s2:a"]
+    assert sorted(got["ports"]) == ports[2:]
+    assert got["replaced"] == {ports[1]: got["ports"][0], ports[0]: got["ports"][1]}
+
+
+def test_strict_and_contiguous(tmp_path):
+    resv = tmp_path / "ports"
+    ports = free_block(5)
+    rng = [ports[0], ports[-1]]
+    reserve_ports([{"owner": "s1:a", "preferred": [ports[1]]}], IP, rng, str(resv))
+    strict = reserve_ports([{"owner": "s2:a", "preferred": ports[:2]}], IP, rng, str(resv), strict=True)
+    assert "s2:a" in strict["errors"] and not strict["allocations"]
+    assert holders(resv) == {ports[1]: "s1:a"}  # nothing left behind by the failed request
+    block = reserve_ports([{"owner": "s2:a", "preferred": ports[:2]}], IP, rng, str(resv), contiguous=True)
+    assert block["allocations"]["s2:a"]["ports"] == ports[2:4]
+
+
+def test_busy_port_is_not_reserved(tmp_path):
+    resv = tmp_path / "ports"
+    ports = free_block(3)
+    with socket.socket() as s:
+        s.bind((IP, ports[0]))
+        s.listen()
+        r = reserve_ports([{"owner": "s1:a", "preferred": [ports[0]]}], IP, [ports[1], ports[2]], str(resv))
+    assert r["allocations"]["s1:a"] == {"ports": [ports[1]], "replaced": {ports[0]: ports[1]}}
+    assert holders(resv) == {ports[1]: "s1:a"}
+
+
+def test_stale_reservation_is_reclaimed(tmp_path):
+    resv = tmp_path / "ports"
+    ports = free_block(1)
+    reserve_ports([{"owner": "dead:a", "preferred": ports}], IP, [ports[0], ports[0]], str(resv))
+    r = reserve_ports([{"owner": "s1:a", "preferred": ports}], IP, [ports[0], ports[0]], str(resv), ttl_s=60)
+    assert "s1:a" in r["errors"]
+    old = time.time() - 120
+    os.utime(resv / str(ports[0]), (old, old))
+    r = reserve_ports([{"owner": "s1:a", "preferred": ports}], IP, [ports[0], ports[0]], str(resv), ttl_s=60)
+    assert r["allocations"]["s1:a"]["ports"] == ports and holders(resv) == {ports[0]: "s1:a"}
+
+
+def test_release_only_touches_the_owner(tmp_path):
+    resv = tmp_path / "ports"
+    resv.mkdir()
+    for port, owner in ((5100, "s1:a"), (5101, "s1:b"), (5102, "s1:b:1f2e"), (5103, "s10:a"), (5104, "s2:a")):
+        (resv / str(port)).write_text(owner)
+    assert release_ports(str(resv), "s1:b", [5101, 5104]) == {"released": [5101]}
+    assert release_ports(str(resv), "s1") == {"released": [5100, 5102]}  # not s10's
+    assert holders(resv) == {5103: "s10:a", 5104: "s2:a"}
+    assert release_ports(str(tmp_path / "none"), "s1") == {"released": []}
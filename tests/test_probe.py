@@ -0,0 +1,77 @@
+"""Endpoint resolution and probing: one probe per unique endpoint, concurrent, failing fast"""
+from __future__ import annotations
+import os, sys, threading, time
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+pytest.importorskip("globus_compute_sdk")
+
+import controller  # noqa: E402
+from config import get_args  # noqa: E402
+from controller import StreamController  # noqa: E402
+
+VISIBLE = [{"name": "thats-gateway", "id": "eid-thats"}, {"name": "NEAT", "id": "eid-neat"},
+           {"name": "lab-swell-runner", "id": "eid-swell"}]
+
+
+def bare(argv=()) -> StreamController:
+    ctl = StreamController.__new__(StreamController)
+    ctl.args, ctl.ep_cache, ctl._cached_eids = get_args(list(argv)), None, set()
+    ctl._client = SimpleNamespace(get_endpoints=lambda: VISIBLE)
+    return ctl
+
+
+def test_roles_sharing_an_endpoint_share_one_probe(monkeypatch):
+    probes, lock = [], threading.Lock()
+    started = threading.Barrier(3, timeout=5)
+
+    def run_remote(eid, label, script, **kw):
+        started.wait()  # all three probes are in flight at once
+        with lock:
+            probes.append((eid, label))
+        return {"ok": True, "stdout": "OK\n"}
+
+    monkeypatch.setattr(controller, "run_remote", run_remote)
+    resolved = bare()._resolve_and_probe_endpoints({})
+    # exact (case-insensitive), prefix and substring matches
+    assert resolved == {"thats": "eid-thats", "neat": "eid-neat", "inbound": "eid-swell", "outbound": "eid-swell"}
+    assert sorted(probes) == [("eid-neat", "PROBE:c2cs"), ("eid-swell", "PROBE:inbound+outbound"),
+                              ("eid-thats", "PROBE:p2cs")]
+
+
+def test_known_roles_are_neither_resolved_nor_probed(monkeypatch):
+    probes = []
+    monkeypatch.setattr(controller, "run_remote", lambda eid, *a, **kw: probes.append(eid) or {"ok": True, "stdout": "OK"})
+    known = {"p2cs": "eid-x", "c2cs": "eid-y", "inbound": "eid-z", "outbound": "eid-z"}
+    ctl = bare()
+    ctl._client = None  # listing endpoints would need a real client
+    assert ctl._resolve_and_probe_endpoints(known) == {"thats": "eid-x", "neat": "eid-y", "inbound": "eid-z",
+                                                       "outbound": "eid-z"}
+    assert probes == []
+
+
+def test_first_failure_is_raised_without_waiting_for_slow_probes(monkeypatch):
+    release = threading.Event()
+
+    def run_remote(eid, label, script, **kw):
+        if eid == "eid-neat":
+            return {"ok": False, "error": "endpoint offline"}
+        release.wait(10)
+        return {"ok": True, "stdout": "OK"}
+
+    monkeypatch.setattr(controller, "run_remote", run_remote)
+    t0 = time.monotonic()
+    try:
+        with pytest.raises(RuntimeError, match=r"role 'c2cs'.*endpoint offline"):
+            bare()._resolve_and_probe_endpoints({})
+        assert time.monotonic() - t0 < 5
+    finally:
+        release.set()
+
+
+def test_unresolvable_name_lists_what_is_visible(monkeypatch):
+    monkeypatch.setattr(controller, "run_remote", lambda *a, **kw: {"ok": True, "stdout": "OK"})
+    with pytest.raises(RuntimeError, match="(?s)role 'c2cs' with name 'nowhere'.*NEAT.*--c2cs-id"):
+        bare(["--c2cs-ep", "nowhere"])._resolve_and_probe_endpoints({})
@@ -0,0 +1,93 @@
+"""StepScheduler: steps start once their dependencies succeed; a failure skips its dependents only"""
+from __future__ import annotations
+import os, sys, threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+
+from scheduler import StepScheduler, run_parallel, step_ok  # noqa: E402
+
+
+def test_step_ok():
+    assert step_ok(None) and step_ok("x") and step_ok({})
+    assert step_ok({"ok": True}) and not step_ok({"ok": False})
+    assert step_ok({"p2cs": {"ok": True}, "c2cs": {"ok": True}})
+    assert not step_ok({"p2cs": {"ok": True}, "c2cs": {"ok": False}})
+
+
+def test_dependencies_run_first_and_independent_steps_overlap():
+    order, lock = [], threading.Lock()
+    both = threading.Barrier(2, timeout=5)
+
+    def step(name, barrier=None):
+        def fn():
+            if barrier is not None:
+                barrier.wait()  # only returns if the two independent steps run at the same time
+            with lock:
+                order.append(name)
+            return {"ok": True}
+        return fn
+
+    s = StepScheduler()
+    s.add("launch", step("launch"), needs=("keygen:p2cs", "keygen:c2cs"))  # needs may name later steps
+    s.add("keygen:p2cs", step("keygen:p2cs", both))
+    s.add("keygen:c2cs", step("keygen:c2cs", both))
+    out = s.run()
+    assert list(out) == ["launch", "keygen:p2cs", "keygen:c2cs"]
+    assert all(r["ok"] for r in out.values())
+    assert order[-1] == "launch"
+
+
+def test_failure_skips_dependents_transitively_but_not_other_branches():
+    ran = []
+    s = StepScheduler()
+    s.add("prepare", lambda: {"p2cs": {"ok": True}, "c2cs": {"ok": False}})
+    s.add("crypto", lambda: ran.append("crypto"), needs=("prepare",))
+    s.add("launch", lambda: ran.append("launch"), needs=("crypto",))
+    s.add("probe", lambda: ran.append("probe") or {"ok": True})
+    out = s.run()
+    assert not out["prepare"]["ok"] and "result" in out["prepare"]
+    assert out["crypto"] == {"ok": False, "skipped": True, "error": "dependency failed: prepare"}
+    assert out["launch"]["skipped"] and "crypto" in out["launch"]["error"]
+    assert out["probe"]["ok"] and ran == ["probe"]
+
+
+def test_raising_step_and_custom_check():
+    def boom():
+        raise RuntimeError("endpoint down")
+
+    s = StepScheduler()
+    s.add("a", boom)
+    s.add("b", lambda: {"ok": True}, needs=("a",))
+    s.add("c", lambda: 3, check=lambda r: r > 5)
+    s.add("d", lambda: None, needs=("c",))
+    out = s.run()
+    assert out["a"] == {"ok": False, "error": "endpoint down"}
+    assert out["b"]["skipped"]
+    assert out["c"] == {"ok": False, "result": 3} and out["d"]["skipped"]
+
+
+def test_graph_is_validated_before_running():
+    ran = []
+    s = StepScheduler()
+    s.add("a", lambda: ran.append("a"), needs=("missing",))
+    with pytest.raises(ValueError, match="unknown step 'missing'"):
+        s.run()
+    s = StepScheduler()
+    s.add("a", lambda: ran.append("a"), needs=("b",))
+    s.add("b", lambda: ran.append("b"), needs=("a",))
+    with pytest.raises(ValueError, match="cycle"):
+        s.run()
+    with pytest.raises(ValueError, match="Duplicate"):
+        s.add("a", lambda: None)
+    assert ran == []
+
+
+def test_run_parallel_turns_exceptions_into_results():
+    def boom():
+        raise OSError("no route")
+
+    out = run_parallel({"ok": lambda: {"ok": True}, "bad": boom})
+    assert out["ok"] == {"ok": True}
+    assert out["bad"] == {"ok": False, "label": "bad", "error": "no route"}
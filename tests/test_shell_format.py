@@ -0,0 +1,97 @@
+"""
+Every generated shell payload must survive ShellFunction on a real endpoint: the SDK runs
+cmd.format(**kwargs) (walltime among them) before executing, so a stray brace breaks the command
+"""
+from __future__ import annotations
+import os, sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+sdk = pytest.importorskip("globus_compute_sdk")
+
+import launcher, util  # noqa: E402
+from controller import StreamController  # noqa: E402
+from config import get_args  # noqa: E402
+
+SESS = "/tmp/.scistream/20250101-000000-abcdef12"
+
+
+def formatted(body: str) -> str:
+    """The command as the endpoint runs it; fails like the SDK on unbalanced or unescaped braces"""
+    cmd = util._shell_command(body, {"STREAMHUB_TEST": "1"}, False)
+    out = sdk.ShellFunction(cmd).cmd.format(walltime=90)
+    assert body in out
+    return out
+
+
+@pytest.fixture
+def args():
+    return get_args(["--stream", "a=5074,5075:5100,5101"])
+
+
+def test_launch_scripts(args):
+    formatted(launcher.p2cs_script(args, sess_dir=SESS))
+    formatted(launcher.c2cs_script(args, sess_dir=SESS))
+    formatted(launcher.inbound_script(args, sess_dir=SESS, tag="a"))
+    formatted(launcher.outbound_script(args, stream_uid="uid-1", ports=["5100", "5101"], sess_dir=SESS, tag="a"))
+
+
+def test_keygen_script(args):
+    formatted(util.key_gen_script(args, "p2cs", sess_dir=SESS))
+    formatted(util.key_gen_script(args, "c2cs", sess_dir=SESS, peer_fp="ab" * 32))
+
+
+def test_iperf_scripts(args, monkeypatch):
+    bodies = []
+    monkeypatch.setattr(launcher, "run_remote", lambda uuid, label, body, **kw: bodies.append(body) or {"ok": True})
+    launcher.iperf_servers(args, "ep", ports=[5074, 5075], run_dir="/tmp/iperf")
+    launcher.iperf_clients(args, "ep", ports=[5100, 5101], run_dir="/tmp/iperf", duration=5)
+    assert len(bodies) == 2
+    for body in bodies:
+        formatted(body)
+
+
+@pytest.fixture
+def ctl(args):
+    """A controller over already-resolved endpoints; nothing is submitted"""
+    c = StreamController.__new__(StreamController)
+    c.args, c.ep_cache = args, None
+    c.endpoints = {args.p2cs_ep.lower(): "ep-p2cs", args.c2cs_ep.lower(): "ep-c2cs"}
+    c.session_id = "20250101-000000-abcdef12"
+    c.sess_dir, c.pid_dir, c.marker_name = SESS, "/tmp/.scistream", f".session-{c.session_id}.mark"
+    return c
+
+
+def test_cleanup_scripts(ctl):
+    formatted(ctl._marker_script())
+    formatted(ctl._preclean_script())
+    formatted(ctl._deep_clean_script())
+    formatted(StreamController._stop_since_marker_script(ctl.pid_dir, ctl.marker_name))
+    formatted(StreamController._kill_pidfiles_script([f"{SESS}/procs/p2cs.pid"], addrs=["127.0.0.1:5000"]))
+
+
+def test_teardown_scripts(ctl):
+    streams = [{"tag": "a", "listen_ports": ["5100", "5101"], "reserved": ["5074", "5075"]}]
+    plan = ctl._teardown_plan(("p2cs", "c2cs"), streams)
+    assert plan
+    for entry in plan.values():
+        formatted(ctl._teardown_script(entry))
+
+
+def test_prepare_batch_script(ctl):
+    batches = ctl._prepare_batches(preclean=True, deep_clean=True)
+    for b, idx in batches.values():
+        assert set(idx) == {"preclean", "deepclean", "markers", "keygen"}
+        formatted(b.script("tok"))
+
+
+def test_nonzero_exit_is_a_failure():
+    """The SDK returns a failing script's ShellResult instead of raising"""
+    class Res:
+        stdout, stderr, returncode = "log tail\n", "boom\n", 1
+
+    r = util._shell_result("LAUNCH:p2cs", Res(), {"attrs": {}}, 0.0, 0.0)
+    assert r["ok"] is False and r["returncode"] == 1 and r["stdout"] == "log tail\n" and "boom" in r["error"]
+    Res.returncode = 0
+    assert util._shell_result("LAUNCH:p2cs", Res(), {"attrs": {}}, 0.0, 0.0)["ok"] is True
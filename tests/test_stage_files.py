@@ -0,0 +1,82 @@
+"""remote_fns.stage_files: content-addressed writes with skip-if-present; secrets bypass the store"""
+from __future__ import annotations
+import hashlib, os, stat, sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+
+from remote_fns import stage_files  # noqa: E402
+
+CERT = "-----BEGIN CERTIFICATE-----\nMIIB\n-----END CERTIFICATE-----\n"
+SHA = hashlib.sha256(CERT.encode()).hexdigest()
+
+
+def mode(path) -> int:
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+
+def test_payload_is_stored_once_and_reused(tmp_path):
+    store = tmp_path / "store"
+    a, b = tmp_path / "s1" / "peer.crt", tmp_path / "trust" / f"{SHA}.crt"
+    r = stage_files([{"path": str(a), "sha256": SHA, "data": CERT},
+                     {"path": str(b), "sha256": SHA}], str(store))
+    assert [w["path"] for w in r["written"]] == [str(a), str(b)]
+    assert r["unchanged"] == [] and r["missing"] == [] and r["stored"] == [SHA]
+    assert a.read_text() == b.read_text() == CERT
+    assert mode(store) == 0o700 and mode(store / SHA) == 0o600
+    # A later session: the host serves the payload from its store, no data travels
+    c = tmp_path / "s2" / "peer.crt"
+    r = stage_files([{"path": str(c), "sha256": SHA, "mode": 0o640}], str(store))
+    assert r["written"] == [{"path": str(c), "bytes": len(CERT)}] and mode(c) == 0o640
+
+
+def test_file_with_its_content_is_left_alone(tmp_path):
+    store = tmp_path / "store"
+    dst = tmp_path / "peer.crt"
+    dst.write_text(CERT)
+    os.chmod(dst, 0o600)
+    before = os.stat(dst).st_ino
+    r = stage_files([{"path": str(dst), "sha256": SHA, "mode": 0o644}], str(store))
+    assert r["unchanged"] == [str(dst)] and r["written"] == [] and r["stored"] == [SHA]
+    assert os.stat(dst).st_ino == before and mode(dst) == 0o644  # not rewritten, only the mode fixed
+    assert (store / SHA).read_text() == CERT  # remembered for other paths
+
+
+def test_missing_payload_and_bad_digest(tmp_path):
+    dst = tmp_path / "peer.crt"
+    r = stage_files([{"path": str(dst), "sha256": SHA}], str(tmp_path / "store"))
+    assert r["missing"] == [SHA] and r["written"] == [] and not dst.exists()
+    with pytest.raises(ValueError, match="does not match"):
+        stage_files([{"path": str(dst), "sha256": SHA, "data": CERT + "x"}], str(tmp_path / "store"))
+
+
+def test_secret_is_written_in_place_and_never_stored(tmp_path):
+    store = tmp_path / "store"
+    secret = "psk-identity:0123456789abcdef"
+    leaked = hashlib.sha256(secret.encode()).hexdigest()
+    store.mkdir()
+    (store / leaked).write_text(secret)  # a copy an earlier version left in the store
+    psk = tmp_path / "certs" / "psk.secrets"
+    r = stage_files([{"path": str(psk), "data": secret, "mode": 0o600, "secret": True},
+                     {"path": str(tmp_path / "certs" / "peer.crt"), "sha256": SHA, "data": CERT}], str(store))
+    assert psk.read_text() == secret and mode(psk) == 0o600
+    assert r["stored"] == [SHA] and sorted(os.listdir(store)) == [SHA]
+    # Secrets are rewritten every time; skip-if-present is for public payloads only
+    r = stage_files([{"path": str(psk), "data": secret, "secret": True}], str(store))
+    assert r["written"] == [{"path": str(psk), "bytes": len(secret)}] and r["unchanged"] == []
+
+
+def test_controller_side_entries(monkeypatch):
+    """util._stage_entries: a known payload is not sent, a repeated one travels once, a secret always and unhashed"""
+    pytest.importorskip("globus_compute_sdk")
+    import util
+
+    monkeypatch.setattr(util, "_STAGED", {})
+    files = [{"path": "/s/peer.crt", "data": CERT}, {"path": "/trust/x.crt", "data": CERT},
+             {"path": "/s/psk.secrets", "data": "k", "mode": 0o600, "secret": True}]
+    e = util._stage_entries("ep", files, known=())
+    assert [x.get("data") for x in e] == [CERT, None, "k"]
+    assert "sha256" not in e[2] and e[2]["secret"]
+    e = util._stage_entries("ep", files, known=[SHA])
+    assert [x.get("data") for x in e] == [None, None, "k"]
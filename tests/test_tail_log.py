@@ -0,0 +1,56 @@
+"""remote_fns.tail_log: whole lines after an offset, bounded, resuming where the last call stopped"""
+from __future__ import annotations
+import os, sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+
+from remote_fns import tail_log  # noqa: E402
+
+
+def test_offsets_resume_and_hold_back_partial_lines(tmp_path):
+    log = tmp_path / "s2cs.log"
+    log.write_text("one\ntwo\nthr")
+    r = tail_log(str(log))
+    assert r["data"] == "one\ntwo\n" and r["offset"] == 8 and r["size"] == 11 and not r["more"]
+    with open(log, "a") as fh:
+        fh.write("ee\nfour\n")
+    r = tail_log(str(log), r["offset"])
+    assert r["data"] == "three\nfour\n" and r["offset"] == 19 and r["error"] is None
+    r = tail_log(str(log), r["offset"])
+    assert r["data"] == "" and r["offset"] == 19
+
+
+def test_max_bytes_pages_through_the_log(tmp_path):
+    log = tmp_path / "s2uc.log"
+    log.write_text("".join(f"line {i}\n" for i in range(10)))  # 7 bytes per line
+    r = tail_log(str(log), 0, max_bytes=20)
+    assert r["data"] == "line 0\nline 1\n" and r["more"]
+    seen = r["data"]
+    while r["more"]:
+        r = tail_log(str(log), r["offset"], max_bytes=20)
+        seen += r["data"]
+    assert seen == log.read_text()
+
+
+def test_overlong_line_is_cut_rather_than_stalling(tmp_path):
+    log = tmp_path / "x.log"
+    log.write_text("x" * 50 + "\n")
+    r = tail_log(str(log), 0, max_bytes=16)
+    assert r["data"] == "x" * 16 and r["offset"] == 16
+
+
+def test_negative_offset_reads_recent_whole_lines(tmp_path):
+    log = tmp_path / "x.log"
+    log.write_text("".join(f"line {i}\n" for i in range(10)))
+    r = tail_log(str(log), -1, max_bytes=20)
+    assert r["data"] == "line 8\nline 9\n" and r["offset"] == 70
+    assert r["skipped"] == 56
+
+
+def test_truncated_or_missing_log(tmp_path):
+    log = tmp_path / "x.log"
+    log.write_text("new\n")
+    r = tail_log(str(log), 500)  # file replaced by a shorter one: start over
+    assert r["data"] == "new\n" and r["offset"] == 4
+    r = tail_log(str(tmp_path / "gone.log"), 12)
+    assert r["data"] == "" and r["offset"] == 12 and r["size"] is None and r["error"]
@@ -0,0 +1,69 @@
+"""TelemetryCollector summaries: connections attributed to streams, rates, stalls and slow connections"""
+from __future__ import annotations
+import argparse, os, sys, time
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+pytest.importorskip("globus_compute_sdk")
+
+import telemetry  # noqa: E402
+
+
+def collector() -> telemetry.TelemetryCollector:
+    """Stream 'a': producer ports 6000/6001, inbound listen ports 5074/5075, consumer ports 5100/5101"""
+    sargs = argparse.Namespace(inbound_src_ports=[6000, 6001], outbound_dst_ports=[5100, 5101])
+    ctl = SimpleNamespace(streams={"a": {"name": "a", "args": sargs, "listen_ports": ["5074", "5075"]}})
+    return telemetry.TelemetryCollector(ctl, interval=1.0, batch_s=5.0, history=50, stall_s=3.0, slow_ratio=0.5)
+
+
+def feed(c: telemetry.TelemetryCollector, role: str, rows_at) -> None:
+    """rows_at(i) -> rows for sample i of 6, one second apart, ending now"""
+    now = time.time()
+    with c._lock:
+        c._ingest(role, [(now - 5 + i, rows_at(i)) for i in range(6)])
+
+
+def test_stream_attribution_and_rates():
+    c = collector()
+    # local, peer, recv_q, send_q, bytes_out, bytes_in, retrans, rtt
+    feed(c, "c2cs", lambda i: [["10.0.0.2:5100", "10.0.0.9:40000", 0, 0, i * 1_000_000, 0, 2 + i, 0.5],
+                               ["10.0.0.2:7777", "10.0.0.9:40001", 0, 0, 0, 0, 0, 0.5]])
+    feed(c, "p2cs", lambda i: [["10.0.0.1:5074", "10.0.0.8:6000", 0, 0, 0, i * 500_000, 0, 0.3]])
+    s = c.summary()
+    a = s["streams"]["a"]
+    assert a["bps"] == pytest.approx(8e6)  # the consumer side's delivered rate, bits/s
+    by_role = {x["role"]: x for x in a["connections"]}
+    assert by_role["c2cs"]["bps_p50"] == pytest.approx(8e6) and by_role["c2cs"]["retransmits"] == 5
+    assert by_role["p2cs"]["bps"] == pytest.approx(4e6)
+    assert [u["local"] for u in s["unassigned"]] == ["10.0.0.2:7777"]
+    assert c.summary("a")["unassigned"] == []
+
+
+def test_stalled_and_slow_connections():
+    c = collector()
+
+    def rows(i):
+        return [["10.0.0.2:5100", "10.0.0.9:40000", 0, 0, i * 1_000_000, 0, 0, 1.0],
+                ["10.0.0.2:5101", "10.0.0.9:40001", 0, 0, i * 100_000, 0, 0, 1.0],
+                # queued data, counters frozen after the first second
+                ["10.0.0.2:5101", "10.0.0.9:40002", 0, 4096, min(i, 1) * 1_000_000, 0, 0, 1.0]]
+
+    feed(c, "c2cs", rows)
+    conns = {x["peer"]: x for x in c.summary()["streams"]["a"]["connections"]}
+    fast, slow, stuck = conns["10.0.0.9:40000"], conns["10.0.0.9:40001"], conns["10.0.0.9:40002"]
+    assert not fast["slow"] and slow["slow"] and stuck["slow"]
+    assert stuck["stalled"] and stuck["stalled_s"] == pytest.approx(4.0)
+    assert not fast["stalled"] and not slow["stalled"]
+    st = c.summary()["streams"]["a"]
+    assert st["stalled"] == 1 and st["slow"] == 2
+    assert "STALLED" in telemetry.format_summary(c.summary())
+
+
+def test_ring_buffer_is_bounded():
+    c = collector()
+    for _ in range(20):
+        feed(c, "c2cs", lambda i: [["10.0.0.2:5100", "10.0.0.9:40000", 0, 0, i, 0, 0, 1.0]])
+    (conn,) = c._conns.values()
+    assert len(conn["samples"]) == c.history